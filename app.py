@@ -1,39 +1,399 @@
 
-from flask import Flask, request, send_from_directory, jsonify, send_file, session, redirect, url_for
+from flask import (Flask, Response, request, jsonify, send_file, session, g, has_request_context,
+                   stream_with_context)
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSession, SessionInterface
 from flask_sqlalchemy import SQLAlchemy
-from flask_mail import Mail, Message
 import os
+import atexit
+import threading
+import collections
+import random
+import time
+import smtplib
+import sqlite3
+import re
 import json
+import csv
+import io
+import base64
 import datetime
 import hashlib
 import secrets
+import tempfile
+import zipfile
+import functools
+import cProfile
+import gzip
+import mimetypes
+try:
+    import fcntl
+except ImportError:  # Windows: chunks are only guarded by upload_chunk's conditional UPDATE
+    fcntl = None
+from concurrent.futures import ThreadPoolExecutor
+import urllib.parse
+import click
+from sqlalchemy import event, inspect, text, table, column
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session, joinedload, load_only, object_session
+from werkzeug.exceptions import HTTPException
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from werkzeug.http import is_resource_modified
+from werkzeug.wsgi import wrap_file
 from dotenv import load_dotenv
 
-load_dotenv()
+try:
+    import brotli
+except ImportError:  # Optional: without it only gzip variants are built
+    brotli = None
+
+import pdfworker
+import storage
 
 app = Flask(__name__)
-app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-change-this')
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///edulibrary.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = 'uploads'
-app.config['MAX_CONTENT_LENGTH'] = 20 * 1024 * 1024  # 20MB max file size
-
-# Email configuration
-app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
-app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
-app.config['MAIL_USE_TLS'] = True
-app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME', '')
-app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD', '')
-app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER', 'noreply@edulibrary.com')
-
-db = SQLAlchemy(app)
-mail = Mail(app)
-
-# Create upload directory
-if not os.path.exists(app.config['UPLOAD_FOLDER']):
-    os.makedirs(app.config['UPLOAD_FOLDER'])
+
+def load_config(config=None):
+    """Read settings from .env and the environment; `config` overrides them"""
+    load_dotenv()
+    app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-change-this')
+    database_url = os.getenv('DATABASE_URL', 'sqlite:///edulibrary.db')
+    if database_url.startswith('postgres://'):  # Heroku-style URLs
+        database_url = 'postgresql://' + database_url[len('postgres://'):]
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if not database_url.startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+            'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+            'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', 30)),
+            'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', 1800)),
+            'pool_pre_ping': True
+        }
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    # 'cookie' keeps sessions in the signed cookie; 'filesystem' and 'sqlite'
+    # keep them server-side so logout, deactivation and password changes
+    # revoke them immediately.
+    app.config['SESSION_BACKEND'] = os.getenv('SESSION_BACKEND', 'cookie')
+    app.config['SESSION_FOLDER'] = os.getenv('SESSION_FOLDER', 'sessions')
+    app.config['SESSION_SQLITE_PATH'] = os.getenv('SESSION_SQLITE_PATH', 'sessions.db')
+    # Per-process cache of the user fields the auth decorators need
+    app.config['USER_CACHE_SIZE'] = int(os.getenv('USER_CACHE_SIZE', 1024))
+    app.config['USER_CACHE_TTL'] = float(os.getenv('USER_CACHE_TTL', 60))
+    app.config['UPLOAD_FOLDER'] = 'uploads'
+    app.config['MAX_CONTENT_LENGTH'] = 20 * 1024 * 1024  # 20MB max file size
+    app.config['BLOB_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], 'blobs')
+    app.config['UPLOAD_TMP_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], 'tmp')
+    app.config['THUMBNAIL_FOLDER'] = os.path.join(app.config['UPLOAD_FOLDER'], 'thumbnails')
+    # Where PDFs and thumbnails are kept: 'local' (UPLOAD_FOLDER, one node) or
+    # 's3' (any S3-compatible store, e.g. MinIO via S3_ENDPOINT_URL). With
+    # 's3' each node keeps a read-through LRU cache of up to
+    # STORAGE_CACHE_MAX_BYTES in STORAGE_CACHE_FOLDER.
+    app.config['STORAGE_BACKEND'] = os.getenv('STORAGE_BACKEND', 'local')
+    app.config['S3_BUCKET'] = os.getenv('S3_BUCKET')
+    app.config['S3_PREFIX'] = os.getenv('S3_PREFIX', '')
+    app.config['S3_ENDPOINT_URL'] = os.getenv('S3_ENDPOINT_URL')
+    app.config['S3_REGION'] = os.getenv('S3_REGION')
+    app.config['STORAGE_CACHE_FOLDER'] = os.getenv('STORAGE_CACHE_FOLDER', 'storage-cache')
+    app.config['STORAGE_CACHE_MAX_BYTES'] = int(os.getenv('STORAGE_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+    # Worker processes for thumbnails, page counts and text extraction (0 = off)
+    app.config['PDF_PROCESSING_WORKERS'] = int(os.getenv('PDF_PROCESSING_WORKERS', 2))
+    # Recompress and linearize new uploads in the same pool (needs pikepdf). Images
+    # are downsampled only when PDF_OPTIMIZE_IMAGE_DPI is set, since that is lossy.
+    app.config['PDF_OPTIMIZE'] = os.getenv('PDF_OPTIMIZE', 'false').lower() == 'true'
+    app.config['PDF_OPTIMIZE_IMAGE_DPI'] = int(os.getenv('PDF_OPTIMIZE_IMAGE_DPI', 0))
+    app.config['PDF_OPTIMIZE_MIN_SAVING'] = float(os.getenv('PDF_OPTIMIZE_MIN_SAVING', 0.02))  # Fraction of the original
+    app.config['UPLOAD_CHUNK_SIZE'] = 64 * 1024
+    app.config['MAX_UPLOAD_FILE_SIZE'] = app.config['MAX_CONTENT_LENGTH']  # Per file in batch uploads
+    app.config['MAX_BATCH_UPLOAD_LENGTH'] = int(os.getenv('MAX_BATCH_UPLOAD_LENGTH', 500 * 1024 * 1024))
+    app.config['MAX_BATCH_FILES'] = int(os.getenv('MAX_BATCH_FILES', 200))
+    app.config['MAX_BUNDLE_FILES'] = int(os.getenv('MAX_BUNDLE_FILES', 500))  # Per /download/bundle archive
+    app.config['UPLOAD_BATCH_WORKERS'] = int(os.getenv('UPLOAD_BATCH_WORKERS', 4))
+    # Resumable uploads arrive as PUT chunks (each under MAX_CONTENT_LENGTH);
+    # sessions idle for longer than RESUMABLE_UPLOAD_TTL seconds are discarded.
+    app.config['MAX_RESUMABLE_UPLOAD_SIZE'] = int(os.getenv('MAX_RESUMABLE_UPLOAD_SIZE', 2 * 1024 * 1024 * 1024))
+    app.config['RESUMABLE_CHUNK_SIZE'] = 8 * 1024 * 1024
+    app.config['RESUMABLE_UPLOAD_TTL'] = int(os.getenv('RESUMABLE_UPLOAD_TTL', 24 * 3600))
+    # Lifetime of content-addressed (fingerprinted) URLs, cached as immutable
+    app.config['FILE_CACHE_MAX_AGE'] = int(os.getenv('FILE_CACHE_MAX_AGE', 365 * 24 * 3600))
+    app.config['MAX_BYTE_RANGES'] = 16  # Larger multi-range requests get the whole file
+    # How PDF bytes leave the server: 'direct' streams them from this process,
+    # 'x-sendfile' (Apache/lighttpd) and 'x-accel-redirect' (nginx) hand the
+    # transfer to the front-end after auth and counting. For nginx, map the
+    # prefix to UPLOAD_FOLDER (STORAGE_CACHE_FOLDER with the 's3' backend)
+    # with an `internal` location.
+    app.config['FILE_SERVING_MODE'] = os.getenv('FILE_SERVING_MODE', 'direct')
+    app.config['X_ACCEL_REDIRECT_PREFIX'] = os.getenv('X_ACCEL_REDIRECT_PREFIX', '/protected-uploads/')
+    # Front-end files served by AssetPipeline. JS/CSS get fingerprinted URLs
+    # (/assets/<name>.<hash>.<ext>); HTML pages are revalidated with ETags.
+    app.config['ASSET_FOLDER'] = app.root_path
+    app.config['ASSET_FILES'] = ['index.html', 'script.js', 'style.css']
+    app.config['ASSET_MIN_COMPRESS_SIZE'] = 1024  # Smaller files are only served as-is
+    app.config['FILES_PAGE_SIZE'] = int(os.getenv('FILES_PAGE_SIZE', 50))
+    app.config['FILES_MAX_PAGE_SIZE'] = int(os.getenv('FILES_MAX_PAGE_SIZE', 200))
+    # Admin user and ticket listings; exports stream whole tables EXPORT_BATCH_SIZE rows at a time
+    app.config['ADMIN_PAGE_SIZE'] = int(os.getenv('ADMIN_PAGE_SIZE', 50))
+    app.config['ADMIN_MAX_PAGE_SIZE'] = int(os.getenv('ADMIN_MAX_PAGE_SIZE', 500))
+    app.config['EXPORT_BATCH_SIZE'] = int(os.getenv('EXPORT_BATCH_SIZE', 1000))
+    app.config['MAX_BULK_IDS'] = int(os.getenv('MAX_BULK_IDS', 1000))  # Per bulk admin request
+    # /files responses are cached as serialized JSON until an upload, delete or
+    # edit bumps the catalog generation. Other processes notice a bump within
+    # FILES_CACHE_GENERATION_CHECK seconds; download counts in cached pages can
+    # lag by up to FILES_CACHE_TTL seconds. FILES_CACHE_MAX_BYTES = 0 disables it.
+    app.config['FILES_CACHE_MAX_BYTES'] = int(os.getenv('FILES_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    app.config['FILES_CACHE_TTL'] = float(os.getenv('FILES_CACHE_TTL', 30))
+    app.config['FILES_CACHE_GENERATION_CHECK'] = float(os.getenv('FILES_CACHE_GENERATION_CHECK', 1))
+    # Download counters are buffered in memory and written in one transaction
+    # every DOWNLOAD_FLUSH_INTERVAL seconds (0 = write on every download) or once
+    # DOWNLOAD_FLUSH_THRESHOLD downloads are pending, whichever comes first.
+    app.config['DOWNLOAD_FLUSH_INTERVAL'] = float(os.getenv('DOWNLOAD_FLUSH_INTERVAL', 5))
+    app.config['DOWNLOAD_FLUSH_THRESHOLD'] = int(os.getenv('DOWNLOAD_FLUSH_THRESHOLD', 500))
+    app.config['ANALYTICS_CACHE_TTL'] = float(os.getenv('ANALYTICS_CACHE_TTL', 30))
+    # Downloads are also logged per file and hour, compacted to days after
+    # TRENDING_HOURLY_RETENTION hours and dropped after TRENDING_WINDOW_DAYS.
+    # Every RANKING_REFRESH_INTERVAL seconds one process recomputes the
+    # decayed scores behind /files?sort=trending (0 = only via the CLI).
+    app.config['TRENDING_HALF_LIFE_HOURS'] = float(os.getenv('TRENDING_HALF_LIFE_HOURS', 48))
+    app.config['TRENDING_WINDOW_DAYS'] = int(os.getenv('TRENDING_WINDOW_DAYS', 30))
+    app.config['TRENDING_HOURLY_RETENTION'] = int(os.getenv('TRENDING_HOURLY_RETENTION', 48))
+    app.config['RANKING_REFRESH_INTERVAL'] = float(os.getenv('RANKING_REFRESH_INTERVAL', 300))
+    app.config['SEARCH_INDEX_MAX_PAGES'] = int(os.getenv('SEARCH_INDEX_MAX_PAGES', 50))
+    app.config['SEARCH_INDEX_AVAILABLE'] = None  # Looked up on first use, see search_index_available()
+
+    # Email configuration
+    app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
+    app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
+    app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'true').lower() == 'true'
+    app.config['MAIL_USERNAME'] = os.getenv('MAIL_USERNAME', '')
+    app.config['MAIL_PASSWORD'] = os.getenv('MAIL_PASSWORD', '')
+    app.config['MAIL_DEFAULT_SENDER'] = os.getenv('MAIL_DEFAULT_SENDER', 'noreply@edulibrary.com')
+    # Outbound mail is queued in the outbound_email table and delivered by a
+    # background thread that reuses one SMTP connection per batch.
+    app.config['MAIL_QUEUE_POLL_INTERVAL'] = float(os.getenv('MAIL_QUEUE_POLL_INTERVAL', 10))
+    app.config['MAIL_QUEUE_BATCH_SIZE'] = int(os.getenv('MAIL_QUEUE_BATCH_SIZE', 50))
+    app.config['MAIL_MAX_ATTEMPTS'] = int(os.getenv('MAIL_MAX_ATTEMPTS', 6))
+    app.config['MAIL_RETRY_DELAY'] = float(os.getenv('MAIL_RETRY_DELAY', 30))  # Doubles per attempt
+    app.config['MAIL_SEND_LEASE'] = 300  # Seconds before an unfinished 'sending' row is retried
+    app.config['MAX_BULK_INVITES'] = int(os.getenv('MAX_BULK_INVITES', 500))
+
+    # Instrumentation: per-process metrics served at /metrics in Prometheus text
+    # format (Bearer METRICS_TOKEN required when set, otherwise only served to
+    # direct requests from localhost). With PROFILE_SLOW_REQUEST_MS > 0, a
+    # PROFILE_SAMPLE_RATE share of requests runs under cProfile and those
+    # slower than the threshold are dumped to PROFILE_FOLDER.
+    app.config['METRICS_ENABLED'] = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    app.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN', '')
+    app.config['PROFILE_SLOW_REQUEST_MS'] = float(os.getenv('PROFILE_SLOW_REQUEST_MS', 0))
+    app.config['PROFILE_SAMPLE_RATE'] = float(os.getenv('PROFILE_SAMPLE_RATE', 0.05))
+    app.config['PROFILE_FOLDER'] = os.getenv('PROFILE_FOLDER', 'profiles')
+    if config:
+        app.config.update(config)
+
+@event.listens_for(Engine, 'connect')
+def configure_sqlite(dbapi_connection, connection_record):
+    """WAL lets readers proceed during writes; NORMAL sync is safe with WAL"""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f"PRAGMA busy_timeout={app.config['SQLITE_BUSY_TIMEOUT_MS']}")
+        cursor.close()
+
+db = SQLAlchemy()
+
+# Instrumentation
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+class Counter:
+    kind = 'counter'
+    
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values = collections.defaultdict(float)
+    
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+    
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+class Gauge:
+    """Reads its value from `fn` at scrape time"""
+    kind = 'gauge'
+    
+    def __init__(self, name, help, fn):
+        self.name = name
+        self.help = help
+        self.fn = fn
+    
+    def samples(self):
+        yield self.name, '', self.fn()
+
+class Histogram:
+    kind = 'histogram'
+    
+    def __init__(self, name, help, buckets, labelnames=()):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values = {}  # labels -> [bucket counts..., count, sum]
+    
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-2] += 1
+            entry[-1] += value
+    
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(entry)) for key, entry in self._values.items())
+        for key, entry in items:
+            for bound, count in zip(self.buckets, entry):
+                yield f'{self.name}_bucket', _format_labels(self.labelnames, key, [('le', bound)]), count
+            yield f'{self.name}_bucket', _format_labels(self.labelnames, key, [('le', '+Inf')]), entry[-2]
+            yield f'{self.name}_count', _format_labels(self.labelnames, key), entry[-2]
+            yield f'{self.name}_sum', _format_labels(self.labelnames, key), entry[-1]
+
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+    
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+    
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{labels} {value:g}' if isinstance(value, float) else f'{name}{labels} {value}')
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+REQUEST_DURATION = metrics.register(Histogram(
+    'http_request_duration_seconds', 'Time to produce a response, by endpoint',
+    LATENCY_BUCKETS, ('endpoint', 'method')
+))
+REQUESTS = metrics.register(Counter(
+    'http_requests_total', 'Responses sent, by endpoint and status code', ('endpoint', 'method', 'status')
+))
+RESPONSE_BYTES = metrics.register(Counter(
+    'http_response_bytes_total', 'Bytes in responses with a known length, by endpoint', ('endpoint',)
+))
+REQUEST_QUERIES = metrics.register(Histogram(
+    'http_request_db_queries', 'SQL statements executed per request, by endpoint',
+    QUERY_COUNT_BUCKETS, ('endpoint',)
+))
+REQUEST_DB_TIME = metrics.register(Counter(
+    'http_request_db_seconds_total', 'Time spent in SQL statements during requests, by endpoint', ('endpoint',)
+))
+DB_QUERY_DURATION = metrics.register(Histogram(
+    'db_query_duration_seconds', 'Duration of every SQL statement, in or out of requests', LATENCY_BUCKETS
+))
+EMAIL_SEND_DURATION = metrics.register(Histogram(
+    'email_send_duration_seconds', 'Time to hand one message to the SMTP server', LATENCY_BUCKETS, ('result',)
+))
+PROFILES_WRITTEN = metrics.register(Counter(
+    'profiles_written_total', 'cProfile dumps written for slow requests'
+))
+
+def _endpoint_label():
+    # Route names, not URLs, so ids in paths don't create new series
+    return request.endpoint or 'unmatched'
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    DB_QUERY_DURATION.observe(elapsed)
+    if has_request_context() and 'metrics_queries' in g:
+        g.metrics_queries += 1
+        g.metrics_db_time += elapsed
+
+_profiler_lock = threading.Lock()  # cProfile can only trace one request at a time
+
+@app.before_request
+def start_request_metrics():
+    if not app.config['METRICS_ENABLED']:
+        return
+    g.metrics_queries = 0
+    g.metrics_db_time = 0.0
+    g.metrics_profiler = None
+    if (app.config['PROFILE_SLOW_REQUEST_MS'] > 0
+            and random.random() < app.config['PROFILE_SAMPLE_RATE']
+            and _profiler_lock.acquire(blocking=False)):
+        g.metrics_profiler = cProfile.Profile()
+        try:
+            g.metrics_profiler.enable()
+        except ValueError:  # Another profiler is already active
+            g.metrics_profiler = None
+            _profiler_lock.release()
+    g.metrics_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    if 'metrics_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.pop('metrics_started')
+    endpoint = _endpoint_label()
+    REQUEST_DURATION.observe(elapsed, endpoint=endpoint, method=request.method)
+    REQUESTS.inc(endpoint=endpoint, method=request.method, status=response.status_code)
+    if response.content_length is not None:
+        RESPONSE_BYTES.inc(response.content_length, endpoint=endpoint)
+    REQUEST_QUERIES.observe(g.metrics_queries, endpoint=endpoint)
+    REQUEST_DB_TIME.inc(g.metrics_db_time, endpoint=endpoint)
+    profiler = g.pop('metrics_profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profiler_lock.release()
+        if elapsed * 1000 >= app.config['PROFILE_SLOW_REQUEST_MS']:
+            dump_profile(profiler, endpoint, elapsed)
+    return response
+
+def dump_profile(profiler, endpoint, elapsed):
+    try:
+        os.makedirs(app.config['PROFILE_FOLDER'], exist_ok=True)
+        timestamp = datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+        path = os.path.join(app.config['PROFILE_FOLDER'], f'{timestamp}-{endpoint}-{elapsed * 1000:.0f}ms.prof')
+        profiler.dump_stats(path)
+        PROFILES_WRITTEN.inc()
+        app.logger.warning('Slow request to %s took %.0fms; profile written to %s', endpoint, elapsed * 1000, path)
+    except OSError as e:
+        app.logger.error('Could not write profile for %s: %s', endpoint, e)
 
 CATEGORIES = [
     'Educational', 'Religious', 'Medical', 'Literature', 
@@ -42,6 +402,10 @@ CATEGORIES = [
 
 # Database Models
 class User(db.Model):
+    __table_args__ = (
+        db.Index('ix_user_join_date', 'join_date'),
+        db.Index('ix_user_active_join_date', 'is_active', 'join_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -73,6 +437,15 @@ class User(db.Model):
         }
 
 class File(db.Model):
+    # Cover the filters and the (upload_date, id) keyset order used by /files
+    __table_args__ = (
+        db.Index('ix_file_upload_date_id', 'upload_date', 'id'),
+        db.Index('ix_file_category_upload_date', 'category', 'upload_date', 'id'),
+        db.Index('ix_file_featured_upload_date', 'is_featured', 'upload_date', 'id'),
+        db.Index('ix_file_user_id', 'user_id'),
+        db.Index('ix_file_download_count', 'download_count', 'id'),
+        db.Index('ix_file_category_download_count', 'category', 'download_count', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(255), nullable=False)
     original_name = db.Column(db.String(255), nullable=False)
@@ -85,24 +458,62 @@ class File(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     is_featured = db.Column(db.Boolean, default=False)
     tags = db.Column(db.String(500))  # Comma-separated tags
+    content_hash = db.Column(db.String(64), index=True)  # Blob.digest, NULL for legacy uploads
+    size_bytes = db.Column(db.BigInteger)
+    # Filled in by the background PdfProcessor
+    processing_status = db.Column(db.String(20), default='pending')  # pending, done, failed
+    processed_at = db.Column(db.DateTime)
+    page_count = db.Column(db.Integer)
+    pdf_title = db.Column(db.String(500))
+    pdf_author = db.Column(db.String(255))
+    has_thumbnail = db.Column(db.Boolean, default=False)
 
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'filename': self.filename,
-            'original_name': self.original_name,
-            'size_mb': self.size_mb,
-            'category': self.category,
-            'description': self.description,
-            'upload_date': self.upload_date.isoformat(),
-            'download_count': self.download_count,
-            'uploaded_by': self.uploader.username,
-            'uploader_id': self.user_id,
-            'is_featured': self.is_featured,
-            'tags': self.tags.split(',') if self.tags else []
-        }
+    def to_dict(self, fields=None):
+        return {name: FILE_FIELDS[name](self) for name in (fields or FILE_FIELDS)}
+
+# Serializers for File.to_dict(), in output order. Callers may request a subset
+# via `fields`; FILE_FIELD_COLUMNS lists the columns each field needs so the
+# listing query can skip loading the rest (e.g. large descriptions).
+FILE_FIELDS = {
+    'id': lambda f: f.id,
+    'filename': lambda f: f.filename,
+    'original_name': lambda f: f.original_name,
+    'size_mb': lambda f: f.size_mb,
+    'category': lambda f: f.category,
+    'description': lambda f: f.description,
+    'upload_date': lambda f: f.upload_date.isoformat(),
+    'download_count': lambda f: f.download_count,
+    'uploaded_by': lambda f: f.uploader.username,
+    'uploader_id': lambda f: f.user_id,
+    'is_featured': lambda f: f.is_featured,
+    'tags': lambda f: f.tags.split(',') if f.tags else [],
+    'page_count': lambda f: f.page_count,
+    'thumbnail': lambda f: f'/thumbnail/{f.id}' if f.has_thumbnail else None
+}
+
+FILE_FIELD_COLUMNS = {
+    'id': 'id',
+    'filename': 'filename',
+    'original_name': 'original_name',
+    'size_mb': 'size_mb',
+    'category': 'category',
+    'description': 'description',
+    'upload_date': 'upload_date',
+    'download_count': 'download_count',
+    'uploaded_by': 'user_id',
+    'uploader_id': 'user_id',
+    'is_featured': 'is_featured',
+    'tags': 'tags',
+    'page_count': 'page_count',
+    'thumbnail': 'has_thumbnail'
+}
 
 class SupportTicket(db.Model):
+    __table_args__ = (
+        db.Index('ix_support_ticket_user_created', 'user_id', 'created_date'),
+        db.Index('ix_support_ticket_created', 'created_date'),
+        db.Index('ix_support_ticket_status_created', 'status', 'created_date'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=False)
@@ -126,7 +537,48 @@ class SupportTicket(db.Model):
             'admin_response': self.admin_response
         }
 
+class Blob(db.Model):
+    """Content-addressed PDF bytes, shared by every File with the same SHA-256"""
+    digest = db.Column(db.String(64), primary_key=True)
+    size_bytes = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    # Set by PdfProcessor.submit_optimization; NULL until the blob has been tried
+    optimize_status = db.Column(db.String(20))  # done (copy kept), skipped (not smaller), failed
+    optimized_size_bytes = db.Column(db.BigInteger)
+    optimized_at = db.Column(db.DateTime)
+
+class UploadSession(db.Model):
+    """Resumable upload in progress; its bytes accumulate in UPLOAD_TMP_FOLDER"""
+    __tablename__ = 'upload_session'
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    original_name = db.Column(db.String(255), nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    description = db.Column(db.Text)
+    tags = db.Column(db.String(500))
+    total_size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    @property
+    def part_path(self):
+        return os.path.join(app.config['UPLOAD_TMP_FOLDER'], f'{self.id}.upload')
+
+    def to_dict(self):
+        return {
+            'upload_id': self.id,
+            'offset': self.received,
+            'size': self.total_size,
+            'chunk_size': app.config['RESUMABLE_CHUNK_SIZE'],
+            'expires_at': self.expires_at.isoformat()
+        }
+
 class Invitation(db.Model):
+    __table_args__ = (
+        db.Index('ix_invitation_code_used', 'invite_code', 'used'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), nullable=False)
     invite_code = db.Column(db.String(32), unique=True, nullable=False)
@@ -136,42 +588,1826 @@ class Invitation(db.Model):
     used = db.Column(db.Boolean, default=False)
     used_at = db.Column(db.DateTime)
 
+# Full-text search index
+# SQLite FTS5 table keyed by File.id (rowid). Name, description and tags are
+# kept in sync by the mapper events below; extracted PDF text goes into the
+# `content` column via set_search_content().
+SEARCH_INDEX_TABLE = 'file_fts'
+SEARCH_INDEX_COLUMNS = ('original_name', 'description', 'tags')
+search_index = table(SEARCH_INDEX_TABLE, column('rowid'), column('rank'))
+
+def ensure_search_index():
+    """Create the FTS5 table if the database supports it"""
+    if db.engine.dialect.name != 'sqlite':
+        return False
+    try:
+        exists = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': SEARCH_INDEX_TABLE}
+        ).first()
+        if not exists:
+            db.session.execute(text(
+                f"CREATE VIRTUAL TABLE {SEARCH_INDEX_TABLE} USING fts5("
+                "original_name, description, tags, content, "
+                "tokenize = 'porter unicode61 remove_diacritics 2')"
+            ))
+            # Rank title and tag matches above body text matches
+            db.session.execute(text(
+                f"INSERT INTO {SEARCH_INDEX_TABLE}({SEARCH_INDEX_TABLE}, rank) "
+                "VALUES ('rank', 'bm25(10.0, 4.0, 6.0, 1.0)')"
+            ))
+            # Index files uploaded before the table existed (as _search_row()
+            # would); their PDF text comes from `flask rebuild-search-index`
+            db.session.execute(text(
+                f"INSERT INTO {SEARCH_INDEX_TABLE}(rowid, original_name, description, tags, content) "
+                "SELECT id, COALESCE(original_name, ''), COALESCE(description, ''), "
+                "REPLACE(COALESCE(tags, ''), ',', ' '), '' FROM file"
+            ))
+        db.session.commit()
+        return True
+    except OperationalError as e:
+        db.session.rollback()
+        app.logger.warning('Full-text search unavailable, falling back to LIKE: %s', e)
+        return False
+
+def search_index_available(connection=None):
+    """Whether the FTS5 table exists; looked up once per process"""
+    available = app.config['SEARCH_INDEX_AVAILABLE']
+    if available is None:
+        if db.engine.dialect.name != 'sqlite':
+            available = False
+        else:
+            available = (connection or db.session).execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {'name': SEARCH_INDEX_TABLE}
+            ).first() is not None
+        app.config['SEARCH_INDEX_AVAILABLE'] = available
+    return available
+
+def _search_row(file_record):
+    return {
+        'rowid': file_record.id,
+        'original_name': file_record.original_name or '',
+        'description': file_record.description or '',
+        'tags': (file_record.tags or '').replace(',', ' ')
+    }
+
+@event.listens_for(File, 'after_insert')
+def _index_inserted_file(mapper, connection, target):
+    if search_index_available(connection):
+        connection.execute(text(
+            f"INSERT INTO {SEARCH_INDEX_TABLE}(rowid, original_name, description, tags, content) "
+            "VALUES (:rowid, :original_name, :description, :tags, '')"
+        ), _search_row(target))
+
+@event.listens_for(File, 'after_update')
+def _index_updated_file(mapper, connection, target):
+    if not search_index_available(connection):
+        return
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in SEARCH_INDEX_COLUMNS):
+        connection.execute(text(
+            f"UPDATE {SEARCH_INDEX_TABLE} SET original_name = :original_name, "
+            "description = :description, tags = :tags WHERE rowid = :rowid"
+        ), _search_row(target))
+
+@event.listens_for(File, 'after_delete')
+def _unindex_deleted_file(mapper, connection, target):
+    if search_index_available(connection):
+        connection.execute(
+            text(f"DELETE FROM {SEARCH_INDEX_TABLE} WHERE rowid = :rowid"),
+            {'rowid': target.id}
+        )
+
+def set_search_content(file_id, content):
+    """Store extracted PDF text for a file in the search index"""
+    if search_index_available():
+        db.session.execute(
+            text(f"UPDATE {SEARCH_INDEX_TABLE} SET content = :content WHERE rowid = :rowid"),
+            {'content': content or '', 'rowid': file_id}
+        )
+
+def build_search_query(search):
+    """Turn free-form user input into an FTS5 prefix query"""
+    tokens = re.findall(r'\w+', search)
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+def with_uploader():
+    """Loader option that fetches File.uploader in the same query"""
+    return joinedload(File.uploader).load_only(User.id, User.username)
+
+def encode_cursor(values):
+    """Pack keyset values into an opaque, URL-safe pagination cursor"""
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+class InvalidCursor(ValueError):
+    """A pagination cursor that doesn't decode; reported without details"""
+    
+    def __init__(self):
+        super().__init__('Invalid cursor')
+
+def decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except ValueError:  # Bad base64, UTF-8 or JSON
+        raise InvalidCursor()
+    if not isinstance(values, list):
+        raise InvalidCursor()
+    return values
+
+def parse_limit(value, default, maximum):
+    try:
+        limit = int(value) if value else default
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    return max(1, min(limit, maximum))
+
+def parse_page_args(args, default, maximum):
+    """(limit, decoded cursor or None) from a listing's query string"""
+    limit = parse_limit(args.get('limit'), default, maximum)
+    return limit, decode_cursor(args['cursor']) if args.get('cursor') else None
+
+def newest_first_page(query, date_column, id_column, limit, cursor):
+    """One page of `query` ordered by (date_column, id_column) descending.
+
+    Returns (rows, next_cursor); raises ValueError for a malformed cursor.
+    """
+    if cursor:
+        try:
+            last_date = datetime.datetime.fromisoformat(cursor[0])
+            last_id = int(cursor[1])
+        except (ValueError, TypeError, IndexError):
+            raise InvalidCursor()
+        query = query.filter(
+            (date_column < last_date) | ((date_column == last_date) & (id_column < last_id))
+        )
+    rows = query.order_by(date_column.desc(), id_column.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor([getattr(rows[-1], date_column.key).isoformat(), rows[-1].id])
+    return rows, next_cursor
+
+def parse_file_fields(value):
+    """Validate a comma-separated `fields=` projection, None means all fields"""
+    if not value:
+        return None
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in FILE_FIELDS]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    return fields
+
+def _resolve_ranges(file_size):
+    """Return the (start, stop) spans the request's Range header asks for.
+
+    None means serve the whole file (no usable Range header, or an If-Range
+    validator that no longer matches); an empty list means unsatisfiable.
+    """
+    range_header = request.range
+    if range_header is None or range_header.units != 'bytes':
+        return None
+    spans = []
+    for start, stop in range_header.ranges:
+        if start < 0:  # Suffix range: the last -start bytes
+            start, stop = max(file_size + start, 0), file_size
+        else:
+            stop = file_size if stop is None else min(stop, file_size)
+        if start < stop:
+            spans.append((start, stop))
+    # Coalesce overlapping or adjacent spans, as RFC 9110 recommends
+    merged = []
+    for start, stop in sorted(spans):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(stop, merged[-1][1]))
+        else:
+            merged.append((start, stop))
+    if len(merged) > app.config['MAX_BYTE_RANGES']:
+        return None
+    return merged
+
+def _read_spans(f, spans, boundary=None, file_size=None):
+    """Yield the bytes of each span of the open file f (closed when done),
+    framed as multipart/byteranges if boundary is set"""
+    chunk_size = app.config['UPLOAD_CHUNK_SIZE']
+    with f:
+        for start, stop in spans:
+            if boundary:
+                yield _byterange_part_header(boundary, start, stop, file_size)
+            f.seek(start)
+            remaining = stop - start
+            while remaining > 0:
+                chunk = f.read(min(chunk_size, remaining))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+                yield chunk
+        if boundary:
+            yield f'\r\n--{boundary}--\r\n'.encode()
+
+def _byterange_part_header(boundary, start, stop, file_size):
+    return (
+        f'\r\n--{boundary}\r\n'
+        'Content-Type: application/pdf\r\n'
+        f'Content-Range: bytes {start}-{stop - 1}/{file_size}\r\n\r\n'
+    ).encode()
+
+def stored_copy(file_record):
+    """(filepath, filename, etag or None) of the bytes to serve for a File,
+    preferring the blob's optimized copy.
+
+    filepath is a local copy (fetched into the node's cache first with a
+    remote backend), or None if the bytes are gone.
+    """
+    store = file_store()
+    compact_key = optimized_key(file_record)
+    compact_path = compact_key and store.fetch(compact_key)
+    if compact_path:
+        # Written once and never replaced, so it gets its own strong validator
+        return compact_path, optimized_filename(file_record.content_hash), f'{file_record.content_hash}-opt'
+    return store.fetch(storage_key(file_record.filename)), file_record.filename, file_record.content_hash
+
+def open_stored_copy(file_record):
+    """Open the bytes to serve for a File; returns (file, filename, etag or
+    None) like stored_copy(), or None if the bytes are gone"""
+    for _ in range(2):  # A cached remote copy can be evicted between fetch and open
+        filepath, filename, etag = stored_copy(file_record)
+        if filepath is None:
+            return None
+        try:
+            return open(filepath, 'rb'), filename, etag
+        except FileNotFoundError:
+            continue
+    return None
+
+def send_pdf(file_record, as_attachment=False, public=True):
+    """Serve a stored PDF with ETag, conditional GET and byte-range support.
+
+    Returns 304 when the client's copy is current, 206 for single ranges,
+    multipart/byteranges for multiple ranges and 416 for unsatisfiable ones.
+    The optimized copy of the blob is served instead when there is one.
+    """
+    opened = open_stored_copy(file_record)
+    if opened is None:
+        response = jsonify({'error': 'File not found'})
+        response.status_code = 404
+        return response
+    # Everything below works from the open handle, which survives eviction
+    # of a cached copy
+    f, filename, etag = opened
+    filepath = f.name
+    stat = os.fstat(f.fileno())
+    file_size = stat.st_size
+    # Content-addressed uploads have a strong validator for free; legacy
+    # rows fall back to a digest of their path, size and mtime.
+    etag = etag or hashlib.sha256(
+        f'{filepath}:{file_size}:{stat.st_mtime_ns}'.encode()
+    ).hexdigest()
+    last_modified = datetime.datetime.fromtimestamp(int(stat.st_mtime), datetime.timezone.utc)
+    
+    response = Response(mimetype='application/pdf')
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.accept_ranges = 'bytes'
+    # File ids are reused and the optimized copy replaces the bytes behind
+    # the same URL, so caches revalidate every time and the ETag yields a 304
+    response.cache_control.no_cache = True
+    if public:
+        response.cache_control.public = True
+    else:
+        response.cache_control.private = True
+    response.headers.set(
+        'Content-Disposition',
+        'attachment' if as_attachment else 'inline',
+        filename=file_record.original_name
+    )
+    
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        f.close()
+        response.status_code = 304
+        return response
+    
+    serving_mode = app.config['FILE_SERVING_MODE']
+    if serving_mode in ('x-sendfile', 'x-accel-redirect'):
+        f.close()
+        # The front-end applies Range/If-Range itself when it serves the file
+        if serving_mode == 'x-sendfile':
+            response.headers['X-Sendfile'] = os.path.abspath(filepath)
+        else:
+            response.headers['X-Accel-Redirect'] = app.config['X_ACCEL_REDIRECT_PREFIX'] + \
+                urllib.parse.quote(filename.replace(os.sep, '/'))
+        response.content_length = file_size
+        return response
+    
+    spans = None
+    if_range = request.if_range
+    if not (if_range.etag and if_range.etag != etag) and \
+            not (if_range.date and last_modified > if_range.date):
+        spans = _resolve_ranges(file_size)
+    
+    if spans is None:
+        response.response = wrap_file(request.environ, f, app.config['UPLOAD_CHUNK_SIZE'])
+        response.content_length = file_size
+    elif not spans:
+        f.close()
+        response.status_code = 416
+        response.headers['Content-Range'] = f'bytes */{file_size}'
+        response.content_length = 0
+    elif len(spans) == 1:
+        start, stop = spans[0]
+        response.status_code = 206
+        response.response = _read_spans(f, spans)
+        response.headers['Content-Range'] = f'bytes {start}-{stop - 1}/{file_size}'
+        response.content_length = stop - start
+    else:
+        boundary = secrets.token_hex(16)
+        response.status_code = 206
+        response.response = _read_spans(f, spans, boundary, file_size)
+        response.content_type = f'multipart/byteranges; boundary={boundary}'
+        response.content_length = sum(
+            len(_byterange_part_header(boundary, start, stop, file_size)) + stop - start
+            for start, stop in spans
+        ) + len(f'\r\n--{boundary}--\r\n')
+    response.direct_passthrough = True
+    return response
+
+class DownloadCounter:
+    """Write-behind aggregator for File.download_count and User.downloads_count.
+
+    Increments are summed per id in memory and applied as relative UPDATEs in a
+    single transaction, so downloads never wait on the SQLite write lock and
+    several worker processes can flush side by side.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._files = collections.Counter()
+        self._users = collections.Counter()
+        self._wakeup = threading.Event()
+        self._thread = None
+        atexit.register(self.flush)
+    
+    def record(self, file_id, user_id, count=1):
+        self.record_many({file_id: count}, user_id)
+    
+    def record_many(self, counts, user_id):
+        """Record downloads of several files ({file_id: count}) by one user"""
+        with self._lock:
+            self._files.update(counts)
+            self._users[user_id] += sum(counts.values())
+            pending = sum(self._files.values())
+        if self.app.config['DOWNLOAD_FLUSH_INTERVAL'] <= 0:
+            self.flush()
+            return
+        self._ensure_worker()
+        if pending >= self.app.config['DOWNLOAD_FLUSH_THRESHOLD']:
+            self._wakeup.set()
+    
+    def pending_total(self):
+        """Downloads recorded by this process but not yet written"""
+        with self._lock:
+            return sum(self._files.values())
+    
+    def flush(self):
+        """Write all pending increments in one transaction"""
+        with self._lock:
+            files, self._files = self._files, collections.Counter()
+            users, self._users = self._users, collections.Counter()
+        if not files and not users:
+            return 0
+        with self.app.app_context():
+            try:
+                if files:
+                    db.session.execute(
+                        text("UPDATE file SET download_count = COALESCE(download_count, 0) + :n WHERE id = :id"),
+                        [{'id': file_id, 'n': n} for file_id, n in files.items()]
+                    )
+                    log_downloads(db.session.connection(), files)
+                if users:
+                    db.session.execute(
+                        text('UPDATE "user" SET downloads_count = COALESCE(downloads_count, 0) + :n WHERE id = :id'),
+                        [{'id': user_id, 'n': n} for user_id, n in users.items()]
+                    )
+                bump_stats(db.session.connection(), {STAT_DOWNLOADS: sum(files.values())})
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                # Put the counts back so the next flush retries them
+                with self._lock:
+                    self._files.update(files)
+                    self._users.update(users)
+                self.app.logger.exception('Download counter flush failed')
+                return 0
+        return sum(files.values())
+    
+    def _ensure_worker(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='download-counter', daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.app.config['DOWNLOAD_FLUSH_INTERVAL'])
+            self._wakeup.clear()
+            self.flush()
+
+download_counter = DownloadCounter(app)
+metrics.register(Gauge(
+    'downloads_pending', 'Downloads recorded but not yet flushed to the database', download_counter.pending_total
+))
+
+class OutboundEmail(db.Model):
+    """Queued email, delivered by EmailWorker"""
+    __tablename__ = 'outbound_email'
+    __table_args__ = (db.Index('ix_outbound_email_due', 'status', 'next_attempt_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(255), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+def queue_email(to_email, subject, body):
+    """Add an email to the outbound queue; it is sent after the caller commits"""
+    email = OutboundEmail(recipient=to_email, subject=subject, body=body)
+    db.session.add(email)
+    return email
+
+class EmailWorker:
+    """Delivers queued email in the background.
+
+    Rows are claimed with a conditional UPDATE that sets a lease, so several
+    processes can poll the same table without sending a message twice. Each
+    batch goes over a single SMTP connection; failures are retried with
+    exponential backoff until MAIL_MAX_ATTEMPTS.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+        self._mail = None
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+    
+    def wake(self):
+        """Ask the worker to look for new mail now instead of at the next poll"""
+        self.ensure_started()
+        self._wakeup.set()
+    
+    def ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='email-worker', daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        while True:
+            try:
+                while self.deliver_batch():
+                    pass
+            except Exception:
+                self.app.logger.exception('Email worker error')
+            self._wakeup.wait(self.app.config['MAIL_QUEUE_POLL_INTERVAL'])
+            self._wakeup.clear()
+    
+    def deliver_batch(self):
+        """Send up to MAIL_QUEUE_BATCH_SIZE due emails; returns how many were claimed"""
+        with self.app.app_context():
+            claimed = self._claim_batch()
+            if not claimed:
+                return 0
+            try:
+                with self._get_mail().connect() as connection:
+                    for email in claimed:
+                        self._send_one(connection, email)
+            except Exception as e:
+                # Could not connect, or the connection dropped mid-batch
+                for email in claimed:
+                    if email.status == 'sending':
+                        self._schedule_retry(email, e)
+            db.session.commit()
+            return len(claimed)
+    
+    def _get_mail(self):
+        # flask_mail is imported here so only processes that send mail load it
+        if self._mail is None:
+            from flask_mail import Mail
+            self._mail = Mail(self.app)
+        return self._mail
+    
+    def _claim_batch(self):
+        now = datetime.datetime.utcnow()
+        lease_until = now + datetime.timedelta(seconds=self.app.config['MAIL_SEND_LEASE'])
+        candidates = db.session.query(OutboundEmail.id, OutboundEmail.status, OutboundEmail.next_attempt_at).filter(
+            OutboundEmail.status.in_(('pending', 'sending')),
+            OutboundEmail.next_attempt_at <= now
+        ).order_by(OutboundEmail.next_attempt_at).limit(self.app.config['MAIL_QUEUE_BATCH_SIZE']).all()
+        claimed_ids = []
+        for email_id, status, next_attempt_at in candidates:
+            result = db.session.execute(
+                db.update(OutboundEmail)
+                .where(OutboundEmail.id == email_id,
+                       OutboundEmail.status == status,
+                       OutboundEmail.next_attempt_at == next_attempt_at)
+                .values(status='sending', next_attempt_at=lease_until)
+            )
+            if result.rowcount == 1:
+                claimed_ids.append(email_id)
+        db.session.commit()
+        if not claimed_ids:
+            return []
+        return OutboundEmail.query.filter(OutboundEmail.id.in_(claimed_ids)).all()
+    
+    def _send_one(self, connection, email):
+        from flask_mail import Message
+        started = time.perf_counter()
+        try:
+            connection.send(Message(subject=email.subject, recipients=[email.recipient], body=email.body))
+        except smtplib.SMTPServerDisconnected:
+            EMAIL_SEND_DURATION.observe(time.perf_counter() - started, result='disconnected')
+            raise  # Connection is gone; retry the rest of the batch later
+        except Exception as e:
+            EMAIL_SEND_DURATION.observe(time.perf_counter() - started, result='error')
+            self._schedule_retry(email, e)
+        else:
+            EMAIL_SEND_DURATION.observe(time.perf_counter() - started, result='sent')
+            email.status = 'sent'
+            email.sent_at = datetime.datetime.utcnow()
+            email.attempts += 1
+            email.last_error = None
+        db.session.commit()
+    
+    def _schedule_retry(self, email, error):
+        email.attempts += 1
+        email.last_error = str(error)
+        if email.attempts >= self.app.config['MAIL_MAX_ATTEMPTS']:
+            email.status = 'failed'
+            self.app.logger.error('Email to %s failed permanently: %s', email.recipient, error)
+            return
+        delay = self.app.config['MAIL_RETRY_DELAY'] * 2 ** (email.attempts - 1)
+        email.status = 'pending'
+        email.next_attempt_at = datetime.datetime.utcnow() + datetime.timedelta(
+            seconds=delay * random.uniform(1.0, 1.25)
+        )
+
+email_worker = EmailWorker(app)
+
+@app.before_request
+def start_email_worker():
+    # Picks up retries and mail queued before this process started
+    email_worker.ensure_started()
+
+# Analytics counters
+# Running totals for /analytics live in stat_counter and are adjusted by the
+# mapper events below in the same transaction as the change they count.
+# Downloads are added by DownloadCounter.flush(). `flask reconcile-stats`
+# recomputes everything from the base tables to correct any drift.
+class StatCounter(db.Model):
+    __tablename__ = 'stat_counter'
+    name = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+
+STAT_USERS = 'users'
+STAT_ACTIVE_USERS = 'active_users'
+STAT_FILES = 'files'
+STAT_DOWNLOADS = 'downloads'
+STAT_CATEGORY_PREFIX = 'category:'
+STAT_CATALOG_GENERATION = 'catalog_generation'  # Bumped by every change to a File row
+STAT_RANKINGS_REFRESHED = 'rankings_refreshed_at'  # Unix time, claimed by RankingUpdater
+
+def bump_stats(connection, deltas):
+    """Add deltas ({name: n}) to the running counters"""
+    rows = [{'name': name, 'delta': delta} for name, delta in deltas.items() if delta]
+    if rows:
+        connection.execute(text(
+            "INSERT INTO stat_counter (name, value) VALUES (:name, :delta) "
+            "ON CONFLICT (name) DO UPDATE SET value = stat_counter.value + excluded.value"
+        ), rows)
+
+@event.listens_for(User, 'after_insert')
+def _count_inserted_user(mapper, connection, target):
+    bump_stats(connection, {STAT_USERS: 1, STAT_ACTIVE_USERS: 1 if target.is_active else 0})
+
+@event.listens_for(User, 'after_delete')
+def _count_deleted_user(mapper, connection, target):
+    bump_stats(connection, {STAT_USERS: -1, STAT_ACTIVE_USERS: -1 if target.is_active else 0})
+
+@event.listens_for(User, 'after_update')
+def _count_user_status(mapper, connection, target):
+    if inspect(target).attrs.is_active.history.has_changes():
+        bump_stats(connection, {STAT_ACTIVE_USERS: 1 if target.is_active else -1})
+
+@event.listens_for(File, 'after_insert')
+def _count_inserted_file(mapper, connection, target):
+    bump_stats(connection, {
+        STAT_FILES: 1, STAT_CATEGORY_PREFIX + target.category: 1, STAT_CATALOG_GENERATION: 1
+    })
+    object_session(target).info['catalog_changed'] = True
+
+@event.listens_for(File, 'after_delete')
+def _count_deleted_file(mapper, connection, target):
+    bump_stats(connection, {
+        STAT_FILES: -1, STAT_CATEGORY_PREFIX + target.category: -1, STAT_CATALOG_GENERATION: 1
+    })
+    object_session(target).info['catalog_changed'] = True
+
+@event.listens_for(File, 'after_update')
+def _count_file_category(mapper, connection, target):
+    state = inspect(target)
+    if not any(attr.history.has_changes() for attr in state.attrs):
+        return
+    deltas = {STAT_CATALOG_GENERATION: 1}
+    history = state.attrs.category.history
+    if history.deleted and history.added:
+        deltas[STAT_CATEGORY_PREFIX + history.deleted[0]] = -1
+        deltas[STAT_CATEGORY_PREFIX + history.added[0]] = 1
+    bump_stats(connection, deltas)
+    object_session(target).info['catalog_changed'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _expire_catalog_cache(db_session):
+    if db_session.info.pop('catalog_changed', False):
+        files_cache.expire_generation()
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_catalog_change(db_session):
+    db_session.info.pop('catalog_changed', None)
+
+def reconcile_stats():
+    """Recompute every counter from scratch; returns {name: (old, new)} for those that drifted"""
+    actual = {
+        STAT_USERS: User.query.count(),
+        STAT_ACTIVE_USERS: User.query.filter_by(is_active=True).count(),
+        STAT_FILES: File.query.count(),
+        STAT_DOWNLOADS: db.session.query(db.func.sum(File.download_count)).scalar() or 0
+    }
+    for category, count in db.session.query(File.category, db.func.count(File.id)).group_by(File.category):
+        actual[STAT_CATEGORY_PREFIX + category] = count
+    current = {counter.name: counter.value for counter in StatCounter.query.all()}
+    drift = {}
+    for name in (set(actual) | set(current)) - {STAT_CATALOG_GENERATION, STAT_RANKINGS_REFRESHED}:
+        value = actual.get(name, 0)
+        if current.get(name) != value:
+            drift[name] = (current.get(name), value)
+            db.session.merge(StatCounter(name=name, value=value))
+    db.session.commit()
+    return drift
+
+# Popularity rankings
+# DownloadCounter.flush() adds each batch to per-file hourly buckets in
+# download_rollup. RankingUpdater folds old hours into days, drops buckets
+# outside the window and rebuilds file_ranking, whose (category, score)
+# index lets /files?sort=trending read the top N without sorting.
+class DownloadRollup(db.Model):
+    """Downloads of one file in one hour or, once compacted, one day"""
+    __tablename__ = 'download_rollup'
+    __table_args__ = (
+        db.Index('ix_download_rollup_period_bucket', 'period', 'bucket_start'),
+    )
+    # No foreign key: a flush may land just after the file was deleted
+    file_id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(4), primary_key=True)  # hour, day
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+class FileRanking(db.Model):
+    """Decayed download score of a file, rebuilt by RankingUpdater"""
+    __tablename__ = 'file_ranking'
+    __table_args__ = (
+        db.Index('ix_file_ranking_score', 'score', 'file_id'),
+        db.Index('ix_file_ranking_category_score', 'category', 'score', 'file_id'),
+    )
+    file_id = db.Column(db.Integer, db.ForeignKey('file.id'), primary_key=True)
+    category = db.Column(db.String(50), nullable=False)  # Copy of File.category, kept in step on update
+    score = db.Column(db.Float, nullable=False)
+    computed_at = db.Column(db.DateTime, nullable=False)
+
+ROLLUP_PERIODS = {'hour': datetime.timedelta(hours=1), 'day': datetime.timedelta(days=1)}
+
+def log_downloads(connection, files):
+    """Add download counts ({file_id: n}) to the current hour's buckets"""
+    bucket_start = datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    connection.execute(text(
+        "INSERT INTO download_rollup (file_id, period, bucket_start, count) "
+        "VALUES (:file_id, 'hour', :bucket_start, :n) "
+        "ON CONFLICT (file_id, period, bucket_start) DO UPDATE SET count = download_rollup.count + excluded.count"
+    ).bindparams(db.bindparam('bucket_start', type_=db.DateTime)),
+        [{'file_id': file_id, 'bucket_start': bucket_start, 'n': n} for file_id, n in files.items()])
+
+@event.listens_for(File, 'after_update')
+def _move_file_ranking(mapper, connection, target):
+    if inspect(target).attrs.category.history.has_changes():
+        connection.execute(
+            db.update(FileRanking).where(FileRanking.file_id == target.id).values(category=target.category)
+        )
+
+@event.listens_for(File, 'before_delete')
+def _drop_file_downloads(mapper, connection, target):
+    connection.execute(db.delete(FileRanking).where(FileRanking.file_id == target.id))
+    connection.execute(db.delete(DownloadRollup).where(DownloadRollup.file_id == target.id))
+
+class RankingUpdater:
+    """Compacts download_rollup and rebuilds file_ranking in the background.
+
+    A file's score is the sum of its bucketed downloads, each halved for
+    every TRENDING_HALF_LIFE_HOURS since the middle of its bucket. Processes
+    claim a run with a conditional UPDATE of the rankings_refreshed_at
+    counter, so only one of them does the work per interval.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._thread = None
+    
+    def ensure_started(self):
+        if self.app.config['RANKING_REFRESH_INTERVAL'] <= 0:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='ranking-updater', daemon=True)
+                self._thread.start()
+    
+    def _run(self):
+        while True:
+            try:
+                if self._claim():
+                    self.refresh()
+            except Exception:
+                self.app.logger.exception('Ranking refresh failed')
+            time.sleep(self.app.config['RANKING_REFRESH_INTERVAL'])
+    
+    def _claim(self):
+        now = int(time.time())
+        with self.app.app_context():
+            db.session.execute(text(
+                "INSERT INTO stat_counter (name, value) VALUES (:name, 0) ON CONFLICT (name) DO NOTHING"
+            ), {'name': STAT_RANKINGS_REFRESHED})
+            result = db.session.execute(text(
+                "UPDATE stat_counter SET value = :now WHERE name = :name AND value <= :due"
+            ), {'name': STAT_RANKINGS_REFRESHED, 'now': now,
+                'due': now - int(self.app.config['RANKING_REFRESH_INTERVAL'])})
+            db.session.commit()
+            return result.rowcount == 1
+    
+    def compact(self, now):
+        """Fold hourly buckets past TRENDING_HOURLY_RETENTION into daily ones
+        and drop buckets older than TRENDING_WINDOW_DAYS"""
+        cutoff = now - datetime.timedelta(hours=self.app.config['TRENDING_HOURLY_RETENTION'])
+        days = collections.Counter()
+        old_hours = db.session.query(DownloadRollup.file_id, DownloadRollup.bucket_start, DownloadRollup.count).filter(
+            DownloadRollup.period == 'hour', DownloadRollup.bucket_start < cutoff
+        )
+        for file_id, bucket_start, count in old_hours:
+            days[(file_id, bucket_start.replace(hour=0))] += count
+        if days:
+            db.session.execute(text(
+                "INSERT INTO download_rollup (file_id, period, bucket_start, count) "
+                "VALUES (:file_id, 'day', :bucket_start, :n) "
+                "ON CONFLICT (file_id, period, bucket_start) DO UPDATE SET count = download_rollup.count + excluded.count"
+            ).bindparams(db.bindparam('bucket_start', type_=db.DateTime)),
+                [{'file_id': file_id, 'bucket_start': day, 'n': n} for (file_id, day), n in days.items()])
+            db.session.execute(db.delete(DownloadRollup).where(
+                DownloadRollup.period == 'hour', DownloadRollup.bucket_start < cutoff
+            ))
+        expired = now - datetime.timedelta(days=self.app.config['TRENDING_WINDOW_DAYS'])
+        db.session.execute(db.delete(DownloadRollup).where(DownloadRollup.bucket_start < expired))
+    
+    def scores(self, now):
+        """{file_id: decayed score} over the buckets still in the window"""
+        half_life = self.app.config['TRENDING_HALF_LIFE_HOURS'] * 3600
+        scores = collections.Counter()
+        rows = db.session.query(DownloadRollup.file_id, DownloadRollup.period,
+                                DownloadRollup.bucket_start, DownloadRollup.count)
+        for file_id, period, bucket_start, count in rows:
+            age = (now - bucket_start - ROLLUP_PERIODS[period] / 2).total_seconds()
+            scores[file_id] += count * 0.5 ** (max(age, 0) / half_life)
+        return scores
+    
+    def refresh(self):
+        """Compact the buckets and replace file_ranking; returns the number of ranked files"""
+        now = datetime.datetime.utcnow()
+        with self.app.app_context():
+            try:
+                self.compact(now)
+                scores = self.scores(now)
+                rows = []
+                file_ids = list(scores)
+                for i in range(0, len(file_ids), 500):
+                    for file_id, category in db.session.query(File.id, File.category).filter(
+                        File.id.in_(file_ids[i:i + 500])
+                    ):
+                        rows.append({'file_id': file_id, 'category': category,
+                                     'score': scores[file_id], 'computed_at': now})
+                db.session.execute(db.delete(FileRanking))
+                if rows:
+                    db.session.execute(db.insert(FileRanking), rows)
+                db.session.commit()
+                return len(rows)
+            except Exception:
+                db.session.rollback()
+                raise
+
+ranking_updater = RankingUpdater(app)
+
+@app.before_request
+def start_ranking_updater():
+    ranking_updater.ensure_started()
+
+class TTLCache:
+    """Small thread-safe in-process cache whose entries expire after `ttl` seconds"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                return entry[1]
+            self._entries.pop(key, None)
+            return None
+    
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+analytics_cache = TTLCache()
+
+class ResponseCache:
+    """LRU cache of serialized responses bounded by total body size.
+
+    Entries are tagged with the catalog generation they were built at and
+    ignored once it moves on. The generation is read from stat_counter at
+    most every `check_interval` seconds, or on the next lookup after a commit
+    in this process changed a File.
+    """
+    
+    def __init__(self, max_bytes, ttl, check_interval):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._generation = None
+        self._checked_at = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def generation(self):
+        now = time.monotonic()
+        if self._generation is None or now - self._checked_at >= self.check_interval:
+            value = db.session.execute(
+                text('SELECT value FROM stat_counter WHERE name = :name'),
+                {'name': STAT_CATALOG_GENERATION}
+            ).scalar()
+            self._generation, self._checked_at = value or 0, now
+        return self._generation
+    
+    def expire_generation(self):
+        self._generation = None
+    
+    def get(self, key, generation):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == generation and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2], entry[3]
+            if entry:
+                self._discard(key)
+            self.misses += 1
+            return None
+    
+    def set(self, key, generation, etag, body):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = (generation, time.monotonic() + self.ttl, etag, body)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+    
+    def _discard(self, key):
+        self._size -= len(self._entries.pop(key)[3])
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            self.hits = self.misses = 0
+    
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size, 'hits': self.hits, 'misses': self.misses}
+
+files_cache = ResponseCache(0, 0, 0)  # Sized from the config by create_app()
+metrics.register(Gauge('files_cache_bytes', 'Size of the cached /files responses', lambda: files_cache.stats()['bytes']))
+
+# Background PDF processing
+THUMBNAIL_SIZES = {'small': 160, 'medium': 320, 'large': 640}  # Width in pixels
+
+def thumbnail_key(file_record, size):
+    # Keyed by content hash so duplicate uploads share their thumbnails
+    key = file_record.content_hash or f'file-{file_record.id}'
+    folder = os.path.relpath(app.config['THUMBNAIL_FOLDER'], app.config['UPLOAD_FOLDER'])
+    return storage_key(os.path.join(folder, key[:2], f'{key}-{size}.png'))
+
+class PdfProcessor:
+    """Runs pdfworker.process_pdf for new uploads in a pool of processes.
+
+    Parsing and rendering are CPU-bound, so they run outside the web worker;
+    results are written back from the pool's callback thread. Rows stay
+    'pending' until then, so `flask process-pdfs` picks up anything a restart
+    interrupted.
+    """
+    
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._pool = None
+    
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: children import only pdfworker, not this module
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.app.config['PDF_PROCESSING_WORKERS'],
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return self._pool
+    
+    def submit(self, file_record):
+        if self.app.config['PDF_PROCESSING_WORKERS'] <= 0:
+            return None
+        store = file_store()
+        # Thumbnails are rendered into the store's local folder and published
+        # by the callback. Absolute paths: the pool may outlive a change of
+        # working directory.
+        thumbnails = {
+            size: (width, os.path.abspath(store.path_for(thumbnail_key(file_record, size))))
+            for size, width in THUMBNAIL_SIZES.items()
+        }
+        try:
+            source = store.fetch(storage_key(file_record.filename))
+            if source is None:
+                raise FileNotFoundError(file_record.filename)
+            future = self._get_pool().submit(
+                pdfworker.process_pdf, os.path.abspath(source), thumbnails,
+                self.app.config['SEARCH_INDEX_MAX_PAGES']
+            )
+        except Exception:
+            # The upload is already committed; the row stays pending for process-pdfs
+            self.app.logger.exception('Could not queue PDF processing for file %s', file_record.id)
+            return None
+        future.add_done_callback(functools.partial(self._store_result, file_record.id))
+        if self.app.config['PDF_OPTIMIZE'] and file_record.content_hash:
+            blob = db.session.get(Blob, file_record.content_hash)
+            if blob is not None and blob.optimize_status is None:
+                self.submit_optimization(file_record.content_hash)
+        return future
+    
+    def submit_optimization(self, digest):
+        """Queue a compacted copy of a blob, kept next to it only if smaller"""
+        if self.app.config['PDF_PROCESSING_WORKERS'] <= 0:
+            return None
+        store = file_store()
+        target = store.path_for(storage_key(optimized_filename(digest)))
+        try:
+            source = store.fetch(storage_key(blob_filename(digest)))
+            if source is None:
+                raise FileNotFoundError(blob_filename(digest))
+            future = self._get_pool().submit(
+                pdfworker.optimize_pdf, os.path.abspath(source), os.path.abspath(target),
+                self.app.config['PDF_OPTIMIZE_IMAGE_DPI'], self.app.config['PDF_OPTIMIZE_MIN_SAVING']
+            )
+        except Exception:
+            self.app.logger.exception('Could not queue PDF optimization for blob %s', digest)
+            return None
+        future.add_done_callback(functools.partial(self._store_optimization, digest))
+        return future
+    
+    def shutdown(self):
+        """Wait for queued jobs and their result callbacks to finish"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+    
+    def _store_result(self, file_id, future):
+        with self.app.app_context():
+            try:
+                file_record = db.session.get(File, file_id)
+                if file_record is None:
+                    return  # Deleted while it was being processed
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.app.logger.warning('PDF processing failed for file %s: %s', file_id, e)
+                    file_record.processing_status = 'failed'
+                else:
+                    file_record.page_count = result['page_count']
+                    file_record.pdf_title = result['title'][:500] if result['title'] else None
+                    file_record.pdf_author = result['author'][:255] if result['author'] else None
+                    store = file_store()
+                    for size in result['thumbnails']:
+                        key = thumbnail_key(file_record, size)
+                        store.store(store.path_for(key), key)
+                    file_record.has_thumbnail = bool(result['thumbnails'])
+                    file_record.processing_status = 'done'
+                    set_search_content(file_id, result['text'])
+                file_record.processed_at = datetime.datetime.utcnow()
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('Failed to store PDF processing result for file %s', file_id)
+    
+    def _store_optimization(self, digest, future):
+        with self.app.app_context():
+            try:
+                blob = db.session.get(Blob, digest)
+                if blob is None:
+                    return  # Released while it was being optimized
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.app.logger.warning('PDF optimization failed for blob %s: %s', digest, e)
+                    blob.optimize_status = 'failed'
+                else:
+                    if result['kept']:
+                        key = storage_key(optimized_filename(digest))
+                        file_store().store(file_store().path_for(key), key)
+                    blob.optimized_size_bytes = result['optimized_size']
+                    blob.optimize_status = 'done' if result['kept'] else 'skipped'
+                blob.optimized_at = datetime.datetime.utcnow()
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self.app.logger.exception('Failed to store PDF optimization result for blob %s', digest)
+
+pdf_processor = PdfProcessor(app)
+
+# Sessions and auth
+Principal = collections.namedtuple('Principal', 'id username is_admin is_active')
+
+class PrincipalCache:
+    """LRU cache of Principals by user id whose entries expire after `ttl` seconds.
+
+    Entries are dropped after commits that change a user (see
+    user_auth_changed), so this process sees the change at once; other
+    processes see it within `ttl`, or at once with a server-side session
+    backend, which revokes the sessions themselves.
+    """
+    
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+    
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                return entry[1]
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+        principal = Principal(user.id, user.username, user.is_admin, user.is_active)
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return principal
+    
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+principal_cache = PrincipalCache(0, 0)  # Sized from the config by create_app()
+
+class ServerSideSession(SecureCookieSession):
+    def __init__(self, initial=None, sid=None):
+        super().__init__(initial)
+        self.sid = sid
+        self.loaded_user_id = self.get('user_id')
+
+class SqliteSessionStore:
+    """Sessions in a local SQLite file, shared by all worker processes"""
+    
+    def __init__(self, path, busy_timeout_ms):
+        self.path = path
+        self.timeout = busy_timeout_ms / 1000
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS session '
+                '(sid TEXT PRIMARY KEY, user_id INTEGER, data TEXT NOT NULL, expires_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS ix_session_user_id ON session (user_id)')
+    
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+    
+    def load(self, sid):
+        row = self._connect().execute(
+            'SELECT data FROM session WHERE sid = ? AND expires_at > ?', (sid, time.time())
+        ).fetchone()
+        return row[0] if row else None
+    
+    def save(self, sid, data, user_id, expires_at):
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO session (sid, user_id, data, expires_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (sid) DO UPDATE SET user_id = excluded.user_id, '
+                'data = excluded.data, expires_at = excluded.expires_at',
+                (sid, user_id, data, expires_at)
+            )
+    
+    def delete(self, sid):
+        with self._connect() as conn:
+            conn.execute('DELETE FROM session WHERE sid = ?', (sid,))
+    
+    def delete_user(self, user_id):
+        with self._connect() as conn:
+            return conn.execute('DELETE FROM session WHERE user_id = ?', (user_id,)).rowcount
+    
+    def purge_expired(self):
+        with self._connect() as conn:
+            return conn.execute('DELETE FROM session WHERE expires_at <= ?', (time.time(),)).rowcount
+
+class FilesystemSessionStore:
+    """One JSON file per session, plus a per-user directory of marker files
+    so all of a user's sessions can be found without scanning"""
+    
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(os.path.join(folder, 'users'), exist_ok=True)
+    
+    def _path(self, sid):
+        return os.path.join(self.folder, f'{sid}.json')
+    
+    def _marker(self, user_id, sid):
+        return os.path.join(self.folder, 'users', str(user_id), sid)
+    
+    def _read(self, sid):
+        try:
+            with open(self._path(sid)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def load(self, sid):
+        record = self._read(sid)
+        if record is None or record['expires_at'] <= time.time():
+            return None
+        return record['data']
+    
+    def save(self, sid, data, user_id, expires_at):
+        path = self._path(sid)
+        old = self._read(sid)
+        if old and old['user_id'] is not None and old['user_id'] != user_id:
+            self._remove(self._marker(old['user_id'], sid))
+        if user_id is not None:
+            marker = self._marker(user_id, sid)
+            os.makedirs(os.path.dirname(marker), exist_ok=True)
+            open(marker, 'a').close()
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'user_id': user_id, 'data': data, 'expires_at': expires_at}, f)
+        os.replace(temp_path, path)
+    
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    
+    def delete(self, sid):
+        record = self._read(sid)
+        self._remove(self._path(sid))
+        if record and record['user_id'] is not None:
+            self._remove(self._marker(record['user_id'], sid))
+    
+    def delete_user(self, user_id):
+        folder = os.path.join(self.folder, 'users', str(user_id))
+        if not os.path.isdir(folder):
+            return 0
+        sids = os.listdir(folder)
+        for sid in sids:
+            self._remove(self._path(sid))
+            self._remove(os.path.join(folder, sid))
+        return len(sids)
+    
+    def purge_expired(self):
+        count = 0
+        now = time.time()
+        for name in os.listdir(self.folder):
+            if name.endswith('.json'):
+                sid = name[:-len('.json')]
+                record = self._read(sid)
+                if record is not None and record['expires_at'] <= now:
+                    self.delete(sid)
+                    count += 1
+        return count
+
+class ServerSideSessionInterface(SessionInterface):
+    """Keeps session data in `store`; the cookie only carries a random id.
+
+    Stores key sessions by user id so revoke_user() can end all of a user's
+    sessions, and the id is rotated whenever the logged-in user changes.
+    """
+    
+    serializer = TaggedJSONSerializer()
+    sid_pattern = re.compile(r'^[A-Za-z0-9_-]{32,64}$')
+    
+    def __init__(self, store):
+        self.store = store
+    
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and self.sid_pattern.match(sid):
+            data = self.store.load(sid)
+            if data is not None:
+                return ServerSideSession(self.serializer.loads(data), sid=sid)
+        return ServerSideSession()
+    
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        secure = self.get_cookie_secure(app)
+        samesite = self.get_cookie_samesite(app)
+        httponly = self.get_cookie_httponly(app)
+        
+        if session.accessed:
+            response.vary.add('Cookie')
+        
+        if not session:
+            if session.modified and session.sid:
+                self.store.delete(session.sid)
+                response.delete_cookie(
+                    name, domain=domain, path=path, secure=secure, samesite=samesite, httponly=httponly
+                )
+            return
+        
+        if not self.should_set_cookie(app, session):
+            return
+        
+        user_id = session.get('user_id')
+        if session.sid and user_id != session.loaded_user_id:
+            # Login or account switch: never reuse an id issued before it
+            self.store.delete(session.sid)
+            session.sid = None
+        sid = session.sid or secrets.token_urlsafe(32)
+        expires = self.get_expiration_time(app, session)
+        store_expires = expires or datetime.datetime.now(datetime.timezone.utc) + app.permanent_session_lifetime
+        self.store.save(sid, self.serializer.dumps(dict(session)), user_id, store_expires.timestamp())
+        response.set_cookie(
+            name, sid, expires=expires, httponly=httponly, domain=domain, path=path,
+            secure=secure, samesite=samesite
+        )
+    
+    def revoke_user(self, user_id):
+        return self.store.delete_user(user_id)
+
+def build_session_interface():
+    if app.config['SESSION_BACKEND'] == 'filesystem':
+        return ServerSideSessionInterface(FilesystemSessionStore(app.config['SESSION_FOLDER']))
+    if app.config['SESSION_BACKEND'] == 'sqlite':
+        return ServerSideSessionInterface(SqliteSessionStore(
+            app.config['SESSION_SQLITE_PATH'], app.config['SQLITE_BUSY_TIMEOUT_MS']
+        ))
+    if app.config['SESSION_BACKEND'] != 'cookie':
+        raise RuntimeError(f"Unknown SESSION_BACKEND {app.config['SESSION_BACKEND']!r}")
+    return None
+
+AUTH_FIELDS = ('username', 'is_admin', 'is_active', 'password_hash')
+
+@event.listens_for(User, 'after_update')
+def user_auth_changed(mapper, connection, target):
+    """Queue cache invalidation (and session revocation for deactivated
+    users or new passwords) until the change is committed"""
+    state = inspect(target)
+    changed = [name for name in AUTH_FIELDS if state.attrs[name].history.has_changes()]
+    if changed:
+        revoke = 'password_hash' in changed or not target.is_active
+        pending = object_session(target).info.setdefault('auth_changed', {})
+        pending[target.id] = pending.get(target.id, False) or revoke
+
+@event.listens_for(User, 'after_delete')
+def user_deleted(mapper, connection, target):
+    object_session(target).info.setdefault('auth_changed', {})[target.id] = True
+
+@event.listens_for(Session, 'after_commit')
+def apply_auth_changes(db_session):
+    for user_id, revoke in db_session.info.pop('auth_changed', {}).items():
+        principal_cache.invalidate(user_id)
+        if revoke:
+            revoke_user_sessions(user_id)
+
+@event.listens_for(Session, 'after_rollback')
+def discard_auth_changes(db_session):
+    db_session.info.pop('auth_changed', None)
+
+def revoke_user_sessions(user_id):
+    """End every session of a user; a no-op with cookie sessions, where the
+    auth decorators turn them away once the cached principal expires"""
+    if isinstance(app.session_interface, ServerSideSessionInterface):
+        try:
+            return app.session_interface.revoke_user(user_id)
+        except Exception:
+            app.logger.exception('Failed to revoke sessions for user %s', user_id)
+    return 0
+
+def load_principal():
+    """The logged-in, active user's Principal (also stored on g), or None"""
+    if 'principal' not in g:
+        g.principal = None
+        if 'user_id' in session:
+            principal = principal_cache.get(session['user_id'])
+            if principal is None or not principal.is_active:
+                session.clear()
+            else:
+                g.principal = principal
+    return g.principal
+
 def require_login(f):
     def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
+        if load_principal() is None:
             return jsonify({'error': 'Authentication required'}), 401
         return f(*args, **kwargs)
     decorated_function.__name__ = f.__name__
     return decorated_function
 
-def require_admin(f):
-    def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            return jsonify({'error': 'Authentication required'}), 401
-        user = User.query.get(session['user_id'])
-        if not user or not user.is_admin:
-            return jsonify({'error': 'Admin access required'}), 403
-        return f(*args, **kwargs)
-    decorated_function.__name__ = f.__name__
-    return decorated_function
+def require_admin(f):
+    def decorated_function(*args, **kwargs):
+        principal = load_principal()
+        if principal is None:
+            return jsonify({'error': 'Authentication required'}), 401
+        if not principal.is_admin:
+            return jsonify({'error': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+    decorated_function.__name__ = f.__name__
+    return decorated_function
+
+# Columns added after the first release. create_all() only creates missing
+# tables, so existing databases get these through ALTER TABLE on startup.
+SCHEMA_UPGRADES = [
+    ('file', 'content_hash', db.String(64)),
+    ('file', 'size_bytes', db.BigInteger()),
+    ('file', 'processing_status', db.String(20)),
+    ('file', 'processed_at', db.DateTime()),
+    ('file', 'page_count', db.Integer()),
+    ('file', 'pdf_title', db.String(500)),
+    ('file', 'pdf_author', db.String(255)),
+    ('file', 'has_thumbnail', db.Boolean()),
+    ('blob', 'optimize_status', db.String(20)),
+    ('blob', 'optimized_size_bytes', db.BigInteger()),
+    ('blob', 'optimized_at', db.DateTime()),
+]
+
+def upgrade_schema():
+    """Add missing columns and indexes to an existing database"""
+    inspector = inspect(db.engine)
+    dialect = db.engine.dialect
+    for table_name, column_name, column_type in SCHEMA_UPGRADES:
+        existing = {col['name'] for col in inspector.get_columns(table_name)}
+        if column_name not in existing:
+            # Spelled by the dialect, e.g. TIMESTAMP for DateTime on PostgreSQL
+            ddl = column_type.compile(dialect=dialect)
+            db.session.execute(text(f'ALTER TABLE "{table_name}" ADD COLUMN {column_name} {ddl}'))
+    db.session.commit()
+    for model_table in db.metadata.sorted_tables:
+        for index in model_table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+def bytes_to_mb(size_bytes):
+    return round(size_bytes / (1024 * 1024), 2)
+
+def stream_to_temp(stream, max_bytes=None):
+    """Copy an upload stream to a temp file, hashing it in the same pass.
+
+    Returns (temp_path, sha256 hex digest, size in bytes). Raises ValueError
+    if the stream is longer than max_bytes.
+    """
+    digest = hashlib.sha256()
+    size_bytes = 0
+    chunk_size = app.config['UPLOAD_CHUNK_SIZE']
+    fd, temp_path = tempfile.mkstemp(suffix='.part', dir=app.config['UPLOAD_TMP_FOLDER'])
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                size_bytes += len(chunk)
+                if max_bytes is not None and size_bytes > max_bytes:
+                    raise ValueError(f'File exceeds {bytes_to_mb(max_bytes)} MB')
+                out.write(chunk)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    return temp_path, digest.hexdigest(), size_bytes
+
+def blob_filename(digest):
+    """Path of a blob relative to UPLOAD_FOLDER"""
+    return os.path.join(os.path.relpath(app.config['BLOB_FOLDER'], app.config['UPLOAD_FOLDER']),
+                        digest[:2], f'{digest}.pdf')
+
+def optimized_filename(digest):
+    """Path of a blob's optimized copy relative to UPLOAD_FOLDER"""
+    return os.path.join(os.path.relpath(app.config['BLOB_FOLDER'], app.config['UPLOAD_FOLDER']),
+                        digest[:2], f'{digest}.opt.pdf')
+
+def build_storage():
+    if app.config['STORAGE_BACKEND'] == 'local':
+        return storage.LocalStorage(app.config['UPLOAD_FOLDER'])
+    if app.config['STORAGE_BACKEND'] == 's3':
+        if not app.config['S3_BUCKET']:
+            raise RuntimeError("STORAGE_BACKEND 's3' needs S3_BUCKET")
+        return storage.S3Storage(
+            app.config['S3_BUCKET'], app.config['STORAGE_CACHE_FOLDER'], app.config['STORAGE_CACHE_MAX_BYTES'],
+            prefix=app.config['S3_PREFIX'], endpoint_url=app.config['S3_ENDPOINT_URL'],
+            region=app.config['S3_REGION']
+        )
+    raise RuntimeError(f"Unknown STORAGE_BACKEND {app.config['STORAGE_BACKEND']!r}")
+
+def file_store():
+    """The storage backend set up by create_app()"""
+    return app.extensions['file_store']
+
+def storage_key(filename):
+    """Storage key of a path relative to UPLOAD_FOLDER"""
+    return filename.replace(os.sep, '/')
+
+def optimized_key(file_record):
+    """Key of a File's optimized copy, or None for legacy uploads"""
+    if not file_record.content_hash:
+        return None
+    return storage_key(optimized_filename(file_record.content_hash))
+
+def move_to_blob_store(temp_path, digest):
+    """Hand a hashed temp file to the blob store; returns its local path.
+
+    Since the key is the content hash, storing over an existing blob leaves
+    identical bytes in place.
+    """
+    return file_store().store(temp_path, storage_key(blob_filename(digest)))
+
+def reference_blob(digest, size_bytes, refs=1):
+    """Take `refs` references on a blob, creating its row if needed"""
+    db.session.execute(text(
+        "INSERT INTO blob (digest, size_bytes, ref_count, created_at) "
+        "VALUES (:digest, :size_bytes, :refs, :created_at) "
+        "ON CONFLICT (digest) DO UPDATE SET ref_count = blob.ref_count + excluded.ref_count"
+    ), {'digest': digest, 'size_bytes': size_bytes, 'refs': refs, 'created_at': datetime.datetime.utcnow()})
+
+def ingest_pdf(stream, max_bytes=None):
+    """Hash an uploaded PDF into a temp file; touches no DB state.
+
+    Safe to run in worker threads. Returns a dict describing the blob for
+    store_blob() and new_file_record().
+    """
+    temp_path, digest, size_bytes = stream_to_temp(stream, max_bytes)
+    return ingest_temp_file(temp_path, digest, size_bytes)
+
+def ingest_temp_file(temp_path, digest, size_bytes):
+    """Describe an already hashed temp file as a blob-to-be"""
+    return {
+        'temp_path': temp_path,
+        'digest': digest,
+        'size_bytes': size_bytes,
+        'filename': blob_filename(digest),
+        'filepath': os.path.join(app.config['UPLOAD_FOLDER'], blob_filename(digest))
+    }
+
+def store_blob(ingested):
+    """Move an ingested temp file into the blob store.
+
+    Call it after reference_blob() in the same transaction: the row lock
+    makes a concurrent purge_blob() of the digest finish first (or wait for
+    this commit), so bytes are never unlinked under a new reference.
+    """
+    move_to_blob_store(ingested['temp_path'], ingested['digest'])
+
+def new_file_record(original_name, ingested, category, description, tags, user_id):
+    return File(
+        filename=ingested['filename'],
+        original_name=original_name,
+        filepath=ingested['filepath'],
+        size_mb=bytes_to_mb(ingested['size_bytes']),
+        size_bytes=ingested['size_bytes'],
+        content_hash=ingested['digest'],
+        category=category,
+        description=description,
+        tags=tags,
+        user_id=user_id
+    )
+
+def hash_file(filepath):
+    """Return (sha256 hex digest, size in bytes) of a file on disk"""
+    digest = hashlib.sha256()
+    size_bytes = 0
+    with open(filepath, 'rb') as f:
+        for chunk in iter(functools.partial(f.read, app.config['UPLOAD_CHUNK_SIZE']), b''):
+            digest.update(chunk)
+            size_bytes += len(chunk)
+    return digest.hexdigest(), size_bytes
+
+def create_file(original_name, ingested, category, description, tags, user_id):
+    """Add the File row for an ingested upload, with its blob reference and
+    uploader count. The caller commits, then hands the row to pdf_processor."""
+    reference_blob(ingested['digest'], ingested['size_bytes'])
+    store_blob(ingested)
+    file_record = new_file_record(original_name, ingested, category, description, tags, user_id)
+    user = db.session.get(User, user_id)
+    user.uploads_count += 1
+    db.session.add(file_record)
+    db.session.flush()
+    return file_record
+
+def release_blob(file_record):
+    """Drop a File's reference to its bytes.
+
+    Returns True once nothing references them any more; the caller commits
+    and then calls purge_blob(). The Blob row stays (at ref_count 0) until
+    then, so the bytes are only ever unlinked under the row's lock.
+    """
+    if not file_record.content_hash:
+        return True  # Legacy upload, not content-addressed
+    blob = db.session.get(Blob, file_record.content_hash, with_for_update=True)
+    if not blob:
+        return True
+    blob.ref_count -= 1
+    return blob.ref_count <= 0
+
+def purge_blob(file_record):
+    """Delete the stored bytes and thumbnails of a released File if unused.
+
+    Runs its own transaction. Upserting the row first takes its lock (or
+    waits for an upload of the same bytes to commit); the row is then
+    deleted only at ref_count 0 and the files are unlinked before commit,
+    so an upload racing with the purge re-stores its bytes afterwards.
+    """
+    keys = [thumbnail_key(file_record, size) for size in THUMBNAIL_SIZES]
+    if not file_record.content_hash:
+        for key in [storage_key(file_record.filename)] + keys:
+            file_store().delete(key)
+        return
+    digest = file_record.content_hash
+    try:
+        reference_blob(digest, file_record.size_bytes or 0, 0)
+        unused = Blob.query.filter(Blob.digest == digest, Blob.ref_count <= 0).delete(
+            synchronize_session=False
+        )
+        if unused:
+            for key in [storage_key(blob_filename(digest)), optimized_key(file_record)] + keys:
+                file_store().delete(key)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+def discard_ingested(ingested):
+    """Clean up an ingested upload whose transaction rolled back.
+
+    Removes the temp file if it never moved into the blob store, and
+    otherwise purges the blob unless a committed row references it. Errors
+    are logged, so the caller can still report the original failure.
+    """
+    try:
+        if os.path.exists(ingested['temp_path']):
+            os.remove(ingested['temp_path'])
+        else:
+            purge_blob(File(filename=ingested['filename'], content_hash=ingested['digest'],
+                            size_bytes=ingested['size_bytes']))
+    except Exception:
+        app.logger.exception('Could not discard upload of blob %s', ingested['digest'])
+
+# One address, no display name: dot-atom local part, dotted hostname with a TLD
+EMAIL_PATTERN = re.compile(
+    r"[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+(\.[A-Za-z0-9!#$%&'*+/=?^_`{|}~-]+)*"
+    r"@([A-Za-z0-9]([A-Za-z0-9-]{0,61}[A-Za-z0-9])?\.)+[A-Za-z]{2,63}"
+)
+
+def is_valid_email(email):
+    return len(email) <= 254 and EMAIL_PATTERN.fullmatch(email) is not None
+
+def build_invitation(email, message, invited_by):
+    """Create an Invitation and queue its email; returns (invitation, invite_link)"""
+    invite_code = secrets.token_hex(16)
+    invite_link = f"{request.host_url}?invite={invite_code}&email={urllib.parse.quote(email)}"
+    invitation = Invitation(
+        email=email,
+        invite_code=invite_code,
+        invited_by=invited_by,
+        message=message
+    )
+    db.session.add(invitation)
+    
+    email_body = f"""
+Hello!
+
+{invited_by} has invited you to join EduLibrary - a collaborative digital library platform.
+
+{message if message else 'Join us to share and discover educational resources!'}
+
+Click the link below to join:
+{invite_link}
+
+Best regards,
+The EduLibrary Team
+        """
+    queue_email(email, "You're invited to join EduLibrary!", email_body)
+    return invitation, invite_link
+
+# Static assets
+Asset = collections.namedtuple('Asset', 'name mimetype etag fingerprint variants')
+
+class AssetPipeline:
+    """Keeps front-end files in memory with precompressed variants.
+
+    Files are read, hashed and compressed once, and again only when one of
+    their mtimes changes. References to other assets in HTML (src="script.js",
+    href="style.css") are rewritten to fingerprinted URLs, so an HTML page
+    changes whenever a file it uses does.
+    """
+    
+    ENCODINGS = ['br', 'gzip', 'identity']  # Preferred first
+    reference_pattern = re.compile(r'(\b(?:src|href)=["\'])/?([\w.-]+\.(?:js|css))(["\'])')
+    
+    def __init__(self, app):
+        self.app = app
+        self._lock = threading.Lock()
+        self._mtimes = None
+        self._assets = {}
+    
+    def _stat(self):
+        mtimes = {}
+        for name in self.app.config['ASSET_FILES']:
+            try:
+                mtimes[name] = os.stat(os.path.join(self.app.config['ASSET_FOLDER'], name)).st_mtime_ns
+            except FileNotFoundError:
+                pass
+        return mtimes
+    
+    def _build(self, name, data):
+        digest = hashlib.sha256(data).hexdigest()
+        variants = {'identity': data}
+        if len(data) >= self.app.config['ASSET_MIN_COMPRESS_SIZE']:
+            variants['gzip'] = gzip.compress(data, compresslevel=9, mtime=0)
+            if brotli is not None:
+                variants['br'] = brotli.compress(data, quality=11)
+            # Keep a variant only if it is actually smaller
+            variants = {k: v for k, v in variants.items() if k == 'identity' or len(v) < len(data)}
+        mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        return Asset(name, mimetype, digest[:32], digest[:12], variants)
+    
+    def _refresh(self):
+        mtimes = self._stat()
+        if mtimes == self._mtimes:
+            return
+        with self._lock:
+            if mtimes == self._mtimes:
+                return
+            sources = {}
+            for name in mtimes:
+                with open(os.path.join(self.app.config['ASSET_FOLDER'], name), 'rb') as f:
+                    sources[name] = f.read()
+            assets = {}
+            for name, data in sources.items():
+                if not name.endswith('.html'):
+                    assets[name] = self._build(name, data)
+            for name, data in sources.items():
+                if name.endswith('.html'):
+                    html = self.reference_pattern.sub(
+                        lambda m: m.group(1) + self._url(assets, m.group(2)) + m.group(3),
+                        data.decode('utf-8')
+                    )
+                    assets[name] = self._build(name, html.encode('utf-8'))
+            self._assets = assets
+            self._mtimes = mtimes
+    
+    @staticmethod
+    def _url(assets, name):
+        asset = assets.get(name)
+        if asset is None:
+            return name
+        stem, ext = os.path.splitext(name)
+        return f'/assets/{stem}.{asset.fingerprint}{ext}'
+    
+    def get(self, name):
+        self._refresh()
+        return self._assets.get(name)
+    
+    def url(self, name):
+        self._refresh()
+        return self._url(self._assets, name)
+    
+    def response(self, name, fingerprint=None):
+        """Serve an asset in the best encoding the client accepts.
+
+        Fingerprinted requests are cached for a year; anything else is
+        revalidated with its ETag, which differs per encoding.
+        """
+        asset = self.get(name)
+        if asset is None or (fingerprint is not None and fingerprint != asset.fingerprint):
+            return None
+        encoding = request.accept_encodings.best_match(
+            [e for e in self.ENCODINGS if e in asset.variants], default='identity'
+        )
+        response = Response(asset.variants[encoding], mimetype=asset.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        response.vary.add('Accept-Encoding')
+        response.set_etag(asset.etag if encoding == 'identity' else f'{asset.etag}-{encoding}')
+        if fingerprint is not None:
+            response.cache_control.public = True
+            response.cache_control.max_age = self.app.config['FILE_CACHE_MAX_AGE']
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response.make_conditional(request)
+
+asset_pipeline = AssetPipeline(app)
 
-def get_file_size_mb(filepath):
-    size_bytes = os.path.getsize(filepath)
-    return round(size_bytes / (1024 * 1024), 2)
+# App setup
+def create_app(config=None):
+    """Configure the app and its extensions and return it.
 
-def send_email(to_email, subject, body):
-    """Send email using Flask-Mail"""
-    try:
-        msg = Message(subject=subject, recipients=[to_email], body=body)
-        mail.send(msg)
-        return True
-    except Exception as e:
-        print(f"Email send failed: {e}")
-        return False
+    Touches neither the database nor the mail server, so worker processes
+    start quickly; run `flask init-db` once per deployment (and after
+    upgrades) to create the schema and the admin user.
+
+    Not a factory: routes and extensions hang off the module-level `app`,
+    so there is one app per process. The first call configures it (with
+    `config` overriding the environment); later calls return it unchanged
+    and raise RuntimeError if they pass a config.
+    """
+    if 'sqlalchemy' in app.extensions:
+        if config:
+            raise RuntimeError('create_app() was already called; config overrides go in the first call')
+        return app
+    load_config(config)
+    db.init_app(app)
+    session_interface = build_session_interface()
+    if session_interface is not None:
+        app.session_interface = session_interface
+    principal_cache.maxsize = app.config['USER_CACHE_SIZE']
+    principal_cache.ttl = app.config['USER_CACHE_TTL']
+    files_cache.max_bytes = app.config['FILES_CACHE_MAX_BYTES']
+    files_cache.ttl = app.config['FILES_CACHE_TTL']
+    files_cache.check_interval = app.config['FILES_CACHE_GENERATION_CHECK']
+    for folder in ('UPLOAD_FOLDER', 'BLOB_FOLDER', 'UPLOAD_TMP_FOLDER', 'THUMBNAIL_FOLDER'):
+        os.makedirs(app.config[folder], exist_ok=True)
+    app.extensions['file_store'] = build_storage()
+    return app
 
-# Initialize database
-with app.app_context():
+def init_db():
+    """Create or upgrade the schema, counters and search index, and the
+    admin user. Needs an app context; safe to run again."""
     db.create_all()
+    upgrade_schema()
+    if not StatCounter.query.first():
+        reconcile_stats()
+    app.config['SEARCH_INDEX_AVAILABLE'] = ensure_search_index()
     # Create admin user if doesn't exist
     admin = User.query.filter_by(username='admin').first()
     if not admin:
@@ -187,8 +2423,19 @@ with app.app_context():
 
 @app.route('/')
 def index():
-    with open("index.html", "r") as f:
-        return f.read()
+    return asset_pipeline.response('index.html')
+
+@app.route('/assets/<filename>')
+def asset(filename):
+    # /assets/<stem>.<fingerprint>.<ext> is immutable; /assets/<name> revalidates
+    stem, ext = os.path.splitext(filename)
+    stem, _, fingerprint = stem.rpartition('.')
+    response = asset_pipeline.response(stem + ext, fingerprint) if stem else None
+    if response is None:
+        response = asset_pipeline.response(filename)
+    if response is None:
+        return jsonify({'error': 'Asset not found'}), 404
+    return response
 
 @app.route('/register', methods=['POST'])
 def register():
@@ -269,8 +2516,9 @@ def user_info():
     if 'user_id' not in session:
         return jsonify({'logged_in': False}), 200
     
-    user = User.query.get(session['user_id'])
-    if not user:
+    # Counts change with every upload, so read the row itself, not the cache
+    user = db.session.get(User, session['user_id'])
+    if not user or not user.is_active:
         session.clear()
         return jsonify({'logged_in': False}), 200
     
@@ -282,6 +2530,7 @@ def user_info():
 @app.route('/upload', methods=['POST'])
 @require_login
 def upload_file():
+    ingested = None
     try:
         file = request.files.get('pdf')
         category = request.form.get('category', 'Other')
@@ -297,123 +2546,705 @@ def upload_file():
         if category not in CATEGORIES:
             category = 'Other'
         
-        # Generate unique filename
         original_filename = secure_filename(file.filename)
-        timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f"{timestamp}_{original_filename}"
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
-        # Save file
-        file.save(filepath)
-        
-        # Create database record
-        file_record = File(
-            filename=filename,
-            original_name=original_filename,
-            filepath=filepath,
-            size_mb=get_file_size_mb(filepath),
-            category=category,
-            description=description,
-            tags=tags,
-            user_id=session['user_id']
-        )
         
-        # Update user stats
-        user = User.query.get(session['user_id'])
-        user.uploads_count += 1
+        # Stream to disk while hashing, then file the bytes under their digest
+        ingested = ingest_pdf(file.stream)
         
-        db.session.add(file_record)
+        # Create database record and update user stats
+        file_record = create_file(
+            original_filename, ingested, category, description, tags, session['user_id']
+        )
         db.session.commit()
+        pdf_processor.submit(file_record)
         
         return jsonify({
             'message': 'Upload successful', 
-            'filename': filename,
+            'filename': file_record.filename,
             'original_name': original_filename
         }), 200
         
+    except Exception as e:
+        db.session.rollback()
+        if ingested:
+            discard_ingested(ingested)  # Left unreferenced by the rollback
+        return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+
+def _ingest_source(open_stream, max_bytes):
+    stream = open_stream()
+    try:
+        return ingest_pdf(stream, max_bytes)
+    finally:
+        stream.close()
+
+@app.route('/upload/batch', methods=['POST'])
+@require_login
+def upload_batch():
+    # Batches may be larger than a single upload (per-request limit, Flask 3.1+)
+    request.max_content_length = app.config['MAX_BATCH_UPLOAD_LENGTH']
+    archive = None
+    try:
+        category = request.form.get('category', 'Other')
+        description = request.form.get('description', '').strip()
+        tags = request.form.get('tags', '').strip()
+        if category not in CATEGORIES:
+            category = 'Other'
+        
+        # Accept any number of `pdfs` parts and/or one zip `archive`
+        sources = []
+        for file in request.files.getlist('pdfs'):
+            if file and file.filename:
+                sources.append((file.filename, lambda file=file: file.stream))
+        archive_upload = request.files.get('archive')
+        if archive_upload and archive_upload.filename:
+            archive = zipfile.ZipFile(archive_upload.stream)
+            for info in archive.infolist():
+                # Skip macOS resource forks (__MACOSX/, ._name) and other hidden entries
+                parts = info.filename.split('/')
+                if info.is_dir() or parts[0] == '__MACOSX' or any(part.startswith('.') for part in parts):
+                    continue
+                sources.append((parts[-1], functools.partial(archive.open, info)))
+        
+        if not sources:
+            return jsonify({'error': 'No files provided'}), 400
+        if len(sources) > app.config['MAX_BATCH_FILES']:
+            return jsonify({'error': f'At most {app.config["MAX_BATCH_FILES"]} files per batch'}), 400
+        
+        # Hash the files to temp files in parallel; DB work stays on this thread
+        results = [{'name': name} for name, _ in sources]
+        ingested = {}
+        with ThreadPoolExecutor(max_workers=app.config['UPLOAD_BATCH_WORKERS']) as pool:
+            futures = {}
+            for i, (name, open_stream) in enumerate(sources):
+                if not name.lower().endswith('.pdf'):
+                    results[i].update(status='error', error='Only PDF files are allowed')
+                    continue
+                futures[i] = pool.submit(_ingest_source, open_stream, app.config['MAX_UPLOAD_FILE_SIZE'])
+            for i, future in futures.items():
+                try:
+                    ingested[i] = future.result()
+                except Exception as e:
+                    results[i].update(status='error', error=str(e))
+        
+        # One transaction for every row, blob reference and the user's count
+        refs = collections.Counter(item['digest'] for item in ingested.values())
+        sizes = {item['digest']: item['size_bytes'] for item in ingested.values()}
+        for digest, count in refs.items():
+            reference_blob(digest, sizes[digest], count)
+        records = {}
+        for i, item in ingested.items():
+            original_name = secure_filename(sources[i][0]) or 'document.pdf'
+            records[i] = new_file_record(original_name, item, category, description, tags, session['user_id'])
+        try:
+            for item in ingested.values():
+                store_blob(item)
+            if records:
+                db.session.add_all(records.values())
+                User.query.filter_by(id=session['user_id']).update(
+                    {User.uploads_count: User.uploads_count + len(records)}
+                )
+                db.session.flush()
+                for i, record in records.items():
+                    results[i].update(status='ok', id=record.id, filename=record.filename,
+                                      original_name=record.original_name)
+            db.session.commit()
+        except Exception:
+            # Nothing references the bytes stored above; drop them (and
+            # the temp files not yet moved) unless another file shares them
+            db.session.rollback()
+            for item in ingested.values():
+                discard_ingested(item)
+            raise
+        for record in records.values():
+            pdf_processor.submit(record)
+        
+        return jsonify({
+            'message': f'Uploaded {len(records)} of {len(sources)} files',
+            'results': results
+        }), 200 if records else 400
+        
+    except zipfile.BadZipFile:
+        return jsonify({'error': 'Archive is not a valid zip file'}), 400
+    except HTTPException:
+        raise  # e.g. 413 for a body over MAX_BATCH_UPLOAD_LENGTH
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+    finally:
+        if archive is not None:
+            archive.close()
+
+def cleanup_expired_uploads():
+    """Delete expired resumable uploads and stray temp files; returns how many were removed"""
+    now = datetime.datetime.utcnow()
+    removed = 0
+    for upload in UploadSession.query.filter(UploadSession.expires_at < now).all():
+        if os.path.exists(upload.part_path):
+            os.remove(upload.part_path)
+        db.session.delete(upload)
+        removed += 1
+    db.session.commit()
+    # Leftovers from interrupted single uploads (stream_to_temp)
+    cutoff = time.time() - app.config['RESUMABLE_UPLOAD_TTL']
+    with os.scandir(app.config['UPLOAD_TMP_FOLDER']) as entries:
+        for entry in entries:
+            if entry.name.endswith('.part') and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+    return removed
+
+def get_upload_session(upload_id):
+    upload = db.session.get(UploadSession, upload_id)
+    if not upload or upload.user_id != session['user_id'] or upload.expires_at < datetime.datetime.utcnow():
+        return None
+    return upload
+
+@app.route('/uploads', methods=['POST'])
+@require_login
+def create_upload_session():
+    try:
+        data = request.get_json()
+        filename = data.get('filename', '').strip()
+        category = data.get('category', 'Other')
+        try:
+            total_size = int(data.get('size', 0))
+        except (TypeError, ValueError):
+            total_size = 0
+        
+        if not filename:
+            return jsonify({'error': 'No file provided'}), 400
+        if not filename.lower().endswith('.pdf'):
+            return jsonify({'error': 'Only PDF files are allowed'}), 400
+        if total_size <= 0:
+            return jsonify({'error': 'File size is required'}), 400
+        if total_size > app.config['MAX_RESUMABLE_UPLOAD_SIZE']:
+            return jsonify({'error': f'File exceeds {bytes_to_mb(app.config["MAX_RESUMABLE_UPLOAD_SIZE"])} MB'}), 413
+        if category not in CATEGORIES:
+            category = 'Other'
+        
+        cleanup_expired_uploads()
+        
+        upload = UploadSession(
+            id=secrets.token_hex(16),
+            user_id=session['user_id'],
+            original_name=secure_filename(filename) or 'document.pdf',
+            category=category,
+            description=data.get('description', '').strip(),
+            tags=data.get('tags', '').strip(),
+            total_size=total_size,
+            expires_at=datetime.datetime.utcnow() + datetime.timedelta(seconds=app.config['RESUMABLE_UPLOAD_TTL'])
+        )
+        open(upload.part_path, 'wb').close()
+        db.session.add(upload)
+        db.session.commit()
+        
+        return jsonify(upload.to_dict()), 201
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to start upload: {str(e)}'}), 500
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+@require_login
+def upload_session_status(upload_id):
+    upload = get_upload_session(upload_id)
+    if not upload:
+        return jsonify({'error': 'Upload not found'}), 404
+    response = jsonify(upload.to_dict())
+    response.headers['Upload-Offset'] = str(upload.received)
+    return response
+
+def lock_part_file(f):
+    """Take an exclusive lock on an open part file without waiting; False if
+    another request holds it"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+@require_login
+def upload_chunk(upload_id):
+    try:
+        upload = get_upload_session(upload_id)
+        if not upload:
+            return jsonify({'error': 'Upload not found'}), 404
+        
+        try:
+            offset = int(request.headers.get('Upload-Offset', request.args.get('offset', '')))
+        except ValueError:
+            return jsonify({'error': 'Upload-Offset header is required'}), 400
+        if offset != upload.received:
+            # Client is out of sync (e.g. a chunk was lost); it should resume from here
+            return jsonify({'error': 'Offset mismatch', 'offset': upload.received}), 409
+        
+        # Append straight from the request stream, dropping any bytes left
+        # over from a chunk that failed part-way
+        chunk_size = app.config['UPLOAD_CHUNK_SIZE']
+        received = offset
+        with open(upload.part_path, 'r+b') as f:
+            # One writer per session, across threads and worker processes;
+            # the lock is released when the file is closed
+            if not lock_part_file(f):
+                return jsonify({'error': 'Another chunk is being written', 'offset': offset}), 409
+            db.session.refresh(upload)  # A request that held the lock may have moved on
+            if offset != upload.received:
+                return jsonify({'error': 'Offset mismatch', 'offset': upload.received}), 409
+            f.truncate(offset)
+            f.seek(offset)
+            while True:
+                chunk = request.stream.read(chunk_size)
+                if not chunk:
+                    break
+                if received + len(chunk) > upload.total_size:
+                    f.truncate(offset)
+                    return jsonify({'error': 'Chunk exceeds declared file size', 'offset': offset}), 400
+                f.write(chunk)
+                received += len(chunk)
+            
+            # Only advance from the offset this chunk was written at
+            claimed = UploadSession.query.filter_by(id=upload.id, received=offset).update({
+                UploadSession.received: received,
+                UploadSession.expires_at: datetime.datetime.utcnow() + datetime.timedelta(
+                    seconds=app.config['RESUMABLE_UPLOAD_TTL'])
+            }, synchronize_session=False)
+            db.session.commit()
+        if not claimed:
+            return jsonify({'error': 'Offset mismatch', 'offset': upload.received}), 409
+        
+        response = jsonify(upload.to_dict())
+        response.headers['Upload-Offset'] = str(received)
+        return response
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+@require_login
+def complete_upload(upload_id):
+    try:
+        upload = get_upload_session(upload_id)
+        if not upload:
+            return jsonify({'error': 'Upload not found'}), 404
+        if upload.received != upload.total_size:
+            return jsonify({'error': 'Upload is incomplete', 'offset': upload.received}), 409
+        
+        digest, size_bytes = hash_file(upload.part_path)
+        ingested = ingest_temp_file(upload.part_path, digest, size_bytes)
+        try:
+            file_record = create_file(
+                upload.original_name, ingested, upload.category,
+                upload.description, upload.tags, upload.user_id
+            )
+            db.session.delete(upload)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            if not os.path.exists(upload.part_path):
+                # The bytes already moved into the blob store, so a retry
+                # couldn't hash them: end the session and drop the blob
+                # unless another file shares it
+                db.session.delete(upload)
+                db.session.commit()
+                discard_ingested(ingested)
+            raise
+        pdf_processor.submit(file_record)
+        
+        return jsonify({
+            'message': 'Upload successful',
+            'filename': file_record.filename,
+            'original_name': file_record.original_name
+        }), 200
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
 
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+@require_login
+def abort_upload(upload_id):
+    try:
+        upload = get_upload_session(upload_id)
+        if not upload:
+            return jsonify({'error': 'Upload not found'}), 404
+        if os.path.exists(upload.part_path):
+            os.remove(upload.part_path)
+        db.session.delete(upload)
+        db.session.commit()
+        return jsonify({'message': 'Upload cancelled'})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to cancel upload: {str(e)}'}), 500
+
+FILE_SORTS = ('recent', 'trending', 'popular')
+
 @app.route('/files')
 def list_files():
     try:
         category = request.args.get('category')
         search = request.args.get('search', '').strip()
         featured_only = request.args.get('featured') == 'true'
+        sort = request.args.get('sort', 'recent')
+        # all=true keeps the original unpaginated response for older clients
+        paginate = request.args.get('all') != 'true'
         
-        query = File.query
-        
-        if category and category != 'all':
-            query = query.filter(File.category == category)
+        try:
+            if sort not in FILE_SORTS:
+                raise ValueError(f'sort must be one of {", ".join(FILE_SORTS)}')
+            fields = parse_file_fields(request.args.get('fields'))
+            limit = parse_limit(
+                request.args.get('limit'),
+                app.config['FILES_PAGE_SIZE'],
+                app.config['FILES_MAX_PAGE_SIZE']
+            )
+            cursor = decode_cursor(request.args['cursor']) if request.args.get('cursor') else None
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': f'Invalid request: {str(e)}'}), 400
         
-        if search:
+        # The response depends only on these, never on who is asking
+        cache_key = (
+            category if category and category != 'all' else None,
+            search,
+            featured_only,
+            sort,
+            limit if paginate else None,
+            request.args.get('cursor') or None,
+            tuple(sorted(fields)) if fields else None
+        )
+        if files_cache.max_bytes > 0:
+            generation = files_cache.generation()
+            cached = files_cache.get(cache_key, generation)
+            if cached is None:
+                response = app.make_response(
+                    query_files(category, search, featured_only, paginate, fields, limit, cursor, sort)
+                )
+                if response.status_code != 200:
+                    return response
+                body = response.get_data()
+                cached = (hashlib.sha256(body).hexdigest()[:32], body)
+                files_cache.set(cache_key, generation, *cached)
+            response = Response(cached[1], mimetype='application/json')
+            response.set_etag(cached[0])
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+        return query_files(category, search, featured_only, paginate, fields, limit, cursor, sort)
+    except Exception as e:
+        return jsonify({'files': [], 'categories': CATEGORIES, 'error': str(e)})
+
+def filter_files(query, category, search, featured_only, with_rank=True):
+    """Apply the /files filters; returns (query, ranked), where ranked means
+    the query has an FTS rank column to order by"""
+    if category and category != 'all':
+        query = query.filter(File.category == category)
+    
+    ranked = False
+    if search:
+        match = build_search_query(search)
+        if match and search_index_available():
+            query = query.join(search_index, search_index.c.rowid == File.id).filter(
+                text(f'{SEARCH_INDEX_TABLE} MATCH :search_match').bindparams(search_match=match)
+            )
+            if with_rank:
+                query = query.add_columns(search_index.c.rank)
+                ranked = True
+        else:
             query = query.filter(
                 (File.original_name.contains(search)) |
                 (File.description.contains(search)) |
                 (File.tags.contains(search))
             )
-        
-        if featured_only:
-            query = query.filter(File.is_featured == True)
-        
-        files = query.order_by(File.upload_date.desc()).all()
-        
-        return jsonify({
-            'files': [file.to_dict() for file in files],
-            'categories': CATEGORIES
-        })
-    except Exception as e:
-        return jsonify({'files': [], 'categories': CATEGORIES, 'error': str(e)})
+    
+    if featured_only:
+        query = query.filter(File.is_featured == True)
+    return query, ranked
+
+def query_files(category, search, featured_only, paginate, fields, limit, cursor, sort='recent'):
+    """Build the /files response from the database"""
+    query = File.query
+    
+    if fields:
+        columns = {FILE_FIELD_COLUMNS[name] for name in fields} | {'id', 'upload_date'}
+        if sort == 'popular':
+            columns.add('download_count')
+        query = query.options(load_only(*[getattr(File, name) for name in columns]))
+    if not fields or 'uploaded_by' in fields:
+        query = query.options(with_uploader())
+    
+    # Search relevance only orders the default sort. Trending filters on the
+    # ranking's copy of the category instead, so its index drives the query.
+    query, ranked = filter_files(
+        query, None if sort == 'trending' else category, search, featured_only, with_rank=sort == 'recent'
+    )
+    
+    # Keyset pagination: (rank, id) for ranked search results, (score, id)
+    # for trending, (download_count, id) for popular and (upload_date, id)
+    # otherwise; all of these orders are total.
+    scored = ranked or sort == 'trending'
+    try:
+        if sort == 'trending':
+            # Only files with a ranking row are listed
+            query = query.join(FileRanking, FileRanking.file_id == File.id).add_columns(FileRanking.score)
+            if category and category != 'all':
+                query = query.filter(FileRanking.category == category)
+            if cursor:
+                score, last_id = float(cursor[0]), int(cursor[1])
+                query = query.filter(
+                    (FileRanking.score < score) |
+                    ((FileRanking.score == score) & (FileRanking.file_id < last_id))
+                )
+            query = query.order_by(FileRanking.score.desc(), FileRanking.file_id.desc())
+        elif sort == 'popular':
+            if cursor:
+                downloads, last_id = int(cursor[0]), int(cursor[1])
+                query = query.filter(
+                    (File.download_count < downloads) |
+                    ((File.download_count == downloads) & (File.id < last_id))
+                )
+            query = query.order_by(File.download_count.desc(), File.id.desc())
+        elif ranked:
+            if cursor:
+                rank, last_id = float(cursor[0]), int(cursor[1])
+                query = query.filter(
+                    (search_index.c.rank > rank) |
+                    ((search_index.c.rank == rank) & (File.id < last_id))
+                )
+            query = query.order_by(search_index.c.rank, File.id.desc())
+        else:
+            if cursor:
+                upload_date = datetime.datetime.fromisoformat(cursor[0])
+                last_id = int(cursor[1])
+                query = query.filter(
+                    (File.upload_date < upload_date) |
+                    ((File.upload_date == upload_date) & (File.id < last_id))
+                )
+            query = query.order_by(File.upload_date.desc(), File.id.desc())
+    except (ValueError, TypeError, IndexError):
+        return jsonify({'error': str(InvalidCursor())}), 400
+    
+    if paginate:
+        rows = query.limit(limit + 1).all()
+    else:
+        rows = query.all()
+    
+    next_cursor = None
+    if paginate and len(rows) > limit:
+        rows = rows[:limit]
+        if scored:
+            last_file, last_value = rows[-1]
+            next_cursor = encode_cursor([last_value, last_file.id])
+        elif sort == 'popular':
+            next_cursor = encode_cursor([rows[-1].download_count or 0, rows[-1].id])
+        else:
+            next_cursor = encode_cursor([rows[-1].upload_date.isoformat(), rows[-1].id])
+    
+    files = [row[0] for row in rows] if scored else rows
+    
+    response = {
+        'files': [file.to_dict(fields) for file in files],
+        'categories': CATEGORIES
+    }
+    if paginate:
+        response['next_cursor'] = next_cursor
+    return jsonify(response)
 
 @app.route('/download/<int:file_id>')
 @require_login
 def download_file(file_id):
     try:
         file_record = File.query.get_or_404(file_id)
+        response = send_pdf(file_record, as_attachment=True, public=False)
         
-        # Update download count
-        file_record.download_count += 1
-        user = User.query.get(session['user_id'])
-        user.downloads_count += 1
-        db.session.commit()
+        # Count full downloads and the first range of resumed/partial ones,
+        # not revalidations or later ranges of the same download. Ranges are
+        # read from the request since offloaded responses are always 200.
+        first_fetch = request.range is None or request.range.ranges[0][0] == 0
+        if response.status_code in (200, 206) and first_fetch:
+            download_counter.record(file_record.id, session['user_id'])
         
-        return send_from_directory(
-            app.config['UPLOAD_FOLDER'], 
-            file_record.filename, 
-            as_attachment=True,
-            download_name=file_record.original_name
-        )
+        return response
+    except Exception as e:
+        return jsonify({'error': f'Download failed: {str(e)}'}), 500
+
+class ZipStreamBuffer:
+    """Write-only file for zipfile that hands back what was written so far.
+
+    It has no seek or tell, so zipfile writes each entry's sizes and CRC in
+    a trailing data descriptor and never goes back to patch a header.
+    """
+    
+    def __init__(self):
+        self._chunks = []
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def bundle_name(original_name, used):
+    """Unique archive member name for a file, e.g. notes.pdf, notes (2).pdf"""
+    name = secure_filename(original_name or '') or 'file.pdf'
+    stem, ext = os.path.splitext(name)
+    candidate, n = name, 1
+    while candidate.lower() in used:
+        n += 1
+        candidate = f'{stem} ({n}){ext}'
+    used.add(candidate.lower())
+    return candidate
+
+def stream_bundle(entries, user_id):
+    """Yield a ZIP of (name, file_record) entries as it is built.
+
+    Each file is fetched just before it is written (remote bytes go through
+    the node's cache one at a time) and stored uncompressed in
+    UPLOAD_CHUNK_SIZE pieces, so neither memory nor cache use depends on the
+    size of the bundle. Files whose bytes are gone are listed in a final
+    MISSING.txt member; only the files written count as downloads.
+
+    Needs no app or request context: asgi.py resumes the generator on
+    worker threads, so file_records must arrive with their columns loaded.
+    """
+    chunk_size = app.config['UPLOAD_CHUNK_SIZE']
+    buffer = ZipStreamBuffer()
+    written = {}
+    missing = []
+    try:
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+            for name, file_record in entries:
+                opened = open_stored_copy(file_record)
+                if opened is None:
+                    missing.append(name)
+                    continue
+                source = opened[0]
+                with source:
+                    date_time = (file_record.upload_date or datetime.datetime.utcnow()).timetuple()[:6]
+                    info = zipfile.ZipInfo(name, date_time=date_time)
+                    info.compress_type = zipfile.ZIP_STORED
+                    info.file_size = os.fstat(source.fileno()).st_size
+                    with archive.open(info, 'w') as member:
+                        for chunk in iter(functools.partial(source.read, chunk_size), b''):
+                            member.write(chunk)
+                            data = buffer.drain()
+                            if data:
+                                yield data
+                written[file_record.id] = 1
+            if missing:
+                archive.writestr('MISSING.txt', 'These files are no longer available:\n' +
+                                 ''.join(f'{name}\n' for name in missing))
+        yield buffer.drain()
+    finally:
+        # Also on a dropped connection: the files sent in full still count
+        if written:
+            download_counter.record_many(written, user_id)
+
+@app.route('/download/bundle', methods=['GET', 'POST'])
+@require_login
+def download_bundle():
+    """Download several PDFs as one ZIP, streamed while it is built.
+
+    Files are chosen by `ids` (comma-separated in the query string, or a list
+    in a POSTed JSON body) or else by the /files filters category, search and
+    featured. At most MAX_BUNDLE_FILES files go in one bundle.
+    """
+    try:
+        params = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args
+        max_files = app.config['MAX_BUNDLE_FILES']
+        ids = params.get('ids')
+        query = File.query.options(load_only(
+            File.id, File.original_name, File.filename, File.content_hash, File.upload_date
+        ))
+        if ids:
+            try:
+                if isinstance(ids, str):
+                    ids = ids.split(',')
+                ids = list(dict.fromkeys(int(file_id) for file_id in ids))
+            except (ValueError, TypeError):
+                return jsonify({'error': 'ids must be a list of file ids'}), 400
+            if len(ids) > max_files:
+                return jsonify({'error': f'At most {max_files} files per bundle'}), 400
+            found = {record.id: record for record in query.filter(File.id.in_(ids))}
+            records = [found[file_id] for file_id in ids if file_id in found]
+        else:
+            search = str(params.get('search') or '').strip()
+            featured_only = params.get('featured') in (True, 'true')
+            query, ranked = filter_files(query, params.get('category'), search, featured_only)
+            if ranked:
+                query = query.order_by(search_index.c.rank, File.id.desc())
+            else:
+                query = query.order_by(File.upload_date.desc(), File.id.desc())
+            rows = query.limit(max_files + 1).all()
+            if len(rows) > max_files:
+                return jsonify({'error': f'More than {max_files} files match; narrow the filter'}), 400
+            records = [row[0] for row in rows] if ranked else rows
+        
+        if not records:
+            return jsonify({'error': 'No files to download'}), 404
+        used_names = set()
+        entries = [(bundle_name(record.original_name, used_names), record) for record in records]
+        
+        response = Response(stream_bundle(entries, session['user_id']), mimetype='application/zip')
+        response.headers.set('Content-Disposition', 'attachment', filename='edulibrary-bundle.zip')
+        response.cache_control.private = True
+        response.cache_control.no_store = True
+        return response
     except Exception as e:
         return jsonify({'error': f'Download failed: {str(e)}'}), 500
 
 @app.route('/preview/<int:file_id>')
 def preview_file(file_id):
     file_record = File.query.get_or_404(file_id)
-    return send_from_directory(app.config['UPLOAD_FOLDER'], file_record.filename)
+    return send_pdf(file_record)
+
+@app.route('/thumbnail/<int:file_id>')
+def thumbnail(file_id):
+    size = request.args.get('size', 'medium')
+    if size not in THUMBNAIL_SIZES:
+        return jsonify({'error': f'size must be one of {", ".join(THUMBNAIL_SIZES)}'}), 400
+    file_record = File.query.get_or_404(file_id)
+    path = file_record.has_thumbnail and file_store().fetch(thumbnail_key(file_record, size))
+    if not path:
+        return jsonify({'error': 'Thumbnail not available'}), 404
+    return send_file(
+        os.path.abspath(path),
+        mimetype='image/png',
+        conditional=True,
+        max_age=0  # Revalidate: the id may later name another file
+    )
 
 @app.route('/delete/<int:file_id>', methods=['DELETE'])
 @require_login
 def delete_file(file_id):
     try:
         file_record = File.query.get_or_404(file_id)
-        user = User.query.get(session['user_id'])
         
         # Check permissions
-        if file_record.user_id != session['user_id'] and not user.is_admin:
+        if file_record.user_id != session['user_id'] and not g.principal.is_admin:
             return jsonify({'error': 'You can only delete your own files'}), 403
         
-        # Delete physical file
-        if os.path.exists(file_record.filepath):
-            os.remove(file_record.filepath)
+        unused = release_blob(file_record)
         
         # Update user stats
         if file_record.user_id == session['user_id']:
-            user.uploads_count = max(0, user.uploads_count - 1)
+            User.query.filter(User.id == session['user_id'], User.uploads_count > 0).update(
+                {User.uploads_count: User.uploads_count - 1}, synchronize_session=False
+            )
         
         db.session.delete(file_record)
         db.session.commit()
         
+        # Delete the stored bytes and their thumbnails once no row references them
+        if unused:
+            purge_blob(file_record)
+        
         return jsonify({'message': 'File deleted successfully'})
     except Exception as e:
         db.session.rollback()
@@ -429,50 +3260,59 @@ def send_invite():
         
         if not email:
             return jsonify({'error': 'Email is required'}), 400
+        if not is_valid_email(email):
+            return jsonify({'error': 'Invalid email address'}), 400
         
-        # Generate invite code
-        invite_code = secrets.token_hex(16)
-        invite_link = f"{request.host_url}?invite={invite_code}&email={email}"
-        
-        # Store invitation
-        invitation = Invitation(
-            email=email,
-            invite_code=invite_code,
-            invited_by=session['username'],
-            message=message
-        )
-        db.session.add(invitation)
+        invitation, invite_link = build_invitation(email, message, session['username'])
         db.session.commit()
+        email_worker.wake()
         
-        # Send email
-        email_body = f"""
-Hello!
-
-{session['username']} has invited you to join EduLibrary - a collaborative digital library platform.
-
-{message if message else 'Join us to share and discover educational resources!'}
-
-Click the link below to join:
-{invite_link}
+        return jsonify({
+            'message': 'Invitation sent successfully!',
+            'invite_link': invite_link
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to send invitation: {str(e)}'}), 500
 
-Best regards,
-The EduLibrary Team
-        """
+@app.route('/send-invite/bulk', methods=['POST'])
+@require_admin
+def send_bulk_invites():
+    try:
+        data = request.get_json()
+        emails = data.get('emails', [])
+        message = data.get('message', '').strip()
         
-        if send_email(email, "You're invited to join EduLibrary!", email_body):
-            return jsonify({
-                'message': 'Invitation sent successfully!',
-                'invite_link': invite_link
-            }), 200
-        else:
-            return jsonify({
-                'message': 'Invitation created but email could not be sent. Check email configuration.',
-                'invite_link': invite_link
-            }), 200
+        if isinstance(emails, str):
+            emails = re.split(r'[\s,;]+', emails)
+        # Keep first occurrence order, drop blanks and duplicates
+        emails = list(dict.fromkeys(e.strip() for e in emails if isinstance(e, str) and e.strip()))
+        if not emails:
+            return jsonify({'error': 'At least one email is required'}), 400
+        if len(emails) > app.config['MAX_BULK_INVITES']:
+            return jsonify({'error': f'At most {app.config["MAX_BULK_INVITES"]} invitations per request'}), 400
+        
+        invites = []
+        skipped = []
+        for email in emails:
+            if not is_valid_email(email):
+                skipped.append(email)
+                continue
+            invitation, invite_link = build_invitation(email, message, session['username'])
+            invites.append({'email': email, 'invite_link': invite_link})
+        db.session.commit()
+        email_worker.wake()
+        
+        return jsonify({
+            'message': f'{len(invites)} invitation(s) queued for delivery',
+            'invites': invites,
+            'skipped': skipped
+        }), 200
         
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': f'Failed to send invitation: {str(e)}'}), 500
+        return jsonify({'error': f'Failed to send invitations: {str(e)}'}), 500
 
 @app.route('/support/tickets', methods=['GET', 'POST'])
 @require_login
@@ -494,7 +3334,6 @@ def support_tickets():
                 user_id=session['user_id']
             )
             db.session.add(ticket)
-            db.session.commit()
             
             # Send notification email to admin
             admin_email = os.getenv('ADMIN_EMAIL', 'admin@edulibrary.com')
@@ -508,7 +3347,9 @@ Description: {description}
 
 Please log in to the admin panel to respond.
             """
-            send_email(admin_email, f"New Support Ticket: {title}", email_body)
+            queue_email(admin_email, f"New Support Ticket: {title}", email_body)
+            db.session.commit()
+            email_worker.wake()
             
             return jsonify({'message': 'Support ticket created successfully'}), 200
         except Exception as e:
@@ -516,20 +3357,179 @@ Please log in to the admin panel to respond.
             return jsonify({'error': f'Failed to create ticket: {str(e)}'}), 500
     
     else:  # GET
-        user = User.query.get(session['user_id'])
-        if user.is_admin:
-            tickets = SupportTicket.query.order_by(SupportTicket.created_date.desc()).all()
-        else:
-            tickets = SupportTicket.query.filter_by(user_id=session['user_id']).order_by(SupportTicket.created_date.desc()).all()
+        # Newest first, paginated with next_cursor; filtered by status and priority
+        query = filter_tickets(request.args)
+        if not g.principal.is_admin:
+            query = query.filter(SupportTicket.user_id == session['user_id'])
+        try:
+            limit, cursor = parse_page_args(
+                request.args, app.config['ADMIN_PAGE_SIZE'], app.config['ADMIN_MAX_PAGE_SIZE']
+            )
+            tickets, next_cursor = newest_first_page(
+                query, SupportTicket.created_date, SupportTicket.id, limit, cursor
+            )
+        except InvalidCursor as e:
+            return jsonify({'error': str(e)}), 400
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': f'Invalid request: {str(e)}'}), 400
         
-        return jsonify({'tickets': [ticket.to_dict() for ticket in tickets]})
+        return jsonify({'tickets': [ticket.to_dict() for ticket in tickets], 'next_cursor': next_cursor})
+
+def filter_tickets(args):
+    """Tickets (with their user's name) matching the status and priority filters"""
+    query = SupportTicket.query.options(
+        joinedload(SupportTicket.user).load_only(User.id, User.username)
+    )
+    if args.get('status'):
+        query = query.filter(SupportTicket.status == args['status'])
+    if args.get('priority'):
+        query = query.filter(SupportTicket.priority == args['priority'])
+    return query
+
+def filter_users(args):
+    """Users matching the active filter ('true' or 'false')"""
+    query = User.query
+    active = args.get('active')
+    if active:
+        if active not in ('true', 'false'):
+            raise ValueError('active must be true or false')
+        query = query.filter(User.is_active == (active == 'true'))
+    return query
 
 # Admin Routes
 @app.route('/admin/users')
 @require_admin
 def admin_users():
-    users = User.query.order_by(User.join_date.desc()).all()
-    return jsonify({'users': [user.to_dict() for user in users]})
+    """Users, newest first, paginated with next_cursor"""
+    try:
+        limit, cursor = parse_page_args(
+            request.args, app.config['ADMIN_PAGE_SIZE'], app.config['ADMIN_MAX_PAGE_SIZE']
+        )
+        users, next_cursor = newest_first_page(filter_users(request.args), User.join_date, User.id, limit, cursor)
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': f'Invalid request: {str(e)}'}), 400
+    return jsonify({'users': [user.to_dict() for user in users], 'next_cursor': next_cursor})
+
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+EXPORT_TABLES = {
+    'users': (filter_users, User),
+    'tickets': (filter_tickets, SupportTicket),
+}
+
+def stream_export(query, model, export_format):
+    """Yield every row of `query` as NDJSON lines or CSV, a batch at a time.
+
+    Batches are keyed on id and each is read in its own transaction, so
+    neither memory use nor the snapshot held open grows with the table.
+    """
+    batch_size = app.config['EXPORT_BATCH_SIZE']
+    out = io.StringIO()
+    writer = None
+    last_id = 0
+    while True:
+        rows = query.filter(model.id > last_id).order_by(model.id).limit(batch_size).all()
+        for row in rows:
+            record = row.to_dict()
+            if export_format == 'ndjson':
+                out.write(json.dumps(record) + '\n')
+                continue
+            if writer is None:
+                writer = csv.DictWriter(out, fieldnames=list(record))
+                writer.writeheader()
+            writer.writerow(record)
+        if rows:
+            last_id = rows[-1].id
+        finished = len(rows) < batch_size
+        rows = row = None  # Let this batch go before the next one loads
+        db.session.rollback()  # Ends the read transaction; nothing is written here
+        yield out.getvalue()
+        if finished:
+            return
+        out.seek(0)
+        out.truncate()
+
+@app.route('/admin/export/<table>')
+@require_admin
+def admin_export(table):
+    """Stream a whole table (users or tickets) as NDJSON or CSV (format=),
+    with the same filters as its listing"""
+    if table not in EXPORT_TABLES:
+        return jsonify({'error': f'table must be one of {", ".join(EXPORT_TABLES)}'}), 404
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'format must be one of {", ".join(EXPORT_FORMATS)}'}), 400
+    filter_rows, model = EXPORT_TABLES[table]
+    try:
+        query = filter_rows(request.args)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid request: {str(e)}'}), 400
+    response = Response(stream_with_context(stream_export(query, model, export_format)),
+                        mimetype=EXPORT_FORMATS[export_format])
+    response.headers.set(
+        'Content-Disposition', 'attachment',
+        filename=f'{table}-{datetime.date.today().isoformat()}.{export_format}'
+    )
+    response.cache_control.private = True
+    response.cache_control.no_store = True
+    return response
+
+def parse_bulk_ids(data):
+    """Distinct ids from a bulk request's JSON body, in request order"""
+    ids = data.get('ids')
+    try:
+        if not isinstance(ids, list) or not ids:
+            raise ValueError
+        ids = list(dict.fromkeys(int(item_id) for item_id in ids))
+    except (ValueError, TypeError):
+        # Not int()'s message, which would echo the offending value back
+        raise ValueError('ids must be a non-empty list of ids') from None
+    if len(ids) > app.config['MAX_BULK_IDS']:
+        raise ValueError(f"At most {app.config['MAX_BULK_IDS']} ids per request")
+    return ids
+
+def bulk_update(model, ids, columns, apply):
+    """Load the `ids` rows of `model` (only `columns`) and call apply(row)
+    on each, in the current transaction. Rows go through the ORM so the
+    counter and cache events still fire. Returns (changed ids, missing ids).
+    """
+    rows = model.query.options(load_only(*columns)).filter(model.id.in_(ids)).all()
+    changed = [row.id for row in rows if apply(row)]
+    found = {row.id for row in rows}
+    return changed, [item_id for item_id in ids if item_id not in found]
+
+@app.route('/admin/users/status', methods=['POST'])
+@require_admin
+def bulk_user_status():
+    """Activate or deactivate many users in one transaction: {"ids": [...], "is_active": bool}.
+    Admin users are skipped."""
+    try:
+        data = request.get_json(silent=True) or {}
+        is_active = data.get('is_active')
+        try:
+            ids = parse_bulk_ids(data)
+            if not isinstance(is_active, bool):
+                raise ValueError('is_active must be true or false')
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': f'Invalid request: {str(e)}'}), 400
+        
+        skipped = []
+        def apply(user):
+            if user.is_admin:
+                skipped.append(user.id)
+                return False
+            if user.is_active == is_active:
+                return False
+            user.is_active = is_active
+            return True
+        
+        changed, missing = bulk_update(User, ids, (User.id, User.is_admin, User.is_active), apply)
+        db.session.commit()
+        return jsonify({'updated': changed, 'skipped': skipped, 'missing': missing})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to update users: {str(e)}'}), 500
 
 @app.route('/admin/users/<int:user_id>/toggle-status', methods=['POST'])
 @require_admin
@@ -565,6 +3565,68 @@ def toggle_featured_file(file_id):
         db.session.rollback()
         return jsonify({'error': f'Failed to update file: {str(e)}'}), 500
 
+@app.route('/admin/files/featured', methods=['POST'])
+@require_admin
+def bulk_featured_files():
+    """Feature or unfeature many files in one transaction: {"ids": [...], "is_featured": bool}"""
+    try:
+        data = request.get_json(silent=True) or {}
+        is_featured = data.get('is_featured')
+        try:
+            ids = parse_bulk_ids(data)
+            if not isinstance(is_featured, bool):
+                raise ValueError('is_featured must be true or false')
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': f'Invalid request: {str(e)}'}), 400
+        
+        def apply(file_record):
+            if file_record.is_featured == is_featured:
+                return False
+            file_record.is_featured = is_featured
+            return True
+        
+        changed, missing = bulk_update(File, ids, (File.id, File.is_featured), apply)
+        db.session.commit()
+        return jsonify({'updated': changed, 'missing': missing})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to update files: {str(e)}'}), 500
+
+TICKET_STATUSES = ('open', 'in-progress', 'resolved')
+
+@app.route('/admin/tickets/status', methods=['POST'])
+@require_admin
+def bulk_ticket_status():
+    """Set the status of many tickets in one transaction: {"ids": [...], "status": ...}.
+    Unlike responding to a ticket, this sends no email."""
+    try:
+        data = request.get_json(silent=True) or {}
+        status = data.get('status')
+        try:
+            ids = parse_bulk_ids(data)
+            if status not in TICKET_STATUSES:
+                raise ValueError(f'status must be one of {", ".join(TICKET_STATUSES)}')
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': f'Invalid request: {str(e)}'}), 400
+        
+        now = datetime.datetime.utcnow()
+        def apply(ticket):
+            if ticket.status == status:
+                return False
+            ticket.status = status
+            if status == 'resolved':
+                ticket.resolved_date = now
+            return True
+        
+        changed, missing = bulk_update(
+            SupportTicket, ids, (SupportTicket.id, SupportTicket.status, SupportTicket.resolved_date), apply
+        )
+        db.session.commit()
+        return jsonify({'updated': changed, 'missing': missing})
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Failed to update tickets: {str(e)}'}), 500
+
 @app.route('/admin/tickets/<int:ticket_id>/respond', methods=['POST'])
 @require_admin
 def respond_to_ticket(ticket_id):
@@ -582,8 +3644,6 @@ def respond_to_ticket(ticket_id):
         if status == 'resolved':
             ticket.resolved_date = datetime.datetime.utcnow()
         
-        db.session.commit()
-        
         # Send email to user
         email_body = f"""
 Hello {ticket.user.username},
@@ -595,43 +3655,165 @@ Status: {status}
 
 Thank you for using EduLibrary!
         """
-        send_email(ticket.user.email, f"Support Ticket Update: {ticket.title}", email_body)
+        queue_email(ticket.user.email, f"Support Ticket Update: {ticket.title}", email_body)
+        db.session.commit()
+        email_worker.wake()
         
         return jsonify({'message': 'Response sent successfully'})
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Failed to respond: {str(e)}'}), 500
 
+@app.route('/metrics')
+def metrics_endpoint():
+    token = app.config['METRICS_TOKEN']
+    if token:
+        if not secrets.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return jsonify({'error': 'Invalid metrics token'}), 401
+    elif request.remote_addr not in ('127.0.0.1', '::1') or \
+            'X-Forwarded-For' in request.headers or 'Forwarded' in request.headers:
+        # Without a token, only direct (unproxied) scrapes from this host
+        return jsonify({'error': 'Metrics are only served locally without METRICS_TOKEN'}), 403
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/analytics')
 @require_admin
 def analytics():
     try:
-        total_users = User.query.count()
-        active_users = User.query.filter_by(is_active=True).count()
-        total_files = File.query.count()
-        total_downloads = db.session.query(db.func.sum(File.download_count)).scalar() or 0
-        
-        # Category distribution
-        categories_data = db.session.query(
-            File.category, 
-            db.func.count(File.id)
-        ).group_by(File.category).all()
-        
-        # Recent activity
-        recent_uploads = File.query.order_by(File.upload_date.desc()).limit(10).all()
+        data = analytics_cache.get('analytics')
+        if data is None:
+            counters = {counter.name: counter.value for counter in StatCounter.query.all()}
+            
+            # Recent activity
+            recent_uploads = File.query.options(with_uploader()).order_by(File.upload_date.desc()).limit(10).all()
+            
+            data = {
+                'stats': {
+                    'total_users': counters.get(STAT_USERS, 0),
+                    'active_users': counters.get(STAT_ACTIVE_USERS, 0),
+                    'total_files': counters.get(STAT_FILES, 0),
+                    'total_downloads': counters.get(STAT_DOWNLOADS, 0)
+                },
+                # Category distribution
+                'categories': [
+                    {'category': name[len(STAT_CATEGORY_PREFIX):], 'count': count}
+                    for name, count in sorted(counters.items())
+                    if name.startswith(STAT_CATEGORY_PREFIX) and count > 0
+                ],
+                'recent_uploads': [file.to_dict() for file in recent_uploads]
+            }
+            analytics_cache.set('analytics', data, app.config['ANALYTICS_CACHE_TTL'])
         
-        return jsonify({
-            'stats': {
-                'total_users': total_users,
-                'active_users': active_users,
-                'total_files': total_files,
-                'total_downloads': total_downloads
-            },
-            'categories': [{'category': cat, 'count': count} for cat, count in categories_data],
-            'recent_uploads': [file.to_dict() for file in recent_uploads]
-        })
+        stats = dict(data['stats'], total_downloads=data['stats']['total_downloads'] + download_counter.pending_total())
+        return jsonify(dict(data, stats=stats))
     except Exception as e:
         return jsonify({'error': f'Failed to load analytics: {str(e)}'}), 500
 
+@app.cli.command('init-db')
+def init_db_command():
+    """Create the database schema and the admin user"""
+    init_db()
+    click.echo("Database initialized")
+
+@app.cli.command('rebuild-search-index')
+@click.option('--content/--no-content', default=True, help='Re-extract PDF text into the index.')
+def rebuild_search_index(content):
+    """Rebuild the full-text search index from the file table"""
+    if not search_index_available():
+        raise click.ClickException('Full-text search requires SQLite with FTS5; run `flask init-db` first')
+    db.session.execute(text(f"DELETE FROM {SEARCH_INDEX_TABLE}"))
+    count = 0
+    for file_record in File.query.order_by(File.id).yield_per(500):
+        row = _search_row(file_record)
+        filepath = file_store().fetch(storage_key(file_record.filename)) if content else None
+        row['content'] = pdfworker.extract_text(
+            filepath, app.config['SEARCH_INDEX_MAX_PAGES']
+        ) if filepath else ''
+        db.session.execute(text(
+            f"INSERT INTO {SEARCH_INDEX_TABLE}(rowid, original_name, description, tags, content) "
+            "VALUES (:rowid, :original_name, :description, :tags, :content)"
+        ), row)
+        count += 1
+    db.session.execute(text(f"INSERT INTO {SEARCH_INDEX_TABLE}({SEARCH_INDEX_TABLE}) VALUES ('optimize')"))
+    db.session.commit()
+    click.echo(f"Indexed {count} files")
+
+@app.cli.command('deliver-email')
+def deliver_email():
+    """Send all queued email that is due, then exit"""
+    sent = 0
+    while True:
+        batch = email_worker.deliver_batch()
+        if not batch:
+            break
+        sent += batch
+    click.echo(f"Processed {sent} queued emails")
+
+@app.cli.command('reconcile-stats')
+def reconcile_stats_command():
+    """Recompute the analytics counters from the base tables"""
+    drift = reconcile_stats()
+    analytics_cache.clear()
+    for name, (old, new) in sorted(drift.items()):
+        click.echo(f"{name}: {old} -> {new}")
+    click.echo(f"Corrected {len(drift)} counters")
+
+@app.cli.command('process-pdfs')
+@click.option('--all', 'process_all', is_flag=True, help='Reprocess files that are already done.')
+def process_pdfs(process_all):
+    """Backfill thumbnails, page counts and text for existing files"""
+    if app.config['PDF_PROCESSING_WORKERS'] <= 0:
+        raise click.ClickException('PDF_PROCESSING_WORKERS is 0')
+    query = File.query.order_by(File.id)
+    if not process_all:
+        query = query.filter((File.processing_status != 'done') | (File.processing_status.is_(None)))
+    count = 0
+    for file_record in query.yield_per(500):
+        pdf_processor.submit(file_record)
+        count += 1
+    pdf_processor.shutdown()
+    click.echo(f"Processed {count} files")
+
+@app.cli.command('optimize-pdfs')
+@click.option('--retry', is_flag=True, help='Also retry blobs whose optimization failed.')
+def optimize_pdfs(retry):
+    """Write compacted copies of stored PDFs that have not been optimized yet"""
+    if app.config['PDF_PROCESSING_WORKERS'] <= 0:
+        raise click.ClickException('PDF_PROCESSING_WORKERS is 0')
+    query = Blob.query.order_by(Blob.digest)
+    if retry:
+        query = query.filter((Blob.optimize_status == 'failed') | (Blob.optimize_status.is_(None)))
+    else:
+        query = query.filter(Blob.optimize_status.is_(None))
+    count = 0
+    for (digest,) in query.with_entities(Blob.digest).yield_per(500):
+        pdf_processor.submit_optimization(digest)
+        count += 1
+    pdf_processor.shutdown()
+    kept, saved = db.session.query(
+        db.func.count(), db.func.coalesce(db.func.sum(Blob.size_bytes - Blob.optimized_size_bytes), 0)
+    ).filter(Blob.optimize_status == 'done').one()
+    click.echo(f"Optimized {count} blobs; {kept} stored copies save {bytes_to_mb(saved)} MB in total")
+
+@app.cli.command('refresh-rankings')
+def refresh_rankings():
+    """Compact the download log and recompute trending scores now"""
+    click.echo(f"Ranked {ranking_updater.refresh()} files")
+
+@app.cli.command('cleanup-sessions')
+def cleanup_sessions():
+    """Delete expired server-side sessions"""
+    if not isinstance(app.session_interface, ServerSideSessionInterface):
+        raise click.ClickException('SESSION_BACKEND is cookie; nothing to clean up')
+    click.echo(f"Removed {app.session_interface.store.purge_expired()} expired sessions")
+
+@app.cli.command('cleanup-uploads')
+def cleanup_uploads():
+    """Remove expired resumable uploads and stray temp files"""
+    click.echo(f"Removed {cleanup_expired_uploads()} expired uploads")
+
 if __name__ == '__main__':
+    create_app()
+    with app.app_context():
+        init_db()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,143 @@
+"""ASGI entry point for EduLibrary.
+
+    flask --app 'app:create_app()' init-db    (once per deployment)
+    uvicorn asgi:application --workers 2
+
+Most routes run unchanged through asgiref's WsgiToAsgi, which buffers the
+request body before calling Flask in a worker thread, so slow uploads no
+longer tie up a thread. File responses (downloads, bundles, previews,
+thumbnails) are handled natively: Flask still does auth, counting, ETags and
+Range handling in a thread, but the body is then streamed from the event
+loop, with only each chunk read offloaded. A client that downloads slowly
+costs a coroutine, not a thread, so one process can hold thousands of
+downloads open. Email already goes through the background queue and never
+blocks a request.
+"""
+import asyncio
+import sys
+import urllib.parse
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.exceptions import HTTPException
+
+from app import create_app, download_counter
+
+app = create_app()
+
+# Endpoints whose response bodies are streamed from the event loop
+STREAMING_ENDPOINTS = {'download_file', 'download_bundle', 'preview_file', 'thumbnail'}
+
+
+def build_environ(scope):
+    """WSGI environ for a bodiless ASGI HTTP request"""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': _EMPTY_INPUT,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        name = name.decode('latin1')
+        value = value.decode('latin1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+class _EmptyInput:
+    def read(self, size=-1):
+        return b''
+
+    def readline(self, size=-1):
+        return b''
+
+    def __iter__(self):
+        return iter(())
+
+
+_EMPTY_INPUT = _EmptyInput()
+
+
+def dispatch(environ):
+    """Run the Flask request in full (session save and teardown included) and
+    return (status, headers, body iterator, response) without reading the body"""
+    with app.request_context(environ):
+        try:
+            response = app.full_dispatch_request()
+        except Exception as e:
+            response = app.handle_exception(e)
+    headers = response.get_wsgi_headers(environ)
+    body = response.get_app_iter(environ)
+    return response.status_code, headers.to_wsgi_list(), iter(body), response
+
+
+class Application:
+    def __init__(self, flask_app):
+        self.flask_app = flask_app
+        self.wsgi = WsgiToAsgi(flask_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http' and self.is_streaming(scope):
+            await self.stream(scope, send)
+        else:
+            await self.wsgi(scope, receive, send)
+
+    def is_streaming(self, scope):
+        if scope['method'] not in ('GET', 'HEAD'):
+            return False
+        adapter = self.flask_app.url_map.bind('localhost')
+        try:
+            endpoint, _ = adapter.match(urllib.parse.unquote(scope['path']), method=scope['method'])
+        except HTTPException:
+            return False
+        return endpoint in STREAMING_ENDPOINTS
+
+    async def stream(self, scope, send):
+        status, headers, body, response = await asyncio.to_thread(dispatch, build_environ(scope))
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': status,
+                'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers],
+            })
+            while True:
+                chunk = await asyncio.to_thread(next, body, None)
+                if chunk is None:
+                    break
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            await asyncio.to_thread(response.close)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.to_thread(download_counter.flush)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = Application(app)
@@ -0,0 +1,1229 @@
+"""Benchmarks and sanity checks for EduLibrary.
+
+Each scenario runs against a throwaway SQLite database and upload folder, so
+it never touches edulibrary.db. Usage:
+
+    python bench.py queries
+    python bench.py serving
+    python bench.py counters --requests 2000 --threads 8
+    python bench.py email --invites 200      (needs aiosmtpd)
+    python bench.py db --files 50000
+    python bench.py batch --batch-files 200 --file-kb 256
+    python bench.py catalog --files 5000 --requests 4000 --write-ratio 0.01
+    python bench.py endpoints --files 5000 --pdfs 20 --requests 500 --output run.json
+    python bench.py endpoints --server --workers 4 --compare baseline.json
+    python bench.py concurrency --clients 500 --workers 2 --threads 8   (needs uvicorn)
+    python bench.py startup --repeat 10
+    python bench.py rankings --files 50000
+    python bench.py storage --pdfs 20 --file-kb 512   (needs moto, or S3_ENDPOINT_URL for MinIO)
+    python bench.py admin --files 50000
+
+The endpoints scenario is the general load test: it seeds users, files,
+tickets and real (generated) PDFs, drives every main endpoint through the
+Flask test client and optionally a real multi-worker WSGI server (gunicorn
+if installed, otherwise Werkzeug's forking server), and reports requests/sec,
+p50/p95/p99 latency and SQL statements per request. --compare diffs the run
+against an earlier --output file and fails on regressions beyond --tolerance.
+
+The concurrency scenario holds --clients slow downloads open against the
+threaded WSGI server and then against asgi.py under uvicorn, timing /files
+while they are in flight, and checks a streamed bundle download on each.
+
+The storage scenario switches to the S3 backend (moto's in-process stand-in
+unless S3_ENDPOINT_URL and S3_BUCKET point at e.g. MinIO), uploads PDFs, and
+then downloads them from a second node with a cold cache smaller than the
+files, timing misses and hits and checking the cache stays within budget.
+"""
+import argparse
+import datetime
+import http.client
+import io
+import random
+import socket
+import statistics
+import subprocess
+import zipfile
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+WORKDIR = tempfile.mkdtemp(prefix='edulibrary-bench-')
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(WORKDIR, 'bench.db')}")
+# Outbound mail goes to a local stand-in SMTP server (see bench_email)
+os.environ.setdefault('MAIL_SERVER', '127.0.0.1')
+os.environ.setdefault('MAIL_PORT', '8025')
+os.environ.setdefault('MAIL_USE_TLS', 'false')
+# Background PDF processing would compete with the request paths measured here
+os.environ.setdefault('PDF_PROCESSING_WORKERS', '0')
+os.chdir(WORKDIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import event, insert, text  # noqa: E402
+
+import storage  # noqa: E402
+from app import (app, db, analytics_cache, download_counter, files_cache, principal_cache, ranking_updater,  # noqa: E402
+                 CATEGORIES, DownloadRollup, Invitation, OutboundEmail, User, File, SupportTicket, create_app, init_db,
+                 reconcile_stats)
+
+create_app()
+with app.app_context():
+    init_db()
+
+ADMIN_PASSWORD = 'admin123'
+
+
+class QueryCounter:
+    """Count SQL statements executed on the engine while active"""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _before_execute(self, *args):
+        self.count += 1
+
+    def __enter__(self):
+        event.listen(self.engine, 'before_cursor_execute', self._before_execute)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._before_execute)
+
+
+def seed(users, files_per_user, tickets_per_user):
+    """Insert synthetic users, files and tickets (no file bytes on disk)"""
+    start = User.query.count()
+    for i in range(start, start + users):
+        user = User(username=f'user{i}', email=f'user{i}@example.com', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        for j in range(files_per_user):
+            db.session.add(File(
+                filename=f'{i}_{j}.pdf',
+                original_name=f'Lecture notes {i}-{j}.pdf',
+                filepath=os.path.join(app.config['UPLOAD_FOLDER'], f'{i}_{j}.pdf'),
+                size_mb=1.0,
+                category='Science',
+                description='Synthetic benchmark file',
+                tags='bench,notes',
+                user_id=user.id
+            ))
+        for j in range(tickets_per_user):
+            db.session.add(SupportTicket(title=f'Ticket {i}-{j}', description='Help', user_id=user.id))
+    db.session.commit()
+
+
+def admin_client():
+    client = app.test_client()
+    response = client.post('/login', json={'username': 'admin', 'password': ADMIN_PASSWORD})
+    assert response.status_code == 200, response.get_json()
+    return client
+
+
+LISTING_ENDPOINTS = [
+    '/files',
+    '/files?all=true',
+    '/files?search=notes&all=true',
+    '/support/tickets',
+    '/analytics',
+]
+
+
+def bench_queries(args):
+    """Check each listing endpoint issues a constant number of queries"""
+    client = admin_client()
+    results = {}
+    for users in args.users:
+        with app.app_context():
+            seed(users, 2, 1)
+        for endpoint in LISTING_ENDPOINTS:
+            analytics_cache.clear()  # Measure the uncached path
+            files_cache.clear()
+            principal_cache.clear()
+            with app.app_context():
+                with QueryCounter(db.engine) as counter:
+                    response = client.get(endpoint)
+            assert response.status_code == 200, (endpoint, response.status_code)
+            results.setdefault(endpoint, {})[users] = counter.count
+    failures = [endpoint for endpoint, counts in results.items() if len(set(counts.values())) > 1]
+    return {'query_counts': results, 'failures': failures}
+
+
+def upload_pdf(client, name='bench.pdf', data=None, category='Science'):
+    data = data if data is not None else b'%PDF-1.4\n' + os.urandom(4096) + b'\n%%EOF\n'
+    response = client.post('/upload', data={
+        'pdf': (io.BytesIO(data), name),
+        'category': category
+    }, content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_json()
+    with app.app_context():
+        return File.query.order_by(File.id.desc()).first().id, data
+
+
+SERVING_HEADERS = ['Content-Type', 'Content-Length', 'ETag', 'Cache-Control',
+                   'Content-Disposition', 'X-Sendfile', 'X-Accel-Redirect']
+
+
+def bench_serving(args):
+    """Record the headers /preview and /download produce in each serving mode"""
+    client = admin_client()
+    file_id, data = upload_pdf(client)
+    results = {}
+    failures = []
+    for mode in ('direct', 'x-sendfile', 'x-accel-redirect'):
+        app.config['FILE_SERVING_MODE'] = mode
+        for endpoint in (f'/preview/{file_id}', f'/download/{file_id}'):
+            response = client.get(endpoint)
+            headers = {name: response.headers[name] for name in SERVING_HEADERS if name in response.headers}
+            results[f'{mode} {endpoint}'] = {'status': response.status_code, 'headers': headers,
+                                             'body_bytes': len(response.data)}
+            if mode == 'direct':
+                ok = response.data == data
+            elif mode == 'x-sendfile':
+                ok = not response.data and os.path.isfile(headers.get('X-Sendfile', ''))
+            else:
+                ok = not response.data and headers.get('X-Accel-Redirect', '').startswith(
+                    app.config['X_ACCEL_REDIRECT_PREFIX'])
+            if response.status_code != 200 or 'ETag' not in headers or not ok:
+                failures.append(f'{mode} {endpoint}')
+    app.config['FILE_SERVING_MODE'] = 'direct'
+    return {'serving': results, 'failures': failures}
+
+
+def bench_counters(args):
+    """Concurrent /download throughput with synchronous vs buffered counters"""
+    file_id, _ = upload_pdf(admin_client())
+    app.config['FILE_SERVING_MODE'] = 'x-accel-redirect'  # Measure counting, not byte copying
+    per_thread = args.requests // args.threads
+    results = {}
+    failures = []
+    for label, interval in (('synchronous', 0), ('buffered', 5)):
+        app.config['DOWNLOAD_FLUSH_INTERVAL'] = interval
+        with app.app_context():
+            before = db.session.get(File, file_id).download_count
+
+        def worker(_):
+            client = admin_client()
+            errors = 0
+            for _ in range(per_thread):
+                if client.get(f'/download/{file_id}').status_code != 200:
+                    errors += 1
+            return errors
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as pool:
+            errors = sum(pool.map(worker, range(args.threads)))
+        elapsed = time.perf_counter() - started
+        download_counter.flush()
+        with app.app_context():
+            counted = db.session.get(File, file_id).download_count - before
+        expected = per_thread * args.threads - errors
+        results[label] = {
+            'requests': per_thread * args.threads,
+            'errors': errors,
+            'requests_per_sec': round(per_thread * args.threads / elapsed, 1),
+            'counted': counted
+        }
+        if counted != expected:
+            failures.append(label)
+    app.config['FILE_SERVING_MODE'] = 'direct'
+    return {'counters': results, 'failures': failures}
+
+
+def bench_email(args):
+    """Bulk-invite latency and queued delivery against a local aiosmtpd server"""
+    from aiosmtpd.controller import Controller
+
+    class Recorder:
+        def __init__(self):
+            self.messages = 0
+            self.sessions = set()
+
+        async def handle_DATA(self, server, smtp_session, envelope):
+            self.messages += 1
+            self.sessions.add(id(smtp_session))
+            return '250 OK'
+
+    recorder = Recorder()
+    controller = Controller(recorder, hostname=app.config['MAIL_SERVER'], port=app.config['MAIL_PORT'])
+    controller.start()
+    try:
+        client = admin_client()
+        emails = [f'invitee{i}@example.com' for i in range(args.invites)]
+        started = time.perf_counter()
+        response = client.post('/send-invite/bulk', json={'emails': emails})
+        request_seconds = time.perf_counter() - started
+        assert response.status_code == 200, response.get_json()
+        deadline = time.monotonic() + 60
+        while recorder.messages < args.invites and time.monotonic() < deadline:
+            time.sleep(0.05)
+        delivered_seconds = time.perf_counter() - started
+    finally:
+        controller.stop()
+    with app.app_context():
+        sent = OutboundEmail.query.filter_by(status='sent').count()
+    return {
+        'email': {
+            'invites': args.invites,
+            'bulk_request_ms': round(request_seconds * 1000, 1),
+            'all_delivered_ms': round(delivered_seconds * 1000, 1),
+            'messages_received': recorder.messages,
+            'smtp_sessions': len(recorder.sessions),
+            'rows_marked_sent': sent
+        },
+        'failures': [] if recorder.messages == args.invites == sent else ['email']
+    }
+
+
+def seed_bulk(files, tickets, invitations, users=50):
+    """Fast bulk seed through Core inserts (skips mapper events and file bytes)"""
+    rng = random.Random(42)
+    start = datetime.datetime(2020, 1, 1)
+    user_rows = [{'username': f'bulk{i}', 'email': f'bulk{i}@example.com', 'password_hash': 'x',
+                  'join_date': start, 'is_active': True, 'is_admin': False,
+                  'uploads_count': 0, 'downloads_count': 0} for i in range(users)]
+    db.session.execute(insert(User), user_rows)
+    user_ids = [row[0] for row in db.session.query(User.id)]
+    db.session.execute(insert(File), [{
+        'filename': f'bulk{i}.pdf',
+        'original_name': f'Bulk document {i}.pdf',
+        'filepath': f'uploads/bulk{i}.pdf',
+        'size_mb': 1.0,
+        'category': rng.choice(CATEGORIES),
+        'description': 'Synthetic benchmark file ' * 10,
+        'upload_date': start + datetime.timedelta(minutes=i),
+        'download_count': rng.randint(0, 1000),
+        'user_id': rng.choice(user_ids),
+        'is_featured': rng.random() < 0.01,
+        'tags': 'bench,bulk'
+    } for i in range(files)])
+    if tickets:  # An empty executemany would insert one default row
+        db.session.execute(insert(SupportTicket), [{
+            'title': f'Ticket {i}', 'description': 'Help', 'priority': 'medium', 'status': 'open',
+            'created_date': start + datetime.timedelta(minutes=i), 'user_id': rng.choice(user_ids)
+        } for i in range(tickets)])
+    if invitations:
+        db.session.execute(insert(Invitation), [{
+            'email': f'invitee{i}@example.com', 'invite_code': f'{i:032x}', 'invited_by': 'admin',
+            'created_at': start, 'used': False
+        } for i in range(invitations)])
+    db.session.commit()
+    return user_ids
+
+
+def time_call(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 3)
+
+
+def bench_db(args):
+    """Median latency of the filtered/sorted queries with and without the indexes"""
+    with app.app_context():
+        user_ids = seed_bulk(args.files, args.files // 5, args.files // 5)
+    client = admin_client()
+    probe_user = user_ids[len(user_ids) // 2]
+    probe_code = f'{args.files // 10:032x}'
+
+    def ticket_query():
+        with app.app_context():
+            SupportTicket.query.filter_by(user_id=probe_user).order_by(SupportTicket.created_date.desc()).all()
+
+    def invitation_query():
+        with app.app_context():
+            Invitation.query.filter_by(invite_code=probe_code, used=False).first()
+
+    def files_by_user():
+        with app.app_context():
+            File.query.filter_by(user_id=probe_user).count()
+
+    cases = {
+        '/files?category=History': lambda: client.get('/files?category=History&fields=id'),
+        '/files?featured=true': lambda: client.get('/files?featured=true&fields=id'),
+        '/files (first page)': lambda: client.get('/files?fields=id'),
+        'tickets for user': ticket_query,
+        'invitation by code': invitation_query,
+        'files for user': files_by_user,
+    }
+    with app.app_context():
+        indexes = [index for model_table in db.metadata.sorted_tables for index in model_table.indexes
+                   if index.name.startswith(('ix_file_', 'ix_support_ticket_', 'ix_invitation_'))]
+    results = {}
+    max_bytes, files_cache.max_bytes = files_cache.max_bytes, 0  # Time the queries, not the cache
+    with app.app_context():
+        for index in indexes:
+            index.drop(db.engine, checkfirst=True)
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+    for name, fn in cases.items():
+        results[name] = {'without_indexes_ms': time_call(fn, args.repeat)}
+    with app.app_context():
+        for index in indexes:
+            index.create(db.engine, checkfirst=True)
+        db.session.execute(text('ANALYZE'))
+        db.session.commit()
+    for name, fn in cases.items():
+        results[name]['with_indexes_ms'] = time_call(fn, args.repeat)
+    files_cache.max_bytes = max_bytes
+    return {'db': {'files': args.files, 'queries': results}}
+
+
+def bench_rankings(args):
+    """Trending refresh time, and top-N trending/popular lookups against sorting the table"""
+    rng = random.Random(args.seed)
+    now = datetime.datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    with app.app_context():
+        seed_bulk(args.files, 0, 0)
+        file_ids = [row[0] for row in db.session.query(File.id)]
+        hours = app.config['TRENDING_HOURLY_RETENTION']
+        db.session.execute(insert(DownloadRollup), [{
+            'file_id': file_id, 'period': 'hour', 'bucket_start': now - datetime.timedelta(hours=hour),
+            'count': rng.randint(1, 20)
+        } for file_id in rng.sample(file_ids, len(file_ids) // 5) for hour in rng.sample(range(hours * 2), 4)])
+        db.session.commit()
+    started = time.perf_counter()
+    ranked = ranking_updater.refresh()
+    refresh_ms = (time.perf_counter() - started) * 1000
+
+    client = app.test_client()
+    max_bytes, files_cache.max_bytes = files_cache.max_bytes, 0  # Time the queries, not the cache
+    cases = {
+        'trending': '/files?sort=trending&fields=id&limit=20',
+        'trending History': '/files?sort=trending&category=History&fields=id&limit=20',
+        'popular': '/files?sort=popular&fields=id&limit=20',
+        'popular History': '/files?sort=popular&category=History&fields=id&limit=20',
+    }
+    results = {name: {'indexed_ms': time_call(lambda: client.get(path), args.repeat)} for name, path in cases.items()}
+    with app.app_context():
+        plan = db.session.execute(text(
+            "EXPLAIN QUERY PLAN SELECT file.id FROM file JOIN file_ranking ON file_ranking.file_id = file.id "
+            "WHERE file_ranking.category = 'History' ORDER BY file_ranking.score DESC, file_ranking.file_id DESC "
+            "LIMIT 20"
+        )).all()
+        indexes = [index for model_table in db.metadata.sorted_tables for index in model_table.indexes
+                   if index.name.startswith(('ix_file_ranking_', 'ix_file_download_count', 'ix_file_category_download'))]
+        for index in indexes:
+            index.drop(db.engine)
+    for name, path in cases.items():
+        results[name]['full_sort_ms'] = time_call(lambda: client.get(path), args.repeat)
+    with app.app_context():
+        for index in indexes:
+            index.create(db.engine)
+    files_cache.max_bytes = max_bytes
+    sorts_in_temp = any('TEMP B-TREE' in row[-1] for row in plan)
+    return {
+        'rankings': {'files': args.files, 'ranked': ranked, 'refresh_ms': round(refresh_ms, 1), 'queries': results},
+        'failures': ['trending sorts in a temp b-tree'] if sorts_in_temp else []
+    }
+
+
+def make_pdf(size_bytes):
+    """Unique PDF-looking payload of roughly size_bytes"""
+    return b'%PDF-1.4\n' + os.urandom(max(size_bytes - 16, 0)) + b'\n%%EOF\n'
+
+
+def bench_batch(args):
+    """Upload throughput: one request per file vs /upload/batch (multipart and zip)"""
+    client = admin_client()
+    size = args.file_kb * 1024
+    results = {}
+
+    payloads = [make_pdf(size) for _ in range(args.batch_files)]
+    started = time.perf_counter()
+    ok = 0
+    for i, data in enumerate(payloads):
+        response = client.post('/upload', data={'pdf': (io.BytesIO(data), f'single{i}.pdf'), 'category': 'Science'},
+                               content_type='multipart/form-data')
+        ok += response.status_code == 200
+    results['one_per_request'] = (ok, time.perf_counter() - started)
+
+    payloads = [make_pdf(size) for _ in range(args.batch_files)]
+    started = time.perf_counter()
+    response = client.post('/upload/batch', data={
+        'pdfs': [(io.BytesIO(data), f'batch{i}.pdf') for i, data in enumerate(payloads)],
+        'category': 'Science'
+    }, content_type='multipart/form-data')
+    ok = sum(result.get('status') == 'ok' for result in response.get_json().get('results', []))
+    results['batch_multipart'] = (ok, time.perf_counter() - started)
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_STORED) as zf:
+        for i in range(args.batch_files):
+            zf.writestr(f'pack/zip{i}.pdf', make_pdf(size))
+    archive.seek(0)
+    started = time.perf_counter()
+    response = client.post('/upload/batch', data={'archive': (archive, 'pack.zip'), 'category': 'Science'},
+                           content_type='multipart/form-data')
+    ok = sum(result.get('status') == 'ok' for result in response.get_json().get('results', []))
+    results['batch_zip'] = (ok, time.perf_counter() - started)
+
+    report = {name: {'uploaded': ok, 'seconds': round(elapsed, 3),
+                     'files_per_sec': round(ok / elapsed, 1)}
+              for name, (ok, elapsed) in results.items()}
+    failures = [name for name, (ok, _) in results.items() if ok != args.batch_files]
+    return {'batch': report, 'failures': failures}
+
+
+WORDS = ('library lecture notes physics chemistry biology history philosophy '
+         'medicine theology literature algebra calculus statistics ethics').split()
+
+
+def generate_pdf(rng, pages=3, words_per_page=200):
+    """A small but valid text PDF, deterministic for a given rng state"""
+    objects = [b'<< /Type /Catalog /Pages 2 0 R >>', None,
+               b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    kids = []
+    for _ in range(pages):
+        words = ' '.join(rng.choice(WORDS) for _ in range(words_per_page))
+        lines = [words[i:i + 90] for i in range(0, len(words), 90)]
+        stream = 'BT /F1 10 Tf 50 800 Td 12 TL ' + ' '.join(f'({line}) \'' for line in lines) + ' ET'
+        objects.append(f'<< /Length {len(stream)} >>\nstream\n{stream}\nendstream'.encode())
+        objects.append(f'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+                       f'/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>'.encode())
+        kids.append(len(objects))
+    objects[1] = f'<< /Type /Pages /Kids [{" ".join(f"{k} 0 R" for k in kids)}] /Count {pages} >>'.encode()
+    out = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += f'{number} 0 obj\n'.encode() + body + b'\nendobj\n'
+    xref = len(out)
+    out += f'xref\n0 {len(objects) + 1}\n0000000000 65535 f \n'.encode()
+    out += b''.join(f'{offset:010d} 00000 n \n'.encode() for offset in offsets)
+    out += f'trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n'.encode()
+    return bytes(out)
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))], 3)
+
+
+CATALOG_QUERIES = ['/files', '/files?featured=true', '/files?search=document'] + [
+    f'/files?category={category}' for category in CATEGORIES
+]
+
+
+def bench_catalog(args):
+    """Anonymous /files load with and without the response cache, with some
+    requests toggling a featured file to force invalidations"""
+    with app.app_context():
+        seed_bulk(args.files, args.files // 5, args.files // 5)
+        file_ids = [row[0] for row in db.session.query(File.id).limit(100)]
+    admin = admin_client()
+    per_thread = args.requests // args.threads
+    max_bytes = files_cache.max_bytes
+    results = {}
+    failures = []
+    for label, cache_bytes in (('uncached', 0), ('cached', max_bytes)):
+        files_cache.max_bytes = cache_bytes
+        files_cache.clear()
+        writes = []
+
+        def worker(seed):
+            rng = random.Random(seed)
+            client = app.test_client()
+            samples = []
+            errors = 0
+            for _ in range(per_thread):
+                if rng.random() < args.write_ratio:
+                    writes.append(admin.post(f'/admin/files/featured/{rng.choice(file_ids)}').status_code)
+                    continue
+                started = time.perf_counter()
+                response = client.get(rng.choice(CATALOG_QUERIES))
+                samples.append((time.perf_counter() - started) * 1000)
+                if response.status_code != 200:
+                    errors += 1
+            return samples, errors
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as pool:
+            outcomes = list(pool.map(worker, range(args.threads)))
+        elapsed = time.perf_counter() - started
+        samples = [sample for outcome in outcomes for sample in outcome[0]]
+        errors = sum(outcome[1] for outcome in outcomes)
+        stats = files_cache.stats()
+        lookups = stats['hits'] + stats['misses']
+        results[label] = {
+            'reads': len(samples),
+            'writes': len(writes),
+            'errors': errors,
+            'requests_per_sec': round(len(samples) / elapsed, 1),
+            'p50_ms': percentile(samples, 50),
+            'p99_ms': percentile(samples, 99),
+            'hit_rate': round(stats['hits'] / lookups, 3) if lookups else None,
+            'cache_bytes': stats['bytes']
+        }
+        if errors or any(status != 200 for status in writes):
+            failures.append(label)
+    files_cache.max_bytes = max_bytes
+
+    # A cached page must reflect a write made after it was cached
+    client = app.test_client()
+    before = client.get('/files').get_json()['files'][0]
+    admin.post(f"/admin/files/featured/{before['id']}")
+    after = client.get('/files').get_json()['files'][0]
+    if after['is_featured'] == before['is_featured']:
+        failures.append('invalidation')
+    etag = client.get('/files').headers['ETag']
+    if client.get('/files', headers={'If-None-Match': etag}).status_code != 304:
+        failures.append('etag')
+    return {'catalog': results, 'failures': failures}
+
+
+def latency_summary(samples, errors, elapsed):
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'requests_per_sec': round(len(samples) / elapsed, 1) if elapsed else None,
+        'p50_ms': percentile(samples, 50),
+        'p95_ms': percentile(samples, 95),
+        'p99_ms': percentile(samples, 99)
+    }
+
+
+def endpoint_plan(file_ids, upload_payloads):
+    """(name, method, path, needs_login, body factory) for each endpoint under test"""
+    download_id = file_ids[0]
+    return [
+        ('index', 'GET', '/', False, None),
+        ('files', 'GET', '/files', False, None),
+        ('files_category', 'GET', '/files?category=Science', False, None),
+        ('files_search', 'GET', '/files?search=lecture', False, None),
+        ('files_all', 'GET', '/files?all=true&fields=id,original_name', False, None),
+        ('files_trending', 'GET', '/files?sort=trending&category=Science', False, None),
+        ('preview', 'GET', f'/preview/{download_id}', False, None),
+        ('download', 'GET', f'/download/{download_id}', True, None),
+        ('bundle', 'GET', '/download/bundle?ids=' + ','.join(str(file_id) for file_id in file_ids[:10]), True, None),
+        ('user_info', 'GET', '/user-info', True, None),
+        ('support_tickets', 'GET', '/support/tickets', True, None),
+        ('admin_users', 'GET', '/admin/users', True, None),
+        ('analytics', 'GET', '/analytics', True, None),
+        ('upload', 'POST', '/upload', True, upload_payloads),
+    ]
+
+
+def multipart_body(name, data, boundary='benchboundary'):
+    return (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="category"\r\n\r\nScience\r\n'
+        f'--{boundary}\r\nContent-Disposition: form-data; name="pdf"; filename="{name}"\r\n'
+        f'Content-Type: application/pdf\r\n\r\n'
+    ).encode() + data + f'\r\n--{boundary}--\r\n'.encode(), f'multipart/form-data; boundary={boundary}'
+
+
+def count_queries(plan, client):
+    """SQL statements for one sequential request to each endpoint, caches cleared"""
+    counts = {}
+    for name, method, path, _, payloads in plan:
+        analytics_cache.clear()
+        files_cache.clear()
+        files_cache.expire_generation()
+        principal_cache.clear()
+        with app.app_context():
+            with QueryCounter(db.engine) as counter:
+                if payloads:
+                    body, content_type = multipart_body('count.pdf', next(payloads))
+                    client.open(path, method=method, data=body, content_type=content_type)
+                else:
+                    client.open(path, method=method)
+        counts[name] = counter.count
+    return counts
+
+
+def run_with_test_client(plan, args):
+    results = {}
+    for name, method, path, needs_login, payloads in plan:
+        per_thread = max(1, args.requests // args.threads)
+
+        def worker(_):
+            client = admin_client() if needs_login else app.test_client()
+            samples, errors = [], 0
+            for _ in range(per_thread):
+                started = time.perf_counter()
+                if payloads:
+                    body, content_type = multipart_body('load.pdf', next(payloads))
+                    response = client.open(path, method=method, data=body, content_type=content_type)
+                else:
+                    response = client.open(path, method=method)
+                response.get_data()
+                samples.append((time.perf_counter() - started) * 1000)
+                if response.status_code >= 400:
+                    errors += 1
+            return samples, errors
+
+        results[name] = run_threads(worker, args.threads)
+    return results
+
+
+def run_threads(worker, threads):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        outcomes = list(pool.map(worker, range(threads)))
+    elapsed = time.perf_counter() - started
+    samples = [sample for outcome in outcomes for sample in outcome[0]]
+    return latency_summary(samples, sum(outcome[1] for outcome in outcomes), elapsed)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers, mode='wsgi', threads=1):
+    """Serve the app from WORKDIR in separate processes; returns (process, port, kind).
+
+    mode 'wsgi' runs one request per worker at a time, 'threaded' gives each
+    worker a pool of threads and 'asgi' runs asgi.py under uvicorn.
+    """
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    if mode == 'asgi':
+        kind = 'uvicorn'
+        command = [sys.executable, '-m', 'uvicorn', '--workers', str(workers), '--host', '127.0.0.1',
+                   '--port', str(port), '--log-level', 'warning', 'asgi:application']
+    else:
+        try:
+            import gunicorn  # noqa: F401
+            kind = 'gunicorn'
+            command = [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', f'127.0.0.1:{port}',
+                       '--log-level', 'warning', 'app:create_app()']
+            if mode == 'threaded':
+                kind = 'gunicorn-gthread'
+                command[3:3] = ['--worker-class', 'gthread', '--threads', str(threads)]
+        except ImportError:
+            kind = 'werkzeug'
+            command = [sys.executable, '-c',
+                       'import sys; from werkzeug.serving import run_simple; from app import create_app; '
+                       f'run_simple("127.0.0.1", {port}, create_app(), threaded=False, processes={workers})']
+            if mode == 'threaded':
+                kind = 'werkzeug-threaded'  # One process, a thread per connection
+                command[-1] = command[-1].replace(f'threaded=False, processes={workers}', 'threaded=True')
+    process = subprocess.Popen(command, cwd=WORKDIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process, port, kind
+        except OSError:
+            if process.poll() is not None:
+                break
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'{kind} server did not start')
+
+
+def http_request(port, method, path, body=None, headers=None):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        data = response.read()
+        return response.status, response.getheader('Set-Cookie'), data
+    finally:
+        connection.close()
+
+
+def run_with_server(plan, args):
+    process, port, kind = start_server(args.workers)
+    try:
+        status, cookie, _ = http_request(
+            port, 'POST', '/login', json.dumps({'username': 'admin', 'password': ADMIN_PASSWORD}),
+            {'Content-Type': 'application/json'}
+        )
+        assert status == 200, status
+        login_headers = {'Cookie': cookie.split(';', 1)[0]}
+        results = {}
+        for name, method, path, needs_login, payloads in plan:
+            per_thread = max(1, args.requests // args.threads)
+
+            def worker(_):
+                samples, errors = [], 0
+                for _ in range(per_thread):
+                    headers = dict(login_headers) if needs_login else {}
+                    body = None
+                    if payloads:
+                        body, headers['Content-Type'] = multipart_body('load.pdf', next(payloads))
+                    started = time.perf_counter()
+                    try:
+                        status, _, _ = http_request(port, method, path, body, headers)
+                    except OSError:
+                        status = 599
+                    samples.append((time.perf_counter() - started) * 1000)
+                    if status >= 400:
+                        errors += 1
+                return samples, errors
+
+            results[name] = run_threads(worker, args.threads)
+        return {'server': kind, 'workers': args.workers, 'endpoints': results}
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+class PayloadStream:
+    """Thread-safe iterator of distinct generated PDFs for upload endpoints"""
+
+    def __init__(self, rng, pages):
+        self.rng = rng
+        self.pages = pages
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self._lock:
+            return generate_pdf(self.rng, self.pages)
+
+
+def compare_reports(current, baseline, tolerance):
+    """Per-endpoint changes against a baseline run; regressions beyond tolerance are failures"""
+    changes = {}
+    failures = []
+    differing = {name: [value, current['config'].get(name)] for name, value in baseline.get('config', {}).items()
+                 if current['config'].get(name) != value}
+    if differing:
+        changes['config_differs'] = differing  # Numbers are not directly comparable
+    for driver in ('client', 'server'):
+        old = (baseline.get(driver) or {}).get('endpoints', {})
+        new = (current.get(driver) or {}).get('endpoints', {})
+        for name in sorted(set(old) & set(new)):
+            before, after = old[name], new[name]
+            change = {
+                'requests_per_sec': [before['requests_per_sec'], after['requests_per_sec']],
+                'p95_ms': [before['p95_ms'], after['p95_ms']]
+            }
+            slower = after['p95_ms'] > before['p95_ms'] * (1 + tolerance)
+            fewer = after['requests_per_sec'] < before['requests_per_sec'] * (1 - tolerance)
+            if slower or fewer:
+                failures.append(f'{driver} {name}')
+            changes[f'{driver} {name}'] = change
+    old_queries = baseline.get('queries', {})
+    for name, count in current.get('queries', {}).items():
+        if name in old_queries and count > old_queries[name]:
+            failures.append(f'queries {name}')
+            changes[f'queries {name}'] = [old_queries[name], count]
+    return changes, failures
+
+
+def bench_endpoints(args):
+    """Load test of the main endpoints through the test client and a real server"""
+    rng = random.Random(args.seed)
+    with app.app_context():
+        seed_bulk(args.files, args.files // 5, 0, users=max(args.users))
+    client = admin_client()
+    file_ids = []
+    for i in range(args.pdfs):
+        file_ids.append(upload_pdf(client, name=f'seed{i}.pdf', data=generate_pdf(rng, pages=5))[0])
+    download_counter.flush()
+
+    plan = endpoint_plan(file_ids, PayloadStream(rng, pages=3))
+    report = {
+        'config': {name: getattr(args, name) for name in
+                   ('files', 'pdfs', 'requests', 'threads', 'seed', 'server', 'workers')},
+        'queries': count_queries(plan, client),
+        'client': {'endpoints': run_with_test_client(plan, args)}
+    }
+    download_counter.flush()
+    if args.server:
+        report['server'] = run_with_server(plan, args)
+
+    failures = [f'{driver} {name}' for driver in ('client', 'server')
+                for name, result in (report.get(driver) or {}).get('endpoints', {}).items() if result['errors']]
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            report['comparison'], regressions = compare_reports(report, json.load(f), args.tolerance)
+        failures.extend(regressions)
+    report['failures'] = failures
+    return report
+
+
+def slow_download(port, path, chunk_size, delay):
+    """GET path reading chunk_size bytes every delay seconds; returns (status, bytes, seconds)"""
+    started = time.perf_counter()
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+    try:
+        connection.request('GET', path)
+        response = connection.getresponse()
+        received = 0
+        while True:
+            chunk = response.read(chunk_size)
+            if not chunk:
+                break
+            received += len(chunk)
+            time.sleep(delay)
+        return response.status, received, time.perf_counter() - started
+    finally:
+        connection.close()
+
+
+def bundle_intact(port, file_ids, expected):
+    """Log in and download file_ids as a bundle; True if every member arrives whole"""
+    try:
+        status, cookie, _ = http_request(
+            port, 'POST', '/login', json.dumps({'username': 'admin', 'password': ADMIN_PASSWORD}),
+            {'Content-Type': 'application/json'}
+        )
+        if status != 200:
+            return False
+        status, _, body = http_request(port, 'GET', '/download/bundle?ids=' + ','.join(map(str, file_ids)),
+                                       headers={'Cookie': cookie.split(';', 1)[0]})
+        if status != 200:
+            return False
+        with zipfile.ZipFile(io.BytesIO(body)) as archive:
+            return archive.testzip() is None and [archive.read(name) for name in archive.namelist()] == expected
+    except (OSError, http.client.HTTPException, zipfile.BadZipFile):
+        return False  # Includes a body cut short by a failing stream
+
+
+def bench_concurrency(args):
+    """Slow concurrent downloads against the threaded WSGI server and the ASGI app.
+
+    --clients readers each fetch a --file-kb PDF at 16 KB per --read-delay
+    seconds while a prober times /files. A server that holds a thread per
+    download stalls the probe once its threads are taken; the ASGI app should
+    keep answering. Each server then streams a bundle of a few such PDFs,
+    which must arrive intact.
+    """
+    client = admin_client()
+    file_id, data = upload_pdf(client, data=make_pdf(args.file_kb * 1024))
+    bundle = [upload_pdf(client, name=f'bundle{i}.pdf', data=make_pdf(args.file_kb * 1024)) for i in range(3)]
+    download_counter.flush()
+    path = f'/preview/{file_id}'
+    results = {}
+    failures = []
+    for mode in ('threaded', 'asgi'):
+        try:
+            process, port, kind = start_server(args.workers, mode, args.threads)
+        except RuntimeError as e:
+            results[mode] = {'error': str(e)}
+            failures.append(mode)
+            continue
+        try:
+            with ThreadPoolExecutor(args.clients) as pool:
+                started = time.perf_counter()
+                downloads = [pool.submit(slow_download, port, path, 16 * 1024, args.read_delay)
+                             for _ in range(args.clients)]
+                time.sleep(min(1.0, args.read_delay * 4))  # Let the readers connect
+                probes, probe_errors = [], 0
+                while not all(download.done() for download in downloads) and len(probes) < 200:
+                    probe_started = time.perf_counter()
+                    try:
+                        status, _, _ = http_request(port, 'GET', '/files')
+                    except OSError:
+                        status = 599
+                    probes.append((time.perf_counter() - probe_started) * 1000)
+                    if status >= 400:
+                        probe_errors += 1
+                outcomes = []
+                for download in downloads:
+                    try:
+                        outcomes.append(download.result())
+                    except OSError:
+                        outcomes.append((599, 0, None))
+                elapsed = time.perf_counter() - started
+            bundle_ok = bundle_intact(port, [file_id for file_id, _ in bundle], [data for _, data in bundle])
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+        complete = [seconds for status, received, seconds in outcomes if status == 200 and received == len(data)]
+        results[mode] = {
+            'server': kind,
+            'downloads_complete': len(complete),
+            'download_p50_s': round(statistics.median(complete), 2) if complete else None,
+            'download_max_s': round(max(complete), 2) if complete else None,
+            'elapsed_s': round(elapsed, 2),
+            'probe': latency_summary(probes, probe_errors, None) if probes else None,
+            'bundle_intact': bundle_ok
+        }
+        if len(complete) != args.clients or not bundle_ok:
+            failures.append(mode)
+    return {
+        'config': {name: getattr(args, name) for name in ('clients', 'file_kb', 'read_delay', 'workers', 'threads')},
+        'concurrency': results,
+        'failures': failures
+    }
+
+
+STARTUP_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+response = app.app.test_client().get('/files')
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (served - created) * 1000,
+    'status': response.status_code,
+    'deferred_modules': [name for name in ('flask_mail', 'multiprocessing') if name in sys.modules]
+}))
+"""
+
+
+def bench_startup(args):
+    """Cold-start cost of a worker process: import, create_app() and first request"""
+    with app.app_context():
+        started = time.perf_counter()
+        init_db()  # Already run at import; timed here as a re-run on an initialized database
+        init_db_ms = (time.perf_counter() - started) * 1000
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    runs = []
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', STARTUP_PROBE], cwd=WORKDIR, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        process_ms = (time.perf_counter() - started) * 1000
+        runs.append(dict(json.loads(output.strip().splitlines()[-1]), process_ms=process_ms))
+    summary = {
+        name: round(statistics.median(run[name] for run in runs), 1)
+        for name in ('import_ms', 'create_app_ms', 'first_request_ms', 'process_ms')
+    }
+    failures = []
+    if any(run['status'] != 200 for run in runs):
+        failures.append('first_request')
+    if any(run['deferred_modules'] for run in runs):
+        failures.append('deferred_imports')
+    return {
+        'startup': dict(summary, runs=len(runs), init_db_rerun_ms=round(init_db_ms, 1),
+                        loaded_early=sorted({name for run in runs for name in run['deferred_modules']})),
+        'failures': failures
+    }
+
+
+def cache_bytes(folder):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(folder) for name in names)
+
+
+def bench_storage(args):
+    """Uploads to S3-compatible storage and downloads through a cold, then warm, node cache"""
+    endpoint_url = os.environ.get('S3_ENDPOINT_URL')
+    bucket = os.environ.get('S3_BUCKET', 'edulibrary-bench')
+    if endpoint_url:
+        mock = contextlib.nullcontext()
+    else:
+        from moto import mock_aws
+        os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+        os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+        mock = mock_aws()
+    size = args.file_kb * 1024
+    cache_max = size * max(args.pdfs // 2, 1)  # Half the files fit on the second node
+    local_store = app.extensions['file_store']
+    failures = []
+    with mock:
+        def node(name):
+            return storage.S3Storage(bucket, os.path.join(WORKDIR, name), cache_max, prefix='bench',
+                                     endpoint_url=endpoint_url, region='us-east-1')
+
+        uploader = node('cache-a')
+        if not endpoint_url:
+            uploader.client.create_bucket(Bucket=bucket)
+        app.extensions['file_store'] = uploader
+        try:
+            client = admin_client()
+            uploads = {}
+            started = time.perf_counter()
+            for i in range(args.pdfs):
+                file_id, data = upload_pdf(client, name=f'stored{i}.pdf', data=make_pdf(size))
+                uploads[file_id] = data
+            upload_s = time.perf_counter() - started
+            with app.app_context():
+                keys = [record.filename for record in File.query.filter(File.id.in_(uploads))]
+            if not all(uploader._remote_exists(key) for key in keys):
+                failures.append('upload not in bucket')
+
+            reader = node('cache-b')  # Another node: nothing cached yet
+            app.extensions['file_store'] = reader
+            timings = {'miss': [], 'hit': []}
+            for kind in ('miss', 'hit'):
+                for file_id, data in list(uploads.items())[:cache_max // size]:
+                    started = time.perf_counter()
+                    response = client.get(f'/download/{file_id}')
+                    timings[kind].append((time.perf_counter() - started) * 1000)
+                    if response.status_code != 200 or response.data != data:
+                        failures.append(f'{kind} /download/{file_id}')
+            file_id, data = next(iter(uploads.items()))
+            response = client.get(f'/download/{file_id}', headers={'Range': 'bytes=100-199'})
+            if response.status_code != 206 or response.data != data[100:200]:
+                failures.append('range request')
+            for file_id in uploads:  # Overflows the cache
+                client.get(f'/download/{file_id}')
+            used = cache_bytes(reader.root)
+            if used > cache_max:
+                failures.append('cache over budget')
+
+            doomed = next(iter(uploads))
+            with app.app_context():
+                doomed_key = db.session.get(File, doomed).filename
+            if client.delete(f'/delete/{doomed}').status_code != 200 or reader._remote_exists(doomed_key):
+                failures.append('delete left the object behind')
+        finally:
+            app.extensions['file_store'] = local_store
+    return {
+        'storage': {
+            'backend': endpoint_url or 'moto',
+            'files': args.pdfs,
+            'file_kb': args.file_kb,
+            'upload_ms_per_file': round(upload_s * 1000 / args.pdfs, 1),
+            'miss_p50_ms': round(statistics.median(timings['miss']), 2),
+            'hit_p50_ms': round(statistics.median(timings['hit']), 2),
+            'cache_max_bytes': cache_max,
+            'cache_bytes': used,
+        },
+        'failures': failures
+    }
+
+
+def follow_pages(client, path, key):
+    """Walk a cursor-paginated listing; returns (item ids, pages, first page ms)"""
+    ids, pages, first_ms, cursor = [], 0, None, None
+    while True:
+        started = time.perf_counter()
+        response = client.get(path + (f'&cursor={cursor}' if cursor else ''))
+        if first_ms is None:
+            first_ms = (time.perf_counter() - started) * 1000
+        data = response.get_json()
+        ids.extend(item['id'] for item in data[key])
+        pages += 1
+        cursor = data['next_cursor']
+        if not cursor:
+            return ids, pages, round(first_ms, 2)
+
+
+def bench_admin(args):
+    """Paginated admin listings, constant-memory exports and bulk updates"""
+    users = max(args.files // 5, 10)
+    with app.app_context():
+        seed_bulk(users, args.files, 0, users=users)  # Every bulk user joined at the same instant
+        reconcile_stats()  # The bulk seed skips the counter events
+        user_count = User.query.count()
+        open_tickets = SupportTicket.query.filter_by(status='open').count()
+        engine = db.engine
+    client = admin_client()
+    failures = []
+    report = {'users': user_count, 'tickets': args.files}
+
+    user_ids, pages, first_ms = follow_pages(client, '/admin/users?limit=200', 'users')
+    report['users_pages'] = {'pages': pages, 'first_page_ms': first_ms}
+    if sorted(user_ids) != sorted(set(user_ids)) or len(user_ids) != user_count:
+        failures.append('admin_users pagination')
+    ticket_ids, pages, first_ms = follow_pages(client, '/support/tickets?status=open&limit=200', 'tickets')
+    report['tickets_pages'] = {'pages': pages, 'first_page_ms': first_ms}
+    if len(set(ticket_ids)) != open_tickets:
+        failures.append('support_tickets pagination')
+
+    for export_format in ('ndjson', 'csv'):
+        tracemalloc.start()
+        started = time.perf_counter()
+        with QueryCounter(engine) as counter:
+            response = client.get(f'/admin/export/tickets?format={export_format}', buffered=False)
+            size = lines = 0
+            first_peak = None
+            for chunk in response.response:
+                size += len(chunk)
+                lines += chunk.count(b'\n')
+                first_peak = first_peak or tracemalloc.get_traced_memory()[1]
+            response.close()
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        report[f'export_{export_format}'] = {'bytes': size, 'ms': round(elapsed * 1000, 1),
+                                             'statements': counter.count, 'peak_kb': peak // 1024,
+                                             'first_batch_peak_kb': first_peak // 1024}
+        if lines != args.files + (export_format == 'csv'):
+            failures.append(f'{export_format} export rows')
+        if peak > 2 * first_peak:  # Later batches must not add to what the first one needed
+            failures.append(f'{export_format} export memory')
+
+    targets = [user_id for user_id in user_ids if user_id != 1][:500]
+    with QueryCounter(engine) as counter:
+        started = time.perf_counter()
+        response = client.post('/admin/users/status', json={'ids': targets + [1], 'is_active': False})
+        bulk_ms = (time.perf_counter() - started) * 1000
+    body = response.get_json()
+    report['bulk_deactivate'] = {'ids': len(targets), 'ms': round(bulk_ms, 1), 'statements': counter.count}
+    if response.status_code != 200 or len(body['updated']) != len(targets) or body['skipped'] != [1]:
+        failures.append('bulk user status')
+    started = time.perf_counter()
+    for user_id in targets[:50]:
+        client.post(f'/admin/users/{user_id}/toggle-status')
+    report['toggle_ms_per_user'] = round((time.perf_counter() - started) * 1000 / 50, 2)
+    response = client.post('/admin/tickets/status', json={'ids': ticket_ids[:500], 'status': 'resolved'})
+    if response.status_code != 200 or len(response.get_json()['updated']) != min(500, len(ticket_ids)):
+        failures.append('bulk ticket status')
+    with app.app_context():
+        drift = reconcile_stats()
+    if drift:
+        failures.append(f'counters drifted: {sorted(drift)}')
+    return {'admin': report, 'failures': failures}
+
+
+SCENARIOS = {
+    'queries': bench_queries,
+    'serving': bench_serving,
+    'counters': bench_counters,
+    'email': bench_email,
+    'db': bench_db,
+    'batch': bench_batch,
+    'catalog': bench_catalog,
+    'endpoints': bench_endpoints,
+    'concurrency': bench_concurrency,
+    'startup': bench_startup,
+    'rankings': bench_rankings,
+    'storage': bench_storage,
+    'admin': bench_admin,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('scenario', choices=sorted(SCENARIOS))
+    parser.add_argument('--users', type=int, nargs='+', default=[10, 100],
+                        help='seed sizes to compare (queries scenario)')
+    parser.add_argument('--files', type=int, default=50000, help='files to seed (db, catalog and rankings scenarios), tickets (admin)')
+    parser.add_argument('--repeat', type=int, default=20, help='samples per query (db scenario), processes (startup)')
+    parser.add_argument('--batch-files', type=int, default=200, help='files per batch (batch scenario)')
+    parser.add_argument('--file-kb', type=int, default=256, help='size of each file (batch and storage scenarios)')
+    parser.add_argument('--invites', type=int, default=200, help='invitations to send (email scenario)')
+    parser.add_argument('--requests', type=int, default=2000, help='total requests (counters and catalog scenarios)')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='concurrent clients (counters and catalog scenarios), threads per worker (concurrency)')
+    parser.add_argument('--write-ratio', type=float, default=0.01,
+                        help='share of requests that change a file (catalog scenario)')
+    parser.add_argument('--pdfs', type=int, default=20, help='generated PDFs to upload (endpoints and storage scenarios)')
+    parser.add_argument('--seed', type=int, default=42, help='random seed for generated data (endpoints scenario)')
+    parser.add_argument('--server', action='store_true', help='also load a real WSGI server (endpoints scenario)')
+    parser.add_argument('--workers', type=int, default=4, help='server worker processes (endpoints scenario)')
+    parser.add_argument('--output', help='also write the report to this file (endpoints scenario)')
+    parser.add_argument('--compare', help='earlier --output report to compare against (endpoints scenario)')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed p95/throughput regression when comparing (endpoints scenario)')
+    parser.add_argument('--clients', type=int, default=200, help='slow concurrent downloads (concurrency scenario)')
+    parser.add_argument('--read-delay', type=float, default=0.05,
+                        help='seconds between 16 KB reads per download (concurrency scenario)')
+    args = parser.parse_args()
+
+    report = SCENARIOS[args.scenario](args)
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return 1 if report.get('failures') else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
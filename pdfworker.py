@@ -0,0 +1,109 @@
+"""PDF parsing and rendering for the background processing pool.
+
+Functions here run in worker processes, so this module deliberately imports
+nothing from app.py: workers start quickly and never repeat the app's
+database setup. PyMuPDF (`fitz`) is optional; without it text extraction
+returns '' and process_pdf() raises. optimize_pdf() needs pikepdf.
+"""
+import os
+
+
+def extract_text(filepath, max_pages):
+    """Plain text of the first max_pages pages, or '' if it can't be read"""
+    try:
+        import fitz
+    except ImportError:
+        return ''
+    try:
+        with fitz.open(filepath) as doc:
+            if doc.needs_pass:
+                return ''
+            return '\n'.join(doc[i].get_text() for i in range(min(doc.page_count, max_pages)))
+    except Exception:
+        return ''
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        f.write(data)
+    os.replace(temp_path, path)
+
+
+def process_pdf(filepath, thumbnails, max_pages):
+    """Extract metadata and text and render first-page thumbnails.
+
+    `thumbnails` maps a size name to (width in pixels, output path); images
+    that already exist are reused, since paths are keyed by content hash.
+    Returns a dict with page_count, title, author, text and the names of the
+    thumbnails that are available.
+    """
+    import fitz
+
+    with fitz.open(filepath) as doc:
+        metadata = doc.metadata or {}
+        result = {
+            'page_count': doc.page_count,
+            'title': (metadata.get('title') or '').strip() or None,
+            'author': (metadata.get('author') or '').strip() or None,
+            'text': '',
+            'thumbnails': []
+        }
+        if doc.needs_pass or not doc.page_count:
+            return result
+
+        result['text'] = '\n'.join(doc[i].get_text() for i in range(min(doc.page_count, max_pages)))
+
+        page = doc[0]
+        for name, (width, path) in thumbnails.items():
+            if not os.path.exists(path):
+                zoom = width / page.rect.width
+                pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+                _write_atomic(path, pixmap.tobytes('png'))
+            result['thumbnails'].append(name)
+    return result
+
+
+def optimize_pdf(filepath, output_path, image_dpi=0, min_saving=0.0):
+    """Write a recompressed, linearized copy of filepath to output_path.
+
+    Streams are recompressed losslessly and packed into object streams with
+    pikepdf. With image_dpi > 0, images above 1.5x that resolution are first
+    downsampled to it with PyMuPDF, which is lossy. The copy is kept only if
+    it is at least min_saving (a fraction) smaller than the original, and an
+    existing copy is never replaced. Returns a dict with original_size,
+    optimized_size and whether the copy was kept.
+    """
+    import pikepdf
+
+    original_size = os.path.getsize(filepath)
+    if os.path.exists(output_path):
+        return {'original_size': original_size, 'optimized_size': os.path.getsize(output_path), 'kept': True}
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    temp_path = f'{output_path}.{os.getpid()}.tmp'
+    images_path = f'{output_path}.{os.getpid()}.images.tmp'
+    try:
+        source = filepath
+        if image_dpi:
+            import fitz
+            with fitz.open(filepath) as doc:
+                doc.rewrite_images(dpi_threshold=image_dpi * 3 // 2, dpi_target=image_dpi)
+                doc.save(images_path, garbage=3, deflate=True)
+            source = images_path
+        with pikepdf.open(source) as pdf:
+            pdf.remove_unreferenced_resources()
+            pdf.save(temp_path, compress_streams=True, recompress_flate=True,
+                     object_stream_mode=pikepdf.ObjectStreamMode.generate, linearize=True)
+        optimized_size = os.path.getsize(temp_path)
+        kept = optimized_size < original_size * (1 - min_saving)
+        if kept:
+            try:
+                os.link(temp_path, output_path)  # Fails rather than replacing a copy being served
+            except FileExistsError:
+                optimized_size = os.path.getsize(output_path)
+        return {'original_size': original_size, 'optimized_size': optimized_size, 'kept': kept}
+    finally:
+        for path in (temp_path, images_path):
+            if os.path.exists(path):
+                os.remove(path)
@@ -2,6 +2,8 @@
 // Global variables
 let currentUser = null;
 let allFiles = [];
+let filesPager = null;
+let searchPager = null;
 let categories = [];
 let currentCategory = 'all';
 let currentTheme = localStorage.getItem('theme') || 'light';
@@ -237,40 +239,48 @@ async function handleSupportTicket(e) {
   }
 }
 
-// Load support tickets
+function supportTicketCard(ticket) {
+  return `
+    <div class="ticket-card">
+      <div class="ticket-header">
+        <h4>${ticket.title}</h4>
+        <div>
+          <span class="ticket-status ${ticket.status}">${ticket.status}</span>
+          <span class="ticket-priority ${ticket.priority}">${ticket.priority}</span>
+        </div>
+      </div>
+      <p>${ticket.description}</p>
+      <div class="ticket-meta">
+        Created: ${formatDate(ticket.created_date)}
+        ${ticket.resolved_date ? `• Resolved: ${formatDate(ticket.resolved_date)}` : ''}
+      </div>
+      ${ticket.admin_response ? `
+        <div style="margin-top: 1rem; padding: 1rem; background: var(--surface-elevated); border-radius: 8px;">
+          <strong>Admin Response:</strong><br>
+          ${ticket.admin_response}
+        </div>
+      ` : ''}
+    </div>
+  `;
+}
+
+// Load the first page of support tickets; later pages are fetched on demand
 async function loadSupportTickets() {
   try {
-    const response = await fetch('/support/tickets');
-    const data = await response.json();
+    const pager = createPager('/support/tickets', 'tickets');
+    const tickets = await pager.next();
     
     const container = document.getElementById('supportTickets');
-    if (data.tickets.length === 0) {
+    if (tickets.length === 0) {
       container.innerHTML = '<p>No support tickets yet.</p>';
+      updateLoadMore(container, null);
       return;
     }
     
-    container.innerHTML = data.tickets.map(ticket => `
-      <div class="ticket-card">
-        <div class="ticket-header">
-          <h4>${ticket.title}</h4>
-          <div>
-            <span class="ticket-status ${ticket.status}">${ticket.status}</span>
-            <span class="ticket-priority ${ticket.priority}">${ticket.priority}</span>
-          </div>
-        </div>
-        <p>${ticket.description}</p>
-        <div class="ticket-meta">
-          Created: ${formatDate(ticket.created_date)}
-          ${ticket.resolved_date ? `• Resolved: ${formatDate(ticket.resolved_date)}` : ''}
-        </div>
-        ${ticket.admin_response ? `
-          <div style="margin-top: 1rem; padding: 1rem; background: var(--surface-elevated); border-radius: 8px;">
-            <strong>Admin Response:</strong><br>
-            ${ticket.admin_response}
-          </div>
-        ` : ''}
-      </div>
-    `).join('');
+    const render = more => container.insertAdjacentHTML('beforeend', more.map(supportTicketCard).join(''));
+    container.innerHTML = '';
+    render(tickets);
+    updateLoadMore(container, pager, render);
   } catch (error) {
     console.error('Failed to load support tickets:', error);
   }
@@ -429,13 +439,60 @@ function switchSection(sectionName) {
   }
 }
 
-// Load files
+// A cursor-paginated listing read one page at a time: next() fetches the
+// following page and returns its `key` items, `data` is the last response
+// and `done` turns true once the server sends no next_cursor
+function createPager(url, key, params = {}) {
+  const pager = { data: null, cursor: null, done: false };
+  pager.next = async () => {
+    if (pager.done) return [];
+    const query = new URLSearchParams(params);
+    if (pager.cursor) query.set('cursor', pager.cursor);
+    const response = await fetch(`${url}?${query}`);
+    const data = await response.json();
+    if (!response.ok) throw new Error(data.error || `HTTP ${response.status}`);
+    pager.data = data;
+    pager.cursor = data.next_cursor;
+    pager.done = !pager.cursor;
+    return data[key] || [];
+  };
+  return pager;
+}
+
+// Show a "Load more" button after `container` while `pager` has pages left;
+// each click fetches the next page and hands its items to render()
+function updateLoadMore(container, pager, render) {
+  let button = document.getElementById(`${container.id}More`);
+  if (!button) {
+    button = document.createElement('button');
+    button.id = `${container.id}More`;
+    button.className = 'btn btn-secondary load-more';
+    button.textContent = 'Load more';
+    container.after(button);
+  }
+  button.style.display = pager && !pager.done ? '' : 'none';
+  button.onclick = async () => {
+    button.disabled = true;
+    try {
+      render(await pager.next());
+    } catch (error) {
+      console.error('Failed to load more:', error);
+    } finally {
+      button.disabled = false;
+      button.style.display = pager.done ? 'none' : '';
+    }
+  };
+}
+
+// Load the first page of files; later pages are fetched on demand
 async function loadFiles() {
   try {
-    const response = await fetch('/files');
-    const data = await response.json();
-    allFiles = data.files || [];
-    categories = data.categories || [];
+    const params = currentCategory === 'all' ? {} : { category: currentCategory };
+    const pager = filesPager = createPager('/files', 'files', params);
+    const files = await pager.next();
+    if (pager !== filesPager) return;  // Superseded by a newer load
+    allFiles = files;
+    categories = pager.data.categories || categories;
     
     updateCategoryFilters();
     populateCategorySelect();
@@ -472,18 +529,19 @@ function populateCategorySelect() {
   });
 }
 
-// Filter by category
-function filterByCategory(category) {
+// Filter by category (on the server, so paging stays within the category)
+async function filterByCategory(category) {
   currentCategory = category;
+  await loadFiles();
   document.querySelectorAll('.category-btn').forEach(btn => btn.classList.remove('active'));
   document.querySelector(`[data-category="${category}"]`).classList.add('active');
-  renderFiles();
 }
 
 // Render files
 function renderFiles(filesToRender = null) {
   const container = filesToRender ? searchResults : fileGrid;
-  const files = filesToRender || (currentCategory === 'all' ? allFiles : allFiles.filter(f => f.category === currentCategory));
+  const files = filesToRender || allFiles;
+  const pager = filesToRender ? searchPager : filesPager;
   
   container.innerHTML = '';
   
@@ -495,6 +553,7 @@ function renderFiles(filesToRender = null) {
         <p>${filesToRender ? 'Try a different search term' : 'Upload some PDFs to get started!'}</p>
       </div>
     `;
+    updateLoadMore(container, null);
     return;
   }
   
@@ -502,6 +561,10 @@ function renderFiles(filesToRender = null) {
     const card = createFileCard(file);
     container.appendChild(card);
   });
+  updateLoadMore(container, pager, more => {
+    files.push(...more);
+    more.forEach(file => container.appendChild(createFileCard(file)));
+  });
 }
 
 // Create file card
@@ -511,7 +574,9 @@ function createFileCard(file) {
   
   card.innerHTML = `
     <div class="file-header">
-      <div class="file-icon">PDF</div>
+      ${file.thumbnail
+        ? `<img class="file-thumbnail" src="${file.thumbnail}?size=small" alt="" loading="lazy">`
+        : '<div class="file-icon">PDF</div>'}
       <div class="file-info">
         <h3 title="${file.filename}">
           ${file.original_name}
@@ -537,6 +602,69 @@ function createFileCard(file) {
   return card;
 }
 
+// Files above this size are sent in chunks through /uploads
+const MAX_SINGLE_UPLOAD_BYTES = 20 * 1024 * 1024;
+// Batch requests stay well under the server's MAX_BATCH_FILES and
+// MAX_BATCH_UPLOAD_LENGTH, so large selections go in several requests
+const BATCH_MAX_FILES = 50;
+const BATCH_MAX_BYTES = 100 * 1024 * 1024;
+
+// Split files into groups bounded by BATCH_MAX_FILES and BATCH_MAX_BYTES
+function batchGroups(files) {
+  const groups = [];
+  let group = [];
+  let groupBytes = 0;
+  for (const file of files) {
+    if (group.length && (group.length >= BATCH_MAX_FILES || groupBytes + file.size > BATCH_MAX_BYTES)) {
+      groups.push(group);
+      group = [];
+      groupBytes = 0;
+    }
+    group.push(file);
+    groupBytes += file.size;
+  }
+  if (group.length) groups.push(group);
+  return groups;
+}
+
+// Upload one file with the resumable protocol, retrying failed chunks from
+// the server's last confirmed offset
+async function uploadResumable(file, category, description, tags) {
+  const start = await fetch('/uploads', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ filename: file.name, size: file.size, category, description, tags })
+  });
+  if (!start.ok) return false;
+  const upload = await start.json();
+  let offset = upload.offset;
+  let retries = 0;
+  
+  while (offset < file.size) {
+    try {
+      const response = await fetch(`/uploads/${upload.upload_id}`, {
+        method: 'PUT',
+        headers: { 'Upload-Offset': String(offset) },
+        body: file.slice(offset, offset + upload.chunk_size)
+      });
+      const data = await response.json();
+      if (!response.ok && response.status !== 409) throw new Error(data.error);
+      offset = data.offset;
+      retries = 0;
+    } catch (error) {
+      if (++retries > 5) return false;
+      await new Promise(resolve => setTimeout(resolve, 1000 * retries));
+      const status = await fetch(`/uploads/${upload.upload_id}`);
+      if (!status.ok) return false;
+      offset = (await status.json()).offset;
+    }
+    progressFill.style.width = `${(offset / file.size) * 100}%`;
+  }
+  
+  const done = await fetch(`/uploads/${upload.upload_id}/complete`, { method: 'POST' });
+  return done.ok;
+}
+
 // Handle upload
 async function handleUpload(e) {
   e.preventDefault();
@@ -555,34 +683,45 @@ async function handleUpload(e) {
   
   try {
     let successCount = 0;
-    let errorCount = 0;
     
-    for (let i = 0; i < files.length; i++) {
-      const file = files[i];
+    // Small files go to the batch endpoint a group at a time; files over
+    // the single-request limit use the resumable chunked protocol
+    const smallFiles = Array.from(files).filter(file => file.size <= MAX_SINGLE_UPLOAD_BYTES);
+    const largeFiles = Array.from(files).filter(file => file.size > MAX_SINGLE_UPLOAD_BYTES);
+    const groups = batchGroups(smallFiles);
+    
+    for (const [i, group] of groups.entries()) {
       const formData = new FormData();
-      formData.append('pdf', file);
+      for (const file of group) {
+        formData.append('pdfs', file);
+      }
       formData.append('category', category);
       formData.append('description', description);
       formData.append('tags', tags);
       
-      const progress = ((i + 1) / files.length) * 100;
-      progressFill.style.width = `${progress}%`;
-      
       try {
-        const response = await fetch('/upload', {
+        const response = await fetch('/upload/batch', {
           method: 'POST',
           body: formData
         });
-        
-        if (response.ok) {
+        const data = await response.json();
+        successCount += (data.results || []).filter(result => result.status === 'ok').length;
+      } catch (error) {
+        // Failed files are simply not counted as successes
+      }
+      if (!largeFiles.length) progressFill.style.width = `${((i + 1) / groups.length) * 100}%`;
+    }
+    
+    for (const file of largeFiles) {
+      try {
+        if (await uploadResumable(file, category, description, tags)) {
           successCount++;
-        } else {
-          errorCount++;
         }
       } catch (error) {
-        errorCount++;
+        // Failed files are simply not counted as successes
       }
     }
+    progressFill.style.width = '100%';
     
     if (successCount > 0) {
       showStatus(`Successfully uploaded ${successCount} file(s).`, 'success', 'uploadStatus');
@@ -603,9 +742,11 @@ async function handleUpload(e) {
   }
 }
 
-// Handle search
+// Handle search: matched on the server a page at a time, once typing pauses
+let searchTimer = null;
 function handleSearch(e) {
-  const query = e.target.value.trim().toLowerCase();
+  const query = e.target.value.trim();
+  clearTimeout(searchTimer);
   
   if (!query) {
     searchResults.innerHTML = `
@@ -615,18 +756,19 @@ function handleSearch(e) {
         <p>Enter keywords to search through the library</p>
       </div>
     `;
+    updateLoadMore(searchResults, null);
     return;
   }
   
-  const filtered = allFiles.filter(file => 
-    file.original_name.toLowerCase().includes(query) ||
-    file.category.toLowerCase().includes(query) ||
-    file.description.toLowerCase().includes(query) ||
-    file.uploaded_by.toLowerCase().includes(query) ||
-    (file.tags && file.tags.some(tag => tag.toLowerCase().includes(query)))
-  );
-  
-  renderFiles(filtered);
+  searchTimer = setTimeout(async () => {
+    try {
+      const pager = searchPager = createPager('/files', 'files', { search: query });
+      const results = await pager.next();
+      if (pager === searchPager) renderFiles(results);
+    } catch (error) {
+      console.error('Search failed:', error);
+    }
+  }, 250);
 }
 
 // File actions
@@ -697,31 +839,38 @@ async function loadAdminData() {
   loadAdminUsers();
 }
 
+function userCard(user) {
+  return `
+    <div class="user-card">
+      <div class="user-info">
+        <h4>${user.username} ${user.is_admin ? '👑' : ''}</h4>
+        <div class="user-meta">
+          ${user.email} • Joined: ${formatDate(user.join_date)}<br>
+          Uploads: ${user.uploads_count} • Downloads: ${user.downloads_count}
+        </div>
+      </div>
+      <div class="user-actions">
+        ${!user.is_admin ? `
+          <button class="btn ${user.is_active ? 'btn-warning' : 'btn-secondary'}" 
+                  onclick="toggleUserStatus(${user.id})">
+            ${user.is_active ? 'Deactivate' : 'Activate'}
+          </button>
+        ` : '<span>Admin User</span>'}
+      </div>
+    </div>
+  `;
+}
+
 async function loadAdminUsers() {
   try {
-    const response = await fetch('/admin/users');
-    const data = await response.json();
+    const pager = createPager('/admin/users', 'users');
+    const users = await pager.next();
     
     const container = document.getElementById('usersList');
-    container.innerHTML = data.users.map(user => `
-      <div class="user-card">
-        <div class="user-info">
-          <h4>${user.username} ${user.is_admin ? '👑' : ''}</h4>
-          <div class="user-meta">
-            ${user.email} • Joined: ${formatDate(user.join_date)}<br>
-            Uploads: ${user.uploads_count} • Downloads: ${user.downloads_count}
-          </div>
-        </div>
-        <div class="user-actions">
-          ${!user.is_admin ? `
-            <button class="btn ${user.is_active ? 'btn-warning' : 'btn-secondary'}" 
-                    onclick="toggleUserStatus(${user.id})">
-              ${user.is_active ? 'Deactivate' : 'Activate'}
-            </button>
-          ` : '<span>Admin User</span>'}
-        </div>
-      </div>
-    `).join('');
+    const render = more => container.insertAdjacentHTML('beforeend', more.map(userCard).join(''));
+    container.innerHTML = '';
+    render(users);
+    updateLoadMore(container, pager, render);
   } catch (error) {
     console.error('Failed to load users:', error);
   }
@@ -744,30 +893,39 @@ async function toggleUserStatus(userId) {
   }
 }
 
+function adminFileCard(file) {
+  return `
+    <div class="admin-file-card">
+      <div class="file-info">
+        <h4>${file.original_name} ${file.is_featured ? '⭐' : ''}</h4>
+        <div class="file-meta">
+          ${file.category} • ${file.size_mb}MB • ${file.download_count} downloads<br>
+          Uploaded by: ${file.uploaded_by}
+        </div>
+      </div>
+      <div class="file-actions">
+        <button class="btn ${file.is_featured ? 'btn-warning' : 'btn-secondary'}" 
+                onclick="toggleFeatured(${file.id})">
+          ${file.is_featured ? 'Unfeature' : 'Feature'}
+        </button>
+        <button class="btn btn-danger" onclick="deleteFile(${file.id})">Delete</button>
+      </div>
+    </div>
+  `;
+}
+
 async function loadAdminFiles() {
   try {
-    const response = await fetch('/files');
-    const data = await response.json();
+    const pager = createPager('/files', 'files', {
+      fields: 'id,original_name,is_featured,category,size_mb,download_count,uploaded_by'
+    });
+    const files = await pager.next();
     
     const container = document.getElementById('adminFilesList');
-    container.innerHTML = data.files.map(file => `
-      <div class="admin-file-card">
-        <div class="file-info">
-          <h4>${file.original_name} ${file.is_featured ? '⭐' : ''}</h4>
-          <div class="file-meta">
-            ${file.category} • ${file.size_mb}MB • ${file.download_count} downloads<br>
-            Uploaded by: ${file.uploaded_by}
-          </div>
-        </div>
-        <div class="file-actions">
-          <button class="btn ${file.is_featured ? 'btn-warning' : 'btn-secondary'}" 
-                  onclick="toggleFeatured(${file.id})">
-            ${file.is_featured ? 'Unfeature' : 'Feature'}
-          </button>
-          <button class="btn btn-danger" onclick="deleteFile(${file.id})">Delete</button>
-        </div>
-      </div>
-    `).join('');
+    const render = more => container.insertAdjacentHTML('beforeend', more.map(adminFileCard).join(''));
+    container.innerHTML = '';
+    render(files);
+    updateLoadMore(container, pager, render);
   } catch (error) {
     console.error('Failed to load files:', error);
   }
@@ -791,43 +949,50 @@ async function toggleFeatured(fileId) {
   }
 }
 
+function adminTicketCard(ticket) {
+  return `
+    <div class="ticket-card">
+      <div class="ticket-header">
+        <h4>${ticket.title}</h4>
+        <div>
+          <span class="ticket-status ${ticket.status}">${ticket.status}</span>
+          <span class="ticket-priority ${ticket.priority}">${ticket.priority}</span>
+        </div>
+      </div>
+      <p><strong>User:</strong> ${ticket.user}</p>
+      <p>${ticket.description}</p>
+      <div class="ticket-meta">
+        Created: ${formatDate(ticket.created_date)}
+      </div>
+      ${ticket.status !== 'resolved' ? `
+        <div style="margin-top: 1rem;">
+          <textarea id="response-${ticket.id}" placeholder="Admin response..." rows="3" style="width: 100%; margin-bottom: 0.5rem;"></textarea>
+          <div style="display: flex; gap: 8px;">
+            <button class="btn btn-secondary" onclick="respondToTicket(${ticket.id}, 'in-progress')">Mark In Progress</button>
+            <button class="btn" onclick="respondToTicket(${ticket.id}, 'resolved')">Resolve</button>
+          </div>
+        </div>
+      ` : ''}
+      ${ticket.admin_response ? `
+        <div style="margin-top: 1rem; padding: 1rem; background: var(--surface-elevated); border-radius: 8px;">
+          <strong>Admin Response:</strong><br>
+          ${ticket.admin_response}
+        </div>
+      ` : ''}
+    </div>
+  `;
+}
+
 async function loadAdminSupport() {
   try {
-    const response = await fetch('/support/tickets');
-    const data = await response.json();
+    const pager = createPager('/support/tickets', 'tickets');
+    const tickets = await pager.next();
     
     const container = document.getElementById('adminTicketsList');
-    container.innerHTML = data.tickets.map(ticket => `
-      <div class="ticket-card">
-        <div class="ticket-header">
-          <h4>${ticket.title}</h4>
-          <div>
-            <span class="ticket-status ${ticket.status}">${ticket.status}</span>
-            <span class="ticket-priority ${ticket.priority}">${ticket.priority}</span>
-          </div>
-        </div>
-        <p><strong>User:</strong> ${ticket.user}</p>
-        <p>${ticket.description}</p>
-        <div class="ticket-meta">
-          Created: ${formatDate(ticket.created_date)}
-        </div>
-        ${ticket.status !== 'resolved' ? `
-          <div style="margin-top: 1rem;">
-            <textarea id="response-${ticket.id}" placeholder="Admin response..." rows="3" style="width: 100%; margin-bottom: 0.5rem;"></textarea>
-            <div style="display: flex; gap: 8px;">
-              <button class="btn btn-secondary" onclick="respondToTicket(${ticket.id}, 'in-progress')">Mark In Progress</button>
-              <button class="btn" onclick="respondToTicket(${ticket.id}, 'resolved')">Resolve</button>
-            </div>
-          </div>
-        ` : ''}
-        ${ticket.admin_response ? `
-          <div style="margin-top: 1rem; padding: 1rem; background: var(--surface-elevated); border-radius: 8px;">
-            <strong>Admin Response:</strong><br>
-            ${ticket.admin_response}
-          </div>
-        ` : ''}
-      </div>
-    `).join('');
+    const render = more => container.insertAdjacentHTML('beforeend', more.map(adminTicketCard).join(''));
+    container.innerHTML = '';
+    render(tickets);
+    updateLoadMore(container, pager, render);
   } catch (error) {
     console.error('Failed to load tickets:', error);
   }
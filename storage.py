@@ -0,0 +1,235 @@
+"""Where stored bytes live: PDFs, their optimized copies and thumbnails.
+
+Objects are addressed by key, a '/'-separated path relative to the upload
+folder (e.g. blobs/ab/<digest>.pdf). Every backend also exposes a local
+folder laid out by key, so the rest of the app keeps working with plain
+file paths (ranges, X-Sendfile, PyMuPDF): LocalStorage is that folder, and
+S3Storage keeps a bounded read-through cache of the objects this node has
+touched. Like pdfworker, this module imports nothing from app.py; boto3 is
+only needed for S3Storage.
+"""
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+
+class LocalStorage:
+    """Objects are files under `root`; suitable for a single node"""
+
+    def __init__(self, root):
+        self.root = root
+
+    def path_for(self, key):
+        """Local path where `key` lives (or is staged before store())"""
+        return os.path.join(self.root, *key.split('/'))
+
+    def fetch(self, key):
+        """Local path holding `key`'s bytes, or None if there is no such object"""
+        path = self.path_for(key)
+        return path if os.path.isfile(path) else None
+
+    def exists(self, key):
+        return os.path.isfile(self.path_for(key))
+
+    def store(self, path, key):
+        """Publish the file at `path` as `key`, taking ownership of the file.
+
+        Returns the local path of the stored copy.
+        """
+        target = self.path_for(key)
+        if os.path.abspath(path) != os.path.abspath(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+        return target
+
+    def delete(self, key):
+        try:
+            os.remove(self.path_for(key))
+        except FileNotFoundError:
+            pass
+
+
+class DiskCache:
+    """Size-bounded folder of local copies, evicted least recently used first.
+
+    Recency is the file's mtime, bumped on hits at most once per
+    `touch_interval` seconds, so the cache survives restarts and is shared
+    by every worker process pointed at the same folder. The byte total is
+    tracked per process and rescanned from disk when eviction runs.
+    """
+
+    def __init__(self, root, max_bytes, touch_interval=60):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.touch_interval = touch_interval
+        self._lock = threading.Lock()
+        self._total = None
+
+    def touch(self, path):
+        try:
+            if time.time() - os.stat(path).st_mtime > self.touch_interval:
+                os.utime(path)
+        except OSError:
+            pass
+
+    def added(self, size):
+        """Account for a new entry of `size` bytes, evicting if over budget"""
+        with self._lock:
+            if self._total is None:
+                self._total = sum(size for _, size, _ in self._entries())
+            else:
+                self._total += size
+            if self._total > self.max_bytes:
+                self._evict()
+
+    def discarded(self, size):
+        with self._lock:
+            if self._total is not None:
+                self._total = max(0, self._total - size)
+
+    def _entries(self):
+        for folder, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith('.part'):
+                    continue  # Download in progress
+                path = os.path.join(folder, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        # Down to 90% of the budget, so eviction doesn't run on every miss.
+        # Unlinking a file that is being streamed is safe: readers keep
+        # their open handle.
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * 0.9
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+        self._total = total
+
+
+class S3Storage:
+    """Objects in an S3-compatible bucket, read through a local DiskCache.
+
+    Misses are downloaded whole into the cache (streamed to a temp file,
+    never held in memory) before they are served; stored objects are
+    uploaded with multipart transfers and kept in the cache. Keys are
+    written once, so cached copies never go stale.
+    """
+
+    def __init__(self, bucket, cache_folder, cache_max_bytes, prefix='', endpoint_url=None, region=None,
+                 missing_ttl=60):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.client = boto3.client('s3', endpoint_url=endpoint_url, region_name=region)
+        self.transfer_config = TransferConfig(multipart_threshold=16 * 1024 * 1024, max_concurrency=4)
+        self.cache = DiskCache(cache_folder, cache_max_bytes)
+        self.root = cache_folder
+        # Striped so concurrent misses on one key download it once per process
+        self._key_locks = [threading.Lock() for _ in range(64)]
+        # Keys found missing recently (e.g. blobs with no optimized copy), so
+        # each request for them doesn't cost a round trip
+        self.missing_ttl = missing_ttl
+        self._missing = {}
+
+    def _object_key(self, key):
+        return self.prefix + key
+
+    def _is_missing(self, error):
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def path_for(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def fetch(self, key):
+        path = self.path_for(key)
+        if os.path.isfile(path):
+            self.cache.touch(path)
+            return path
+        if self._missing.get(key, 0) > time.monotonic():
+            return None
+        from botocore.exceptions import ClientError
+
+        with self._key_locks[zlib.crc32(key.encode()) % len(self._key_locks)]:
+            if os.path.isfile(path):
+                return path
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(suffix='.part', dir=os.path.dirname(path))
+            try:
+                with os.fdopen(fd, 'wb') as out:
+                    self.client.download_fileobj(self.bucket, self._object_key(key), out,
+                                                 Config=self.transfer_config)
+                os.replace(temp_path, path)
+            except ClientError as e:
+                os.remove(temp_path)
+                if self._is_missing(e):
+                    if len(self._missing) >= 10000:
+                        self._missing.clear()
+                    self._missing[key] = time.monotonic() + self.missing_ttl
+                    return None
+                raise
+            except BaseException:
+                os.remove(temp_path)
+                raise
+        self.cache.added(os.path.getsize(path))
+        return path
+
+    def exists(self, key):
+        return os.path.isfile(self.path_for(key)) or self._remote_exists(key)
+
+    def _remote_exists(self, key):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except ClientError as e:
+            if self._is_missing(e):
+                return False
+            raise
+        return True
+
+    def store(self, path, key):
+        # Keys are written once with the same bytes (content hashes, or
+        # renders of them), so an object that is already there is kept
+        if not self._remote_exists(key):
+            self.client.upload_file(path, self.bucket, self._object_key(key), Config=self.transfer_config,
+                                    ExtraArgs={'ContentType': _content_type(key)})
+        target = self.path_for(key)
+        if os.path.abspath(path) != os.path.abspath(target):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+        self._missing.pop(key, None)
+        self.cache.added(os.path.getsize(target))
+        return target
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        path = self.path_for(key)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        self.cache.discarded(size)
+
+
+def _content_type(key):
+    if key.endswith('.png'):
+        return 'image/png'
+    if key.endswith('.pdf'):
+        return 'application/pdf'
+    return 'application/octet-stream'